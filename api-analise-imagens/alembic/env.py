@@ -19,6 +19,7 @@ from app.models.plantas.endereco import PlantaEndereco
 from app.models.plantas.configuracao import PlantaConfiguracao
 from app.models.plantas.categoria import PlantaCategoria
 from app.models.analise_fotos.resultado import AnaliseFotoResultado
+from app.models.analise_fotos.imagem_hash import ImagemHash
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
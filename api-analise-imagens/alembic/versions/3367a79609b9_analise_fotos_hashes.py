@@ -0,0 +1,52 @@
+"""Índice de hashes perceptuais para quase-duplicatas
+
+Revision ID: 3367a79609b9
+Revises: e34c77254353
+Create Date: 2026-10-18 10:02:17.534910
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3367a79609b9'
+down_revision: Union[str, None] = 'e34c77254353'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+def upgrade() -> None:
+    op.create_table('analise_fotos_hashes',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('processamento_id', sa.UUID(), nullable=False),
+    sa.Column('loja_id', sa.String(length=100), nullable=True),
+    sa.Column('dhash', sa.BigInteger(), nullable=False),
+    sa.Column('banda_0', sa.Integer(), nullable=False),
+    sa.Column('banda_1', sa.Integer(), nullable=False),
+    sa.Column('banda_2', sa.Integer(), nullable=False),
+    sa.Column('banda_3', sa.Integer(), nullable=False),
+    sa.Column('duplicata_de', sa.UUID(), nullable=True),
+    sa.Column('distancia', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['processamento_id'], ['processamentos.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_analise_fotos_hashes_processamento_id'), 'analise_fotos_hashes', ['processamento_id'], unique=False)
+    op.create_index(op.f('ix_analise_fotos_hashes_loja_id'), 'analise_fotos_hashes', ['loja_id'], unique=False)
+    op.create_index(op.f('ix_analise_fotos_hashes_banda_0'), 'analise_fotos_hashes', ['banda_0'], unique=False)
+    op.create_index(op.f('ix_analise_fotos_hashes_banda_1'), 'analise_fotos_hashes', ['banda_1'], unique=False)
+    op.create_index(op.f('ix_analise_fotos_hashes_banda_2'), 'analise_fotos_hashes', ['banda_2'], unique=False)
+    op.create_index(op.f('ix_analise_fotos_hashes_banda_3'), 'analise_fotos_hashes', ['banda_3'], unique=False)
+    op.create_index(op.f('ix_analise_fotos_hashes_created_at'), 'analise_fotos_hashes', ['created_at'], unique=False)
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_analise_fotos_hashes_created_at'), table_name='analise_fotos_hashes')
+    op.drop_index(op.f('ix_analise_fotos_hashes_banda_3'), table_name='analise_fotos_hashes')
+    op.drop_index(op.f('ix_analise_fotos_hashes_banda_2'), table_name='analise_fotos_hashes')
+    op.drop_index(op.f('ix_analise_fotos_hashes_banda_1'), table_name='analise_fotos_hashes')
+    op.drop_index(op.f('ix_analise_fotos_hashes_banda_0'), table_name='analise_fotos_hashes')
+    op.drop_index(op.f('ix_analise_fotos_hashes_loja_id'), table_name='analise_fotos_hashes')
+    op.drop_index(op.f('ix_analise_fotos_hashes_processamento_id'), table_name='analise_fotos_hashes')
+    op.drop_table('analise_fotos_hashes')
@@ -0,0 +1,27 @@
+"""Índice (lote_id, updated_at, id) para status de lote
+
+Revision ID: 4f90c3a1d8e2
+Revises: b7e24f9d0c13
+Create Date: 2026-10-18 13:27:52.661043
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4f90c3a1d8e2'
+down_revision: Union[str, None] = 'b7e24f9d0c13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+def upgrade() -> None:
+    # O índice composto cobre as buscas só por lote_id (prefixo), então o simples sai
+    op.create_index('ix_processamentos_lote_updated_at_id', 'processamentos', ['lote_id', 'updated_at', 'id'], unique=False)
+    op.drop_index('ix_processamentos_lote_id', table_name='processamentos')
+
+def downgrade() -> None:
+    op.create_index('ix_processamentos_lote_id', 'processamentos', ['lote_id'], unique=False)
+    op.drop_index('ix_processamentos_lote_updated_at_id', table_name='processamentos')
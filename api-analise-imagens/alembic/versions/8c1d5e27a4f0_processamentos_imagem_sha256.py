@@ -0,0 +1,26 @@
+"""SHA-256 da imagem em processamentos (storage endereçado por conteúdo)
+
+Revision ID: 8c1d5e27a4f0
+Revises: 3367a79609b9
+Create Date: 2026-10-18 11:20:41.108337
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c1d5e27a4f0'
+down_revision: Union[str, None] = '3367a79609b9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+def upgrade() -> None:
+    op.add_column('processamentos', sa.Column('imagem_sha256', sa.String(length=64), nullable=True))
+    op.create_index(op.f('ix_processamentos_imagem_sha256'), 'processamentos', ['imagem_sha256'], unique=False)
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_processamentos_imagem_sha256'), table_name='processamentos')
+    op.drop_column('processamentos', 'imagem_sha256')
@@ -0,0 +1,26 @@
+"""Lote de submissão em processamentos
+
+Revision ID: b7e24f9d0c13
+Revises: 8c1d5e27a4f0
+Create Date: 2026-10-18 12:41:05.220914
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e24f9d0c13'
+down_revision: Union[str, None] = '8c1d5e27a4f0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+def upgrade() -> None:
+    op.add_column('processamentos', sa.Column('lote_id', sa.UUID(), nullable=True))
+    op.create_index(op.f('ix_processamentos_lote_id'), 'processamentos', ['lote_id'], unique=False)
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_processamentos_lote_id'), table_name='processamentos')
+    op.drop_column('processamentos', 'lote_id')
@@ -0,0 +1,53 @@
+"""resultado/meta_dados em JSONB com índices GIN e de expressão
+
+Revision ID: c5a9e3f71b28
+Revises: 4f90c3a1d8e2
+Create Date: 2026-10-18 15:02:11.318274
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5a9e3f71b28'
+down_revision: Union[str, None] = '4f90c3a1d8e2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# As expressões precisam ser idênticas às de app/models/processamento.py para o planner usar os índices
+INDICES_EXPRESSAO = {
+    'ix_processamentos_auditoria_status': "((resultado -> 'auditoria') ->> 'status')",
+    'ix_processamentos_auditoria_nota': "(CAST((resultado -> 'auditoria') ->> 'nota' AS FLOAT))",
+    'ix_processamentos_auditoria_tipo_ativo': "((resultado -> 'auditoria') ->> 'tipo_ativo')",
+    'ix_processamentos_auditoria_marca': "(lower((resultado -> 'auditoria') ->> 'marca'))",
+    'ix_processamentos_meta_nome_ativo': "(lower(meta_dados ->> 'nome_ativo'))",
+}
+
+def upgrade() -> None:
+    # Reescreve a tabela (lock exclusivo durante a conversão): rodar em janela de manutenção
+    op.alter_column('processamentos', 'resultado', type_=postgresql.JSONB(), existing_type=sa.JSON(),
+                    existing_nullable=True, postgresql_using='resultado::jsonb')
+    op.alter_column('processamentos', 'meta_dados', type_=postgresql.JSONB(), existing_type=sa.JSON(),
+                    existing_nullable=True, postgresql_using='meta_dados::jsonb')
+
+    for nome, expressao in INDICES_EXPRESSAO.items():
+        op.execute(f"CREATE INDEX {nome} ON processamentos ({expressao})")
+    op.create_index('ix_processamentos_resultado_gin', 'processamentos', ['resultado'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'resultado': 'jsonb_path_ops'})
+    op.create_index('ix_processamentos_meta_dados_gin', 'processamentos', ['meta_dados'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'meta_dados': 'jsonb_path_ops'})
+
+def downgrade() -> None:
+    op.drop_index('ix_processamentos_meta_dados_gin', table_name='processamentos')
+    op.drop_index('ix_processamentos_resultado_gin', table_name='processamentos')
+    for nome in INDICES_EXPRESSAO:
+        op.drop_index(nome, table_name='processamentos')
+
+    op.alter_column('processamentos', 'meta_dados', type_=sa.JSON(), existing_type=postgresql.JSONB(),
+                    existing_nullable=True, postgresql_using='meta_dados::json')
+    op.alter_column('processamentos', 'resultado', type_=sa.JSON(), existing_type=postgresql.JSONB(),
+                    existing_nullable=True, postgresql_using='resultado::json')
@@ -0,0 +1,34 @@
+"""Índices composto (tipo, loja_id, status) e parcial de PROCESSANDO
+
+Revision ID: d81f4b6c2e95
+Revises: c5a9e3f71b28
+Create Date: 2026-10-18 15:41:36.904417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd81f4b6c2e95'
+down_revision: Union[str, None] = 'c5a9e3f71b28'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+def upgrade() -> None:
+    op.create_index('ix_processamentos_tipo_loja_status_created_at', 'processamentos',
+                    ['tipo', 'loja_id', 'status', 'created_at', 'id'], unique=False)
+    op.create_index('ix_processamentos_processando_created_at', 'processamentos', ['created_at'], unique=False,
+                    postgresql_where=sa.text("status = 'PROCESSANDO'"))
+    # tipo (2 valores) e status (3 valores) sozinhos quase nunca são escolhidos pelo planner
+    # e custam escrita a cada mudança de status; os índices acima cobrem esses filtros
+    op.drop_index(op.f('ix_processamentos_tipo'), table_name='processamentos')
+    op.drop_index(op.f('ix_processamentos_status'), table_name='processamentos')
+
+def downgrade() -> None:
+    op.create_index(op.f('ix_processamentos_status'), 'processamentos', ['status'], unique=False)
+    op.create_index(op.f('ix_processamentos_tipo'), 'processamentos', ['tipo'], unique=False)
+    op.drop_index('ix_processamentos_processando_created_at', table_name='processamentos')
+    op.drop_index('ix_processamentos_tipo_loja_status_created_at', table_name='processamentos')
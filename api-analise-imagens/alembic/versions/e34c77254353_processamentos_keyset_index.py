@@ -0,0 +1,28 @@
+"""Índice keyset (created_at, id) em processamentos
+
+Revision ID: e34c77254353
+Revises: 3649bb636e7f
+Create Date: 2026-10-18 09:12:40.118203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e34c77254353'
+down_revision: Union[str, None] = '3649bb636e7f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+def upgrade() -> None:
+    # Paginação keyset ordena por (created_at, id); o índice composto também atende
+    # filtros só por created_at, então o índice simples fica redundante
+    op.create_index('ix_processamentos_created_at_id', 'processamentos', ['created_at', 'id'], unique=False)
+    op.drop_index(op.f('ix_processamentos_created_at'), table_name='processamentos')
+
+def downgrade() -> None:
+    op.create_index(op.f('ix_processamentos_created_at'), 'processamentos', ['created_at'], unique=False)
+    op.drop_index('ix_processamentos_created_at_id', table_name='processamentos')
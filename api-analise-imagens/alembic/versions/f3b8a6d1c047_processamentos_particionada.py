@@ -0,0 +1,143 @@
+"""processamentos particionada por mês em created_at
+
+Revision ID: f3b8a6d1c047
+Revises: d81f4b6c2e95
+Create Date: 2026-10-18 16:27:53.118406
+
+"""
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3b8a6d1c047'
+down_revision: Union[str, None] = 'd81f4b6c2e95'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PARTICOES_FUTURAS = 3  # Mesmo padrão de settings.PARTICOES_FUTURAS; o beat mantém daí em diante
+
+# Tabelas com FK para processamentos.id: FKs para tabela particionada exigiriam a PK inteira (id, created_at)
+REFERENCIAS = {
+    'analise_fotos_resultados': 'analise_fotos_resultados_processamento_id_fkey',
+    'analise_fotos_hashes': 'analise_fotos_hashes_processamento_id_fkey',
+    'plantas_enderecos': 'plantas_enderecos_processamento_id_fkey',
+}
+
+# Idênticas a app/models/processamento.py e c5a9e3f71b28
+INDICES_EXPRESSAO = {
+    'ix_processamentos_auditoria_status': "((resultado -> 'auditoria') ->> 'status')",
+    'ix_processamentos_auditoria_nota': "(CAST((resultado -> 'auditoria') ->> 'nota' AS FLOAT))",
+    'ix_processamentos_auditoria_tipo_ativo': "((resultado -> 'auditoria') ->> 'tipo_ativo')",
+    'ix_processamentos_auditoria_marca': "(lower((resultado -> 'auditoria') ->> 'marca'))",
+    'ix_processamentos_meta_nome_ativo': "(lower(meta_dados ->> 'nome_ativo'))",
+}
+
+SQL_RENOMEAR_INDICES = """
+DO $$
+DECLARE r record;
+BEGIN
+    FOR r IN
+        SELECT i.relname AS nome
+        FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid
+        WHERE x.indrelid = '{tabela}'::regclass
+    LOOP
+        EXECUTE format('ALTER INDEX %I RENAME TO %I', r.nome, r.nome || '{sufixo}');
+    END LOOP;
+END $$
+"""
+
+
+def _inicio_mes_seguinte(momento: datetime) -> datetime:
+    return datetime(momento.year + momento.month // 12, momento.month % 12 + 1, 1)
+
+
+def _criar_indices(tabela: str) -> None:
+    op.create_index(op.f('ix_processamentos_loja_id'), tabela, ['loja_id'], unique=False)
+    op.create_index(op.f('ix_processamentos_imagem_sha256'), tabela, ['imagem_sha256'], unique=False)
+    op.create_index('ix_processamentos_created_at_id', tabela, ['created_at', 'id'], unique=False)
+    op.create_index('ix_processamentos_lote_updated_at_id', tabela, ['lote_id', 'updated_at', 'id'], unique=False)
+    op.create_index('ix_processamentos_tipo_loja_status_created_at', tabela,
+                    ['tipo', 'loja_id', 'status', 'created_at', 'id'], unique=False)
+    op.create_index('ix_processamentos_processando_created_at', tabela, ['created_at'], unique=False,
+                    postgresql_where=sa.text("status = 'PROCESSANDO'"))
+    for nome, expressao in INDICES_EXPRESSAO.items():
+        op.execute(f"CREATE INDEX {nome} ON {tabela} ({expressao})")
+    op.create_index('ix_processamentos_resultado_gin', tabela, ['resultado'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'resultado': 'jsonb_path_ops'})
+    op.create_index('ix_processamentos_meta_dados_gin', tabela, ['meta_dados'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'meta_dados': 'jsonb_path_ops'})
+
+def upgrade() -> None:
+    # Lock exclusivo em processamentos durante toda a migration: rodar em janela de manutenção.
+    # Os dados existentes não são copiados: a tabela atual vira a primeira partição.
+    op.execute("UPDATE processamentos SET created_at = COALESCE(updated_at, now() AT TIME ZONE 'utc') WHERE created_at IS NULL")
+    op.alter_column('processamentos', 'created_at', existing_type=sa.DateTime(), nullable=False)
+    for tabela, fk in REFERENCIAS.items():
+        op.drop_constraint(fk, tabela, type_='foreignkey')
+
+    op.rename_table('processamentos', 'processamentos_legado')
+    op.execute(SQL_RENOMEAR_INDICES.format(tabela='processamentos_legado', sufixo='_legado'))
+    op.drop_constraint('processamentos_pkey_legado', 'processamentos_legado', type_='primary')
+    op.create_primary_key('processamentos_legado_pkey', 'processamentos_legado', ['id', 'created_at'])
+
+    op.create_table('processamentos',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('tipo', postgresql.ENUM('PLANTAS', 'ANALISE_FOTOS', name='tipoprocessamento', create_type=False), nullable=False),
+    sa.Column('loja_id', sa.String(length=100), nullable=True),
+    sa.Column('nome_arquivo', sa.String(length=255), nullable=False),
+    sa.Column('imagem_url', sa.Text(), nullable=False),
+    sa.Column('status', postgresql.ENUM('PROCESSANDO', 'CONCLUIDO', 'ERRO', name='statusprocessamento', create_type=False), nullable=True),
+    sa.Column('resultado', postgresql.JSONB(), nullable=True),
+    sa.Column('erro_mensagem', sa.Text(), nullable=True),
+    sa.Column('tempo_processamento_ms', sa.Integer(), nullable=True),
+    sa.Column('meta_dados', postgresql.JSONB(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('imagem_sha256', sa.String(length=64), nullable=True),
+    sa.Column('lote_id', sa.UUID(), nullable=True),
+    sa.PrimaryKeyConstraint('id', 'created_at'),
+    postgresql_partition_by='RANGE (created_at)'
+    )
+    # Na tabela particionada só criam a definição; o ATTACH reaproveita os índices equivalentes da partição
+    _criar_indices('processamentos')
+
+    # A tabela antiga cobre tudo até o fim do mês corrente (ou do maior created_at, se no futuro).
+    # O CHECK validado antes do ATTACH evita a varredura sob o lock exclusivo
+    maximo = op.get_bind().execute(sa.text("SELECT max(created_at) FROM processamentos_legado")).scalar()
+    limite = _inicio_mes_seguinte(max(filter(None, [maximo, datetime.utcnow()])))
+    op.execute(f"ALTER TABLE processamentos_legado ADD CONSTRAINT processamentos_legado_faixa "
+               f"CHECK (created_at < '{limite.isoformat()}') NOT VALID")
+    op.execute("ALTER TABLE processamentos_legado VALIDATE CONSTRAINT processamentos_legado_faixa")
+    op.execute(f"ALTER TABLE processamentos ATTACH PARTITION processamentos_legado "
+               f"FOR VALUES FROM (MINVALUE) TO ('{limite.isoformat()}')")
+    op.drop_constraint('processamentos_legado_faixa', 'processamentos_legado', type_='check')
+
+    inicio = limite
+    for _ in range(PARTICOES_FUTURAS):
+        fim = _inicio_mes_seguinte(inicio)
+        op.execute(f"CREATE TABLE processamentos_p{inicio:%Y_%m} PARTITION OF processamentos "
+                   f"FOR VALUES FROM ('{inicio.isoformat()}') TO ('{fim.isoformat()}')")
+        inicio = fim
+    # Rede de segurança se o beat parar: inserts além das partições criadas não falham
+    op.execute("CREATE TABLE processamentos_padrao PARTITION OF processamentos DEFAULT")
+
+def downgrade() -> None:
+    # Copia as linhas ainda presentes de volta para uma tabela comum; partições já
+    # arquivadas (e removidas) não voltam
+    op.rename_table('processamentos', 'processamentos_particionada')
+    op.execute("CREATE TABLE processamentos (LIKE processamentos_particionada INCLUDING DEFAULTS)")
+    op.execute("INSERT INTO processamentos SELECT * FROM processamentos_particionada")
+    op.drop_table('processamentos_particionada')
+
+    op.create_primary_key('processamentos_pkey', 'processamentos', ['id'])
+    op.alter_column('processamentos', 'created_at', existing_type=sa.DateTime(), nullable=True)
+    _criar_indices('processamentos')
+    # NOT VALID: filhos de processamentos arquivados não têm mais a linha referenciada
+    for tabela, fk in REFERENCIAS.items():
+        op.execute(f"ALTER TABLE {tabela} ADD CONSTRAINT {fk} FOREIGN KEY (processamento_id) "
+                   f"REFERENCES processamentos (id) NOT VALID")
@@ -0,0 +1,36 @@
+import hashlib
+import os
+from functools import lru_cache
+from app.config import settings
+from app.services.result_cache import CacheResultados
+
+PROMPT_PATH = os.path.join(os.path.dirname(__file__), "prompts", "auditoria_pdv.txt")
+
+cache_auditoria = CacheResultados(
+    namespace="auditoria_pdv",
+    ttl_segundos=settings.CACHE_AUDITORIA_TTL_SEGUNDOS,
+    max_itens=settings.CACHE_AUDITORIA_MAX_ITENS,
+    max_itens_l1=settings.CACHE_AUDITORIA_MAX_ITENS_L1,
+)
+
+# Resultado do LLM por processamento, gravado antes do join do upload: o retry de uma
+# falha no storage reaproveita a auditoria em vez de pagar o LLM de novo
+auditorias_pendentes = CacheResultados(
+    namespace="auditoria_pdv_pendente",
+    ttl_segundos=settings.AUDITORIA_PENDENTE_TTL_SEGUNDOS,
+    max_itens=settings.CACHE_AUDITORIA_MAX_ITENS,
+    max_itens_l1=settings.CACHE_AUDITORIA_MAX_ITENS_L1,
+)
+
+
+@lru_cache(maxsize=1)
+def versao_prompt() -> str:
+    """Hash do prompt de auditoria — editar o prompt invalida o cache automaticamente."""
+    with open(PROMPT_PATH, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+
+def chave_cache_auditoria(imagem_sha256: str, modelo_llm: str, nome_ativo: str | None) -> str:
+    """Chave content-addressed: mesmos bytes + modelo + ativo + prompt => mesmo resultado."""
+    componentes = "|".join([imagem_sha256, modelo_llm, nome_ativo or "", versao_prompt()])
+    return hashlib.sha256(componentes.encode("utf-8")).hexdigest()
@@ -0,0 +1,83 @@
+from typing import Optional
+from sqlalchemy import cast, func, or_
+from sqlalchemy.dialects.postgresql import BIT
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.core.logging import logger
+from app.models.analise_fotos.imagem_hash import ImagemHash
+from app.models.processamento import Processamento, StatusProcessamento, condicoes_por_id
+from app.services.perceptual_hash import bandas, calcular_dhash, para_bigint
+
+
+def calcular_dhash_seguro(processamento_id: str, imagem_bytes: bytes) -> Optional[int]:
+    """dHash da imagem, ou None se o Pillow não conseguir decodificá-la (não bloqueia a auditoria)."""
+    try:
+        return calcular_dhash(imagem_bytes)
+    except Exception as e:
+        logger.warning(f"[{processamento_id}] Falha ao calcular dHash: {e}")
+        return None
+
+
+def buscar_quase_duplicata(db: Session, dhash: int) -> Optional[dict]:
+    """
+    Procura a imagem já auditada mais próxima do dHash informado.
+
+    Candidatos vêm do lookup por bandas (igualdade indexada); a distância de Hamming
+    (popcount do XOR) é filtrada e ordenada no próprio banco, então nenhum candidato
+    dentro do limiar fica de fora, por mais comum que seja a banda.
+
+    Returns:
+        {"processamento_id": str, "distancia": int} ou None
+    """
+    bs = bandas(dhash)
+    distancia = func.bit_count(cast(ImagemHash.dhash.op("#")(para_bigint(dhash)), BIT(64)))
+    encontrado = (
+        db.query(ImagemHash.processamento_id, distancia.label("distancia"))
+        .filter(or_(
+            ImagemHash.banda_0 == bs[0],
+            ImagemHash.banda_1 == bs[1],
+            ImagemHash.banda_2 == bs[2],
+            ImagemHash.banda_3 == bs[3],
+        ))
+        .filter(distancia <= settings.DUPLICATA_DISTANCIA_MAXIMA)
+        .order_by(distancia, ImagemHash.created_at.desc())
+        .first()
+    )
+    if encontrado is None:
+        return None
+    return {"processamento_id": str(encontrado.processamento_id), "distancia": int(encontrado.distancia)}
+
+
+def obter_auditoria_reutilizavel(db: Session, processamento_id: str, modelo_llm: str, nome_ativo: Optional[str]) -> Optional[dict]:
+    """
+    Retorna auditoria e imagem de um processamento concluído com os mesmos parâmetros,
+    ou None se o resultado não puder ser reaproveitado.
+    """
+    processamento = db.query(Processamento).filter(*condicoes_por_id(processamento_id)).first()
+    if not processamento or processamento.status != StatusProcessamento.CONCLUIDO or not processamento.resultado:
+        return None
+
+    meta = processamento.meta_dados or {}
+    if processamento.resultado.get("modelo_llm_usado") != modelo_llm or meta.get("nome_ativo") != nome_ativo:
+        return None
+
+    auditoria = processamento.resultado.get("auditoria")
+    if not auditoria:
+        return None
+    return {"auditoria": auditoria, "imagem_url": processamento.imagem_url, "derivados": meta.get("derivados")}
+
+
+def registrar_hash(db: Session, processamento_id: str, loja_id: Optional[str], dhash: int, duplicata: Optional[dict]) -> None:
+    """Adiciona o hash ao índice na sessão corrente (commit fica a cargo do chamador)."""
+    bs = bandas(dhash)
+    db.add(ImagemHash(
+        processamento_id=processamento_id,
+        loja_id=loja_id,
+        dhash=para_bigint(dhash),
+        banda_0=bs[0],
+        banda_1=bs[1],
+        banda_2=bs[2],
+        banda_3=bs[3],
+        duplicata_de=duplicata["processamento_id"] if duplicata else None,
+        distancia=duplicata["distancia"] if duplicata else None,
+    ))
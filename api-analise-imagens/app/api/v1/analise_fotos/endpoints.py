@@ -1,21 +1,72 @@
 import uuid
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from app.core.database import get_db
-from app.core.auth import verificar_api_key
+from datetime import datetime, timedelta
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, insert, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.database import get_async_db
+from app.core.auth import cobrar_itens, verificar_api_key
 from app.core.logging import logger
+from app.services.webhook_destinos import DestinoWebhookInvalido, validar_callback_url
+from app.api.v1.shared.cursores import codificar_cursor, decodificar_cursor
+from app.api.v1.shared.processamentos import ESPERA_MAXIMA_SEGUNDOS, carregar_aguardando
 from app.api.v1.analise_fotos.schemas import (
+    AuditarPDVLoteRequest,
+    AuditarPDVLoteResponse,
     AuditarPDVRequest,
     AuditarPDVResponse,
+    DuplicatasLojaResponse,
+    ItemLoteStatus,
+    LoteStatusResponse,
     ProcessamentoAuditoriaPDVResponse
 )
-from app.api.v1.analise_fotos.tasks import processar_auditoria_pdv_task
-from app.models.processamento import Processamento, TipoProcessamento, StatusProcessamento
+from app.models.analise_fotos.imagem_hash import ImagemHash
+from app.core.task_signatures import assinatura_auditoria_pdv, publicar_lote
+from app.models.processamento import (
+    AUDITORIA_NOTA,
+    AUDITORIA_STATUS,
+    Processamento,
+    StatusProcessamento,
+    TipoProcessamento,
+    condicoes_por_id,
+    janela_do_id,
+    novo_id,
+)
+from app.services.image_derivatives import url_derivado
+from app.services.storage_urls import url_publica
 
 router = APIRouter()
 
     # Removed the /processar endpoint to only keep /auditar-pdv
 
+MODELO_AUDITORIA = "gpt-4o-mini"
+LIMITE_ITENS_STATUS_LOTE = 1000
+# Recuo do cursor na última página: cobre transações que gravaram updated_at antes do
+# cursor mas só commitaram depois (e diferença de relógio entre API e workers)
+MARGEM_CURSOR_LOTE = timedelta(seconds=5)
+
+
+def _verificar_callbacks(requests: List[AuditarPDVRequest]) -> None:
+    """Recusa callback_url sem assinatura possível ou em endereço interno antes de gravar qualquer coisa."""
+    try:
+        for callback_url in {str(r.callback_url) for r in requests if r.callback_url}:
+            validar_callback_url(callback_url)
+    except DestinoWebhookInvalido as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+def _meta_auditoria(request: AuditarPDVRequest) -> dict:
+    meta = {
+        "tipo_analise": "auditoria_pdv",
+        "modelo_llm": MODELO_AUDITORIA,
+    }
+    if request.nome_ativo:
+        meta["nome_ativo"] = request.nome_ativo
+    if request.callback_url:
+        meta["callback_url"] = str(request.callback_url)
+    return meta
+
 
 @router.post(
     "/auditar-pdv",
@@ -31,7 +82,7 @@ router = APIRouter()
 )
 async def auditar_pdv(
     request: AuditarPDVRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     api_key = Depends(verificar_api_key)
 ):
     """
@@ -43,45 +94,38 @@ async def auditar_pdv(
     3. Enfileira task assíncrona
     4. Retorna processamento_id
     """
+    _verificar_callbacks([request])
 
     # Criar registro no banco
-    processamento_id = uuid.uuid4()
-    # Safely building metadata
-    meta = {
-        "tipo_analise": "auditoria_pdv",
-        "modelo_llm": "gpt-4o-mini",
-    }
-    if request.nome_ativo:
-        meta["nome_ativo"] = request.nome_ativo
-        
+    processamento_id = novo_id()
     processamento = Processamento(
         id=processamento_id,
         tipo=TipoProcessamento.ANALISE_FOTOS,
-        loja_id=None,
+        loja_id=request.loja_id,
         nome_arquivo=str(request.imagem_url).split("/")[-1],
         imagem_url=str(request.imagem_url),
         status=StatusProcessamento.PROCESSANDO,
-        meta_dados=meta
+        meta_dados=_meta_auditoria(request)
     )
     db.add(processamento)
-    db.commit()
+    await db.commit()
 
     # Enfileirar task — se o broker estiver com conexão stale, captura aqui
     try:
-        processar_auditoria_pdv_task.apply_async(
-            args=[
+        await run_in_threadpool(
+            assinatura_auditoria_pdv(
                 str(processamento_id),
                 str(request.imagem_url),
-                "gpt-4o-mini",
-                request.nome_ativo
-            ],
-            queue='analise_fotos'
+                MODELO_AUDITORIA,
+                request.nome_ativo,
+                request.ignorar_cache
+            ).apply_async
         )
     except Exception as e:
         logger.error(f"Falha ao enfileirar task para processamento {processamento_id}: {e}")
         processamento.status = StatusProcessamento.ERRO
         processamento.erro_mensagem = f"Falha ao enfileirar task: {str(e)}"
-        db.commit()
+        await db.commit()
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail="Serviço de processamento temporariamente indisponível. Tente novamente em instantes."
@@ -95,21 +139,209 @@ async def auditar_pdv(
         tempo_estimado_segundos=15
     )
 
+@router.post(
+    "/auditar-pdv/lote",
+    response_model=AuditarPDVLoteResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Auditar Lote de Fotos de PDV"
+)
+async def auditar_pdv_lote(
+    request: AuditarPDVLoteRequest,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    api_key = Depends(verificar_api_key)
+):
+    """
+    Submete várias fotos de uma vez (ex.: visita completa a uma loja).
+
+    Os registros são gravados com um único INSERT em lote e as tasks publicadas em
+    sequência sobre um único producer/conexão com o broker. Cada item recebe seu
+    processamento_id; o lote inteiro compartilha o lote_id retornado.
+
+    Os itens são cobrados num limite próprio da API Key: rate_limit ×
+    API_KEY_ITENS_LOTE_POR_REQUISICAO itens por minuto (1200 para a chave padrão de
+    60 req/min), que é também o maior lote aceito pela chave (e nunca mais que 1000).
+    Lote acima desse máximo recebe 413 — divida o lote; sem saldo momentâneo para o lote
+    inteiro, nada é gravado e a resposta é 429 com Retry-After.
+    """
+    _verificar_callbacks(request.itens)
+    await cobrar_itens(api_key, response, len(request.itens))
+
+    lote_id = novo_id()
+    linhas = []
+    assinaturas = []
+    for item in request.itens:
+        processamento_id = novo_id()
+        url = str(item.imagem_url)
+        linhas.append({
+            "id": processamento_id,
+            "tipo": TipoProcessamento.ANALISE_FOTOS,
+            "loja_id": item.loja_id or request.loja_id,
+            "nome_arquivo": url.split("/")[-1],
+            "imagem_url": url,
+            "status": StatusProcessamento.PROCESSANDO,
+            "meta_dados": _meta_auditoria(item),
+            "lote_id": lote_id,
+        })
+        assinaturas.append(assinatura_auditoria_pdv(
+            str(processamento_id), url, MODELO_AUDITORIA, item.nome_ativo, item.ignorar_cache
+        ))
+
+    await db.execute(insert(Processamento), linhas)
+    await db.commit()
+
+    try:
+        await run_in_threadpool(publicar_lote, assinaturas)
+    except Exception as e:
+        logger.error(f"Falha ao enfileirar lote {lote_id} ({len(linhas)} itens): {e}")
+        # Marca o lote como ERRO; itens publicados antes da falha ainda concluem e sobrescrevem o status
+        await db.execute(
+            update(Processamento)
+            .where(
+                Processamento.lote_id == lote_id,
+                Processamento.status == StatusProcessamento.PROCESSANDO,
+                *janela_do_id(lote_id)
+            )
+            .values(status=StatusProcessamento.ERRO, erro_mensagem=f"Falha ao enfileirar task: {str(e)}")
+        )
+        await db.commit()
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Serviço de processamento temporariamente indisponível. Tente novamente em instantes."
+        )
+
+    return AuditarPDVLoteResponse(
+        sucesso=True,
+        lote_id=str(lote_id),
+        total=len(linhas),
+        itens=[{"processamento_id": str(l["id"]), "url": l["imagem_url"]} for l in linhas],
+        mensagem=f"Lote com {len(linhas)} auditorias iniciado."
+    )
+
+
+@router.get(
+    "/lotes/{lote_id}",
+    response_model=LoteStatusResponse,
+    summary="Consultar Status de Lote"
+)
+async def obter_status_lote(
+    lote_id: uuid.UUID,
+    cursor: Optional[str] = Query(None, description="proximo_cursor da consulta anterior: retorna só os itens alterados desde então"),
+    incluir_resultado: bool = Query(False, description="Inclui a auditoria completa e o thumbnail de cada item retornado"),
+    limite: int = Query(LIMITE_ITENS_STATUS_LOTE, ge=1, le=LIMITE_ITENS_STATUS_LOTE),
+    db: AsyncSession = Depends(get_async_db),
+    api_key = Depends(verificar_api_key)
+):
+    """
+    Estado de todas as auditorias de um lote em uma chamada: contagens por status,
+    nota média e os itens alterados desde o cursor, ordenados por (updated_at, id)
+    sobre o índice (lote_id, updated_at, id).
+
+    Para acompanhar um lote, reenvie proximo_cursor a cada consulta; cada resposta traz
+    só o que mudou. Perto do fim o cursor recua alguns segundos, então um item pode
+    aparecer de novo — deduplique por processamento_id.
+    """
+    nota = AUDITORIA_NOTA
+    status_auditoria = AUDITORIA_STATUS
+
+    agregados = (await db.execute(
+        select(
+            Processamento.status,
+            status_auditoria.label("status_auditoria"),
+            func.count().label("quantidade"),
+            func.sum(nota).label("soma_notas"),
+            func.count(nota).label("com_nota"),
+        )
+        .where(Processamento.lote_id == lote_id, *janela_do_id(lote_id))
+        .group_by(Processamento.status, status_auditoria)
+    )).all()
+    if not agregados:
+        raise HTTPException(status_code=404, detail="Lote não encontrado")
+
+    colunas = [
+        Processamento.id,
+        Processamento.status,
+        Processamento.erro_mensagem,
+        Processamento.updated_at,
+        nota.label("nota"),
+        status_auditoria.label("status_auditoria"),
+    ]
+    if incluir_resultado:
+        colunas += [Processamento.resultado, Processamento.meta_dados]
+    query = select(*colunas).where(Processamento.lote_id == lote_id, *janela_do_id(lote_id))
+    posicao = decodificar_cursor(cursor) if cursor else None
+    if posicao:
+        query = query.where(tuple_(Processamento.updated_at, Processamento.id) > tuple_(*posicao))
+    linhas = (await db.execute(
+        query.order_by(Processamento.updated_at, Processamento.id).limit(limite)
+    )).all()
+
+    if len(linhas) == limite:
+        # Há mais itens alterados: avança exatamente até o último entregue
+        proximo = (linhas[-1].updated_at, linhas[-1].id)
+    else:
+        teto = (datetime.utcnow() - MARGEM_CURSOR_LOTE, uuid.UUID(int=0))
+        ultimo = (linhas[-1].updated_at, linhas[-1].id) if linhas else posicao
+        proximo = min(ultimo, teto) if ultimo else teto
+
+    contagem: dict[str, int] = {}
+    contagem_auditoria: dict[str, int] = {}
+    soma_notas, com_nota = 0.0, 0
+    for a in agregados:
+        contagem[a.status.value] = contagem.get(a.status.value, 0) + a.quantidade
+        if a.status_auditoria:
+            contagem_auditoria[a.status_auditoria] = contagem_auditoria.get(a.status_auditoria, 0) + a.quantidade
+        soma_notas += a.soma_notas or 0
+        com_nota += a.com_nota
+
+    return LoteStatusResponse(
+        lote_id=str(lote_id),
+        total=sum(contagem.values()),
+        finalizado=contagem.get(StatusProcessamento.PROCESSANDO.value, 0) == 0,
+        contagem=contagem,
+        contagem_auditoria=contagem_auditoria,
+        nota_media=round(soma_notas / com_nota, 2) if com_nota else None,
+        itens=[
+            ItemLoteStatus(
+                processamento_id=str(l.id),
+                status=l.status.value,
+                nota=int(l.nota) if l.nota is not None else None,
+                status_auditoria=l.status_auditoria,
+                erro_mensagem=l.erro_mensagem,
+                updated_at=l.updated_at.isoformat(),
+                resultado=(l.resultado or {}).get("auditoria") if incluir_resultado else None,
+                thumb_url=url_derivado(l.meta_dados) if incluir_resultado else None,
+            )
+            for l in linhas
+        ],
+        proximo_cursor=codificar_cursor(*proximo)
+    )
+
+
 @router.get(
     "/auditorias/{processamento_id}",
     summary="Consultar Resultado de Auditoria"
 )
 async def obter_auditoria_pdv(
-    processamento_id: str,
-    db: Session = Depends(get_db),
+    processamento_id: uuid.UUID,
+    wait: float = Query(0, ge=0, le=ESPERA_MAXIMA_SEGUNDOS, description="Segundos a aguardar a conclusão antes de responder (long-poll)"),
+    db: AsyncSession = Depends(get_async_db),
     api_key = Depends(verificar_api_key)
 ):
-    """Consulta o resultado de uma auditoria de PDV."""
+    """
+    Consulta o resultado de uma auditoria de PDV. Com wait=N, responde assim que a
+    auditoria terminar (ou após N segundos com o estado atual).
+    """
 
-    processamento = db.query(Processamento).filter(
-        Processamento.id == processamento_id,
-        Processamento.tipo == TipoProcessamento.ANALISE_FOTOS
-    ).first()
+    processamento = await carregar_aguardando(
+        db,
+        select(Processamento).where(
+            *condicoes_por_id(processamento_id),
+            Processamento.tipo == TipoProcessamento.ANALISE_FOTOS
+        ),
+        processamento_id,
+        wait
+    )
 
     if not processamento:
         raise HTTPException(
@@ -127,11 +359,12 @@ async def obter_auditoria_pdv(
         return ProcessamentoAuditoriaPDVResponse(
             processamento_id=str(processamento.id),
             status=processamento.status.value,
-            imagem_url=processamento.imagem_url,
+            imagem_url=url_publica(processamento.imagem_url),
             resultado=None,
             erro_mensagem=processamento.erro_mensagem,
             tempo_processamento_ms=processamento.tempo_processamento_ms,
             metadata=processamento.meta_dados,
+            thumb_url=url_derivado(processamento.meta_dados),
             created_at=processamento.created_at.isoformat(),
             updated_at=processamento.updated_at.isoformat()
         )
@@ -148,7 +381,45 @@ async def obter_auditoria_pdv(
                 "parecer": resultado_obj.get("parecer"),
                 "problemas": resultado_obj.get("problemas", []),
                 "recomendacao": resultado_obj.get("recomendacao"),
-                "preço": resultado_obj.get("preço") or resultado_obj.get("preco")
+                "preço": resultado_obj.get("preço") or resultado_obj.get("preco"),
+                "thumb_url": url_derivado(processamento.meta_dados)
             }
         }
     ]
+
+
+@router.get(
+    "/duplicatas",
+    response_model=List[DuplicatasLojaResponse],
+    summary="Taxa de Submissões Duplicadas por Loja"
+)
+async def relatorio_duplicatas(
+    criado_de: Optional[datetime] = Query(None, description="Início do período (UTC)"),
+    criado_ate: Optional[datetime] = Query(None, description="Fim do período (UTC, exclusivo)"),
+    db: AsyncSession = Depends(get_async_db),
+    api_key = Depends(verificar_api_key)
+):
+    """
+    Agrega o índice de hashes perceptuais: quantas fotos auditadas por loja eram
+    duplicatas exatas ou quase-duplicatas de imagens já recebidas.
+    """
+    query = select(
+        ImagemHash.loja_id,
+        func.count().label("total_imagens"),
+        func.count(ImagemHash.duplicata_de).label("duplicatas"),
+    ).group_by(ImagemHash.loja_id)
+    if criado_de:
+        query = query.where(ImagemHash.created_at >= criado_de)
+    if criado_ate:
+        query = query.where(ImagemHash.created_at < criado_ate)
+
+    linhas = (await db.execute(query.order_by(func.count(ImagemHash.duplicata_de).desc()))).all()
+    return [
+        DuplicatasLojaResponse(
+            loja_id=l.loja_id,
+            total_imagens=l.total_imagens,
+            duplicatas=l.duplicatas,
+            taxa_duplicatas=round(l.duplicatas / l.total_imagens, 4) if l.total_imagens else 0.0
+        )
+        for l in linhas
+    ]
@@ -12,6 +12,18 @@ class AuditarPDVRequest(BaseModel):
         None,
         description="Nome ou tipo do ativo sendo avaliado, para auxiliar a IA na classificação"
     )
+    loja_id: Optional[str] = Field(
+        None,
+        description="ID da loja/PDV da foto — usado nos relatórios de submissões duplicadas"
+    )
+    ignorar_cache: bool = Field(
+        False,
+        description="Força nova análise pelo LLM mesmo que a mesma imagem já tenha sido auditada"
+    )
+    callback_url: Optional[HttpUrl] = Field(
+        None,
+        description="URL que recebe um POST assinado (HMAC) com o resultado ao concluir, dispensando o polling"
+    )
     class Config:
         populate_by_name = True
         json_schema_extra = {
@@ -21,6 +33,58 @@ class AuditarPDVRequest(BaseModel):
             }
         }
 
+MAX_ITENS_LOTE = 1000
+
+class AuditarPDVLoteRequest(BaseModel):
+    """Request para auditoria de várias fotos em uma única chamada."""
+    itens: List[AuditarPDVRequest] = Field(
+        ...,
+        min_length=1,
+        max_length=MAX_ITENS_LOTE,
+        description=(
+            "Fotos a auditar; cada item aceita os mesmos campos de /auditar-pdv. Máximo por "
+            "chave: rate_limit × API_KEY_ITENS_LOTE_POR_REQUISICAO itens (1200 na chave padrão), limitado a 1000"
+        )
+    )
+    loja_id: Optional[str] = Field(
+        None,
+        description="Loja padrão dos itens que não informarem loja_id (ex.: visita a uma loja)"
+    )
+
+class ItemLoteResponse(BaseModel):
+    processamento_id: str
+    url: str
+
+class AuditarPDVLoteResponse(BaseModel):
+    """Response inicial do lote (202 Accepted)."""
+    sucesso: bool
+    lote_id: str
+    total: int
+    itens: List[ItemLoteResponse]
+    status: str = "processando"
+    mensagem: str
+
+class ItemLoteStatus(BaseModel):
+    processamento_id: str
+    status: Literal["processando", "concluido", "erro"]
+    nota: Optional[int] = None
+    status_auditoria: Optional[str] = None
+    erro_mensagem: Optional[str] = None
+    updated_at: str
+    resultado: Optional[dict] = None  # Auditoria completa, com incluir_resultado=true
+    thumb_url: Optional[str] = None
+
+class LoteStatusResponse(BaseModel):
+    """Estado agregado do lote e itens alterados desde o cursor."""
+    lote_id: str
+    total: int
+    finalizado: bool
+    contagem: Dict[str, int]  # por status do processamento
+    contagem_auditoria: Dict[str, int]  # por status da auditoria (aprovado, reprovado...)
+    nota_media: Optional[float]
+    itens: List[ItemLoteStatus]
+    proximo_cursor: Optional[str]  # Reenviar em ?cursor= para receber só o que mudou
+
 class AuditarPDVResponse(BaseModel):
     """Response inicial (202 Accepted)."""
     sucesso: bool
@@ -49,6 +113,13 @@ class ResultadoAuditoriaPDV(BaseModel):
     confianca_avaliacao: Literal["alta", "media", "baixa"]
     limitacoes_foto: list[str]
 
+class DuplicatasLojaResponse(BaseModel):
+    """Taxa de submissões duplicadas (exatas ou quase-duplicatas) por loja."""
+    loja_id: Optional[str]
+    total_imagens: int
+    duplicatas: int
+    taxa_duplicatas: float
+
 class ProcessamentoAuditoriaPDVResponse(BaseModel):
     """Response completa do processamento."""
     processamento_id: str
@@ -58,6 +129,7 @@ class ProcessamentoAuditoriaPDVResponse(BaseModel):
     erro_mensagem: Optional[str]
     tempo_processamento_ms: Optional[int]
     metadata: Optional[dict]
+    thumb_url: Optional[str] = None  # URL pré-assinada do thumbnail
     created_at: str
     updated_at: str
 class OpcoesAnalise(BaseModel):
@@ -1,18 +1,20 @@
 import base64
 import json
 import os
-from typing import Dict, Literal
-from openai import OpenAI
-from anthropic import Anthropic
-import google.generativeai as genai
-from app.config import settings
+from typing import Callable, Dict, Literal
 from app.core.logging import logger
+from app.services.llm_clients import criar_cliente_llm
+from app.services.image_normalizer import normalizar_imagem
+from app.services.llm_rate_limiter import chamada_llm, estimar_tokens
 
 class AnalisePDVService:
     """
     Serviço para análise de materiais promocionais de PDV usando LLMs com visão.
     """
 
+    MAX_TOKENS_SAIDA = 2000
+    DETAIL_OPENAI = "auto"
+
     def __init__(self, modelo_llm: str = "gpt-4o-mini"):
         """
         Inicializa o serviço com o modelo de LLM especificado.
@@ -21,15 +23,10 @@ class AnalisePDVService:
             modelo_llm: 'gpt-4o-mini' | 'claude-3-5-sonnet' | 'gemini-pro-vision'
         """
         self.modelo_llm = modelo_llm
+        self.metricas_imagem: Dict = {}
 
-        # Inicializar clientes conforme modelo
-        if modelo_llm.startswith("gpt"):
-            self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
-        elif modelo_llm.startswith("claude"):
-            self.client = Anthropic(api_key=settings.ANTHROPIC_API_KEY)
-        elif modelo_llm.startswith("gemini"):
-            genai.configure(api_key=settings.GOOGLE_API_KEY)
-            self.client = genai.GenerativeModel(modelo_llm)
+        # Inicializar cliente conforme modelo (SDK importado sob demanda)
+        self.client = criar_cliente_llm(modelo_llm)
 
         # Carregar prompt do arquivo
         prompt_path = os.path.join(
@@ -40,13 +37,15 @@ class AnalisePDVService:
         with open(prompt_path, "r", encoding="utf-8") as f:
             self.PROMPT_AUDITORIA = f.read()
 
-    def auditar_ativo_pdv(self, imagem_bytes: bytes, nome_ativo: str = None) -> Dict:
+    def auditar_ativo_pdv(self, imagem_bytes: bytes, nome_ativo: str = None, ao_adquirir: Callable[[], None] = None) -> Dict:
         """
         Analisa imagem de ativo de PDV e retorna auditoria estruturada.
 
         Args:
             imagem_bytes: Bytes da imagem
             nome_ativo: Nome do ativo informado (opcional)
+            ao_adquirir: Chamado quando o limitador libera a chamada, antes do provedor
+                (ex.: iniciar I/O paralelo só quando o LLM de fato vai rodar)
 
         Returns:
             Dict com resultado da auditoria conforme schema
@@ -67,20 +66,31 @@ class AnalisePDVService:
                 f"4. Em nenhum caso recuse ou interrompa a análise: sempre retorne o JSON completo com todos os campos."
             )
 
-        # Chamar LLM apropriado
-        if self.modelo_llm.startswith("gpt"):
-            resultado = self._auditar_com_openai(imagem_bytes, prompt)
-        elif self.modelo_llm.startswith("claude"):
-            resultado = self._auditar_com_anthropic(imagem_bytes, prompt)
-        elif self.modelo_llm.startswith("gemini"):
-            resultado = self._auditar_com_gemini(imagem_bytes, prompt)
-        else:
-            raise ValueError(f"Modelo não suportado: {self.modelo_llm}")
+        # Normalizar imagem (EXIF, tamanho útil do modelo, re-encode) — métricas ficam no serviço
+        imagem = normalizar_imagem(imagem_bytes, self.modelo_llm, detail=self.DETAIL_OPENAI)
+        self.metricas_imagem = imagem["metricas"]
+
+        # Chamar LLM apropriado, após reservar capacidade no bucket RPM/TPM compartilhado entre workers
+        tokens = estimar_tokens(
+            self.modelo_llm, prompt, imagem["metricas"]["largura"], imagem["metricas"]["altura"],
+            self.DETAIL_OPENAI, self.MAX_TOKENS_SAIDA
+        )
+        with chamada_llm(self.modelo_llm, tokens):
+            if ao_adquirir:
+                ao_adquirir()
+            if self.modelo_llm.startswith("gpt"):
+                resultado = self._auditar_com_openai(imagem["bytes"], prompt, imagem["media_type"])
+            elif self.modelo_llm.startswith("claude"):
+                resultado = self._auditar_com_anthropic(imagem["bytes"], prompt, imagem["media_type"])
+            elif self.modelo_llm.startswith("gemini"):
+                resultado = self._auditar_com_gemini(imagem["bytes"], prompt)
+            else:
+                raise ValueError(f"Modelo não suportado: {self.modelo_llm}")
 
         # Validar e retornar
         return self._validar_resultado(resultado)
 
-    def _auditar_com_openai(self, imagem_bytes: bytes, prompt: str) -> Dict:
+    def _auditar_com_openai(self, imagem_bytes: bytes, prompt: str, media_type: str = "image/jpeg") -> Dict:
         """Auditoria usando GPT-4 Vision."""
 
         # Converter imagem para base64
@@ -99,14 +109,14 @@ class AnalisePDVService:
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/jpeg;base64,{imagem_base64}",
-                                "detail": "auto"
+                                "url": f"data:{media_type};base64,{imagem_base64}",
+                                "detail": self.DETAIL_OPENAI
                             }
                         }
                     ]
                 }
             ],
-            max_tokens=2000,
+            max_tokens=self.MAX_TOKENS_SAIDA,
             temperature=0.1,  # Baixa temperatura para consistência
             response_format={"type": "json_object"}  # Forçar JSON
         )
@@ -114,7 +124,7 @@ class AnalisePDVService:
         resultado_json = response.choices[0].message.content
         return json.loads(resultado_json)
 
-    def _auditar_com_anthropic(self, imagem_bytes: bytes, prompt: str) -> Dict:
+    def _auditar_com_anthropic(self, imagem_bytes: bytes, prompt: str, media_type: str = "image/jpeg") -> Dict:
         """Auditoria usando Claude 3.5 Sonnet."""
 
         # Converter imagem para base64
@@ -122,7 +132,7 @@ class AnalisePDVService:
 
         response = self.client.messages.create(
             model=self.modelo_llm,
-            max_tokens=2000,
+            max_tokens=self.MAX_TOKENS_SAIDA,
             temperature=0.1,
             messages=[
                 {
@@ -132,7 +142,7 @@ class AnalisePDVService:
                             "type": "image",
                             "source": {
                                 "type": "base64",
-                                "media_type": "image/jpeg",
+                                "media_type": media_type,
                                 "data": imagem_base64
                             }
                         },
@@ -166,7 +176,7 @@ class AnalisePDVService:
             [prompt, imagem],
             generation_config={
                 "temperature": 0.1,
-                "max_output_tokens": 2000
+                "max_output_tokens": self.MAX_TOKENS_SAIDA
             }
         )
 
@@ -1,21 +1,120 @@
+import hashlib
+import os
+import random
 import time
-import requests
-from openai import RateLimitError
+from concurrent.futures import ThreadPoolExecutor
 from app.core.celery_app import celery_app
 from app.core.database import get_db_session
-from app.models.processamento import Processamento, StatusProcessamento
+from app.models.processamento import Processamento, StatusProcessamento, condicoes_por_id
 from app.api.v1.analise_fotos.services import AnalisePDVService
 from app.services.storage_service import StorageService
+from app.services.image_derivatives import salvar_derivados
+from app.services.eventos import publicar_conclusao
+from app.services.heartbeats import marcar_etapa
+from app.services.webhooks import agendar_webhook
+from app.services.image_downloader import DownloadImagemError, baixar_imagem
+from app.services.llm_clients import eh_erro_rate_limit
+from app.services.llm_rate_limiter import LimiteTaxaLLM, reagendar_por_limite, retry_after_segundos
+from app.api.v1.analise_fotos.cache import auditorias_pendentes, cache_auditoria, chave_cache_auditoria
+from app.api.v1.analise_fotos.duplicatas import (
+    buscar_quase_duplicata,
+    calcular_dhash_seguro,
+    obter_auditoria_reutilizavel,
+    registrar_hash,
+)
+from app.config import settings
+from app.core.logging import logger
+from app.core.metrics import incrementar
+
+
+BUCKET_AUDITORIAS = "auditorias-pdv"
+
+_executor_io: ThreadPoolExecutor | None = None
+_executor_pid: int | None = None
+
+
+def _obter_executor_io() -> ThreadPoolExecutor:
+    """Pool de threads do processo para I/O que roda em paralelo à chamada do LLM."""
+    global _executor_io, _executor_pid
+    if _executor_io is None or _executor_pid != os.getpid():
+        _executor_io = ThreadPoolExecutor(max_workers=2, thread_name_prefix="auditoria-io")
+        _executor_pid = os.getpid()
+    return _executor_io
+
+
+def _salvar_imagem_cronometrado(processamento_id: str, imagem_bytes: bytes, nome_arquivo: str, sha256: str) -> dict:
+    """
+    Grava o original e, em seguida, seus derivados (thumb/llm) — tudo fora do caminho do LLM.
+
+    A chave vem do processamento (ou do conteúdo, com STORAGE_CONTENT_ADDRESSED): cada
+    retry sobrescreve os mesmos objetos em vez de deixar cópias sem referência.
+    """
+    inicio = time.time()
+    storage = StorageService()
+    object_name = storage.salvar_objeto(
+        bucket=BUCKET_AUDITORIAS,
+        loja_id=None,
+        nome_arquivo=nome_arquivo,
+        imagem_bytes=imagem_bytes,
+        sha256=sha256,
+        object_name=f"{processamento_id}/{nome_arquivo}"
+    )
+    upload_ms = int((time.time() - inicio) * 1000)
+
+    marco = time.time()
+    derivados = salvar_derivados(BUCKET_AUDITORIAS, object_name, imagem_bytes)
+    return {
+        "url": storage.referencia_objeto(BUCKET_AUDITORIAS, object_name),
+        "derivados": derivados,
+        "upload_ms": upload_ms,
+        "derivados_ms": int((time.time() - marco) * 1000),
+    }
 
 
 def _marcar_erro(processamento_id: str, mensagem: str) -> None:
     """Atualiza status para ERRO em uma sessão própria, sem depender de sessão anterior."""
     with get_db_session() as db:
-        processamento = db.query(Processamento).filter_by(id=processamento_id).first()
+        processamento = db.query(Processamento).filter(*condicoes_por_id(processamento_id)).first()
         if processamento:
             processamento.status = StatusProcessamento.ERRO
             processamento.erro_mensagem = mensagem
             db.commit()
+            publicar_conclusao(processamento_id, StatusProcessamento.ERRO.value)
+            agendar_webhook(processamento)
+
+
+def _persistir_auditoria(
+    processamento_id: str,
+    imagem_storage_url: str,
+    resultado_auditoria: dict,
+    modelo_llm: str,
+    tempo_ms: int,
+    meta_extra: dict,
+    imagem_sha256: str | None = None,
+    dhash: int | None = None,
+    duplicata: dict | None = None
+) -> None:
+    """Grava o resultado da auditoria, indexa o dHash e marca o processamento como CONCLUIDO."""
+    if duplicata:
+        meta_extra = {**meta_extra, "duplicata_de": duplicata}
+
+    with get_db_session() as db:
+        processamento = db.query(Processamento).filter(*condicoes_por_id(processamento_id)).first()
+        processamento.imagem_url = imagem_storage_url
+        processamento.imagem_sha256 = imagem_sha256
+        processamento.resultado = {
+            "auditoria": resultado_auditoria,
+            "modelo_llm_usado": modelo_llm
+        }
+        # JSON não rastreia mutação in-place: reatribuir o dict
+        processamento.meta_dados = {**(processamento.meta_dados or {}), **meta_extra}
+        processamento.status = StatusProcessamento.CONCLUIDO
+        processamento.tempo_processamento_ms = tempo_ms
+        if dhash is not None:
+            registrar_hash(db, processamento_id, processamento.loja_id, dhash, duplicata)
+        db.commit()
+        publicar_conclusao(processamento_id, StatusProcessamento.CONCLUIDO.value)
+        agendar_webhook(processamento)
 
 
 @celery_app.task(name='analise_fotos.processar_imagem', bind=True, max_retries=3)
@@ -27,7 +126,7 @@ def processar_analise_task(self, processamento_id: str, imagem_base64: str, nome
         tempo_ms = int((time.time() - inicio) * 1000)
 
         with get_db_session() as db:
-            processamento = db.query(Processamento).filter_by(id=processamento_id).first()
+            processamento = db.query(Processamento).filter(*condicoes_por_id(processamento_id)).first()
             processamento.status = StatusProcessamento.CONCLUIDO
             processamento.tempo_processamento_ms = tempo_ms
             processamento.resultado = {
@@ -39,11 +138,16 @@ def processar_analise_task(self, processamento_id: str, imagem_base64: str, nome
                 }
             }
             db.commit()
+        publicar_conclusao(processamento_id, StatusProcessamento.CONCLUIDO.value)
 
         return {"status": "success", "processamento_id": processamento_id}
 
     except Exception as e:
-        _marcar_erro(processamento_id, str(e))
+        # Durante os retries o registro segue PROCESSANDO: quem aguarda (wait=/SSE) trata
+        # qualquer outro status como final
+        if self.request.retries >= self.max_retries:
+            _marcar_erro(processamento_id, str(e))
+            raise
         raise self.retry(exc=e, countdown=2 ** self.request.retries)
 
 
@@ -53,7 +157,9 @@ def processar_auditoria_pdv_task(
     processamento_id: str,
     imagem_url: str,
     modelo_llm: str = "gpt-4o-mini",
-    nome_ativo: str = None
+    nome_ativo: str = None,
+    ignorar_cache: bool = False,
+    esperas_limite: int = 0
 ):
     """
     Task assíncrona para processar auditoria de PDV.
@@ -62,42 +168,142 @@ def processar_auditoria_pdv_task(
         processamento_id: UUID do processamento
         imagem_url: URL da imagem a ser analisada
         modelo_llm: Modelo de LLM a usar
+        nome_ativo: Nome do ativo informado (opcional)
+        ignorar_cache: Força nova chamada ao LLM mesmo com resultado em cache
+        esperas_limite: Reagendamentos por falta de saldo no limitador de LLM até aqui;
+            não contam contra max_retries, que fica para as falhas de fato
     """
     inicio = time.time()
+    tempos_ms = {}
 
     try:
         # 1. Baixar imagem da URL  (sem DB aberto)
-        response = requests.get(imagem_url, timeout=30)
-        response.raise_for_status()
-        imagem_bytes = response.content
+        marcar_etapa(processamento_id, "download")
+        imagem_bytes = baixar_imagem(imagem_url)
+        tempos_ms["download"] = int((time.time() - inicio) * 1000)
+        marco = time.time()
+
+        # 2. Consultar cache content-addressed  (sem DB aberto)
+        usar_cache = settings.CACHE_AUDITORIA_ATIVO and not ignorar_cache
+        imagem_sha256 = hashlib.sha256(imagem_bytes).hexdigest()
+        chave_cache = chave_cache_auditoria(imagem_sha256, modelo_llm, nome_ativo)
+        em_cache = cache_auditoria.obter(chave_cache) if usar_cache else None
+        if ignorar_cache:
+            incrementar("cache.auditoria_pdv.bypass")
 
-        # 2. Salvar imagem no MinIO  (sem DB aberto)
-        storage = StorageService()
+        # 3. Hash perceptual e busca de quase-duplicatas (sessão curta)
+        marcar_etapa(processamento_id, "reuso")
+        dhash = calcular_dhash_seguro(processamento_id, imagem_bytes) if settings.DUPLICATAS_ATIVO else None
+        duplicata = None
+        reutilizavel = None
+        if dhash is not None:
+            with get_db_session() as db:
+                duplicata = buscar_quase_duplicata(db, dhash)
+                if duplicata and not em_cache and usar_cache and settings.DUPLICATA_ACAO == "reutilizar":
+                    reutilizavel = obter_auditoria_reutilizavel(db, duplicata["processamento_id"], modelo_llm, nome_ativo)
+            if duplicata:
+                incrementar("duplicatas.auditoria_pdv.detectadas")
+        tempos_ms["reuso"] = int((time.time() - marco) * 1000)
+
+        if em_cache or reutilizavel:
+            origem = "hit" if em_cache else "quase_duplicata"
+            reaproveitado = em_cache or reutilizavel
+            logger.info(f"[{processamento_id}] Auditoria reaproveitada ({origem}, chave {chave_cache[:12]})")
+            if em_cache and not duplicata and em_cache.get("processamento_id"):
+                duplicata = {"processamento_id": em_cache["processamento_id"], "distancia": 0}
+            _persistir_auditoria(
+                processamento_id,
+                imagem_storage_url=reaproveitado["imagem_url"],
+                resultado_auditoria=reaproveitado["auditoria"],
+                modelo_llm=modelo_llm,
+                tempo_ms=int((time.time() - inicio) * 1000),
+                meta_extra={
+                    "cache": origem,
+                    "cache_chave": chave_cache,
+                    "derivados": reaproveitado.get("derivados"),
+                    "tempos_ms": tempos_ms
+                },
+                imagem_sha256=imagem_sha256,
+                dhash=dhash,
+                duplicata=duplicata
+            )
+            return {
+                "status": "success",
+                "processamento_id": processamento_id,
+                "nota": reaproveitado["auditoria"]["nota"],
+                "cache": origem
+            }
+
+        # 4. Salvar imagem no MinIO em paralelo ao LLM — o LLM não depende do upload.
+        # O upload só começa quando o limitador libera a chamada: reagendamentos por
+        # falta de saldo não gravam nada
         nome_arquivo = imagem_url.split("/")[-1]
-        imagem_storage_url = storage.salvar_imagem(
-            bucket="auditorias-pdv",
-            loja_id=None,
-            nome_arquivo=nome_arquivo,
-            imagem_bytes=imagem_bytes
-        )
+        upload = None
 
-        # 3. Chamar LLM  (sem DB aberto — chamada mais longa da task)
-        analise_service = AnalisePDVService(modelo_llm=modelo_llm)
-        resultado_auditoria = analise_service.auditar_ativo_pdv(imagem_bytes, nome_ativo=nome_ativo)
+        def iniciar_upload():
+            nonlocal upload
+            upload = _obter_executor_io().submit(
+                _salvar_imagem_cronometrado, processamento_id, imagem_bytes, nome_arquivo, imagem_sha256
+            )
 
-        tempo_ms = int((time.time() - inicio) * 1000)
+        # 5. Chamar LLM  (sem DB aberto — chamada mais longa da task), salvo se uma
+        # tentativa anterior já pagou a auditoria e falhou depois, no storage
+        marcar_etapa(processamento_id, "llm")
+        marco = time.time()
+        pendente = auditorias_pendentes.obter(processamento_id)
+        if pendente:
+            logger.info(f"[{processamento_id}] Reaproveitando auditoria da tentativa anterior")
+            iniciar_upload()
+            resultado_auditoria = pendente["auditoria"]
+            metricas_imagem = pendente["imagem_llm"]
+        else:
+            analise_service = AnalisePDVService(modelo_llm=modelo_llm)
+            resultado_auditoria = analise_service.auditar_ativo_pdv(
+                imagem_bytes, nome_ativo=nome_ativo, ao_adquirir=iniciar_upload
+            )
+            metricas_imagem = analise_service.metricas_imagem
+            auditorias_pendentes.gravar(processamento_id, {
+                "auditoria": resultado_auditoria,
+                "imagem_llm": metricas_imagem
+            })
+        tempos_ms["llm"] = int((time.time() - marco) * 1000)
 
-        # 4. Persistir resultado — DB aberto apenas aqui, operação rápida
-        with get_db_session() as db:
-            processamento = db.query(Processamento).filter_by(id=processamento_id).first()
-            processamento.imagem_url = imagem_storage_url
-            processamento.resultado = {
+        # Join do upload antes de persistir: falha no storage cai no retry da task,
+        # que reaproveita a auditoria pendente
+        marco = time.time()
+        armazenamento = upload.result()
+        tempos_ms["espera_upload"] = int((time.time() - marco) * 1000)
+        tempos_ms["upload"] = armazenamento["upload_ms"]
+        tempos_ms["derivados"] = armazenamento["derivados_ms"]
+        imagem_storage_url = armazenamento["url"]
+
+        if settings.CACHE_AUDITORIA_ATIVO:
+            cache_auditoria.gravar(chave_cache, {
                 "auditoria": resultado_auditoria,
-                "modelo_llm_usado": modelo_llm
-            }
-            processamento.status = StatusProcessamento.CONCLUIDO
-            processamento.tempo_processamento_ms = tempo_ms
-            db.commit()
+                "imagem_url": imagem_storage_url,
+                "derivados": armazenamento["derivados"],
+                "processamento_id": processamento_id
+            })
+
+        # 6. Persistir resultado — DB aberto apenas aqui, operação rápida
+        marcar_etapa(processamento_id, "persistencia")
+        _persistir_auditoria(
+            processamento_id,
+            imagem_storage_url=imagem_storage_url,
+            resultado_auditoria=resultado_auditoria,
+            modelo_llm=modelo_llm,
+            tempo_ms=int((time.time() - inicio) * 1000),
+            meta_extra={
+                "cache": "bypass" if ignorar_cache else "miss",
+                "cache_chave": chave_cache,
+                "imagem_llm": metricas_imagem,
+                "derivados": armazenamento["derivados"],
+                "tempos_ms": tempos_ms
+            },
+            imagem_sha256=imagem_sha256,
+            dhash=dhash,
+            duplicata=duplicata
+        )
 
         return {
             "status": "success",
@@ -105,18 +311,32 @@ def processar_auditoria_pdv_task(
             "nota": resultado_auditoria["nota"]
         }
 
-    except RateLimitError as e:
-        # 429 é transitório: backoff longo, NÃO marcar como erro durante retries
-        countdown = 60 * (2 ** self.request.retries)  # 60s, 120s, 240s, 480s, 960s
-        raise self.retry(exc=e, countdown=countdown)
-
-    except requests.exceptions.RequestException as e:
+    except DownloadImagemError as e:
         _marcar_erro(processamento_id, f"Erro ao baixar imagem: {str(e)}")
         raise
 
+    except LimiteTaxaLLM as e:
+        # Bucket compartilhado sem saldo além da espera máxima: reagenda para quando houver
+        # capacidade, sem marcar erro e sem gastar as tentativas reservadas a falhas
+        if esperas_limite >= settings.LLM_RATE_LIMIT_MAX_REAGENDAMENTOS:
+            _marcar_erro(processamento_id, str(e))
+            raise
+        raise reagendar_por_limite(self, e, esperas_limite, e.espera_segundos + random.uniform(0, 5))
+
     except Exception as e:
-        # Só marca ERRO se esgotou todos os retries
-        if self.request.retries >= self.max_retries:
+        if eh_erro_rate_limit(e):
+            # 429 apesar do limitador (limite configurado acima do da conta ou outro consumidor):
+            # o bucket já foi pausado para todos os workers; volta logo após a pausa, com jitter
+            if esperas_limite >= settings.LLM_RATE_LIMIT_MAX_REAGENDAMENTOS:
+                _marcar_erro(processamento_id, str(e))
+                raise
+            pausa = retry_after_segundos(e) or settings.LLM_RATE_LIMIT_PAUSA_429_SEGUNDOS
+            countdown = min(300, pausa * (2 ** min(esperas_limite, 4))) + random.uniform(0, 5)
+            raise reagendar_por_limite(self, e, esperas_limite, countdown)
+
+        # Só marca ERRO se esgotou todos os retries (reagendamentos por limite não contam)
+        falhas = self.request.retries - esperas_limite
+        if falhas >= self.max_retries:
             _marcar_erro(processamento_id, str(e))
             raise
-        raise self.retry(exc=e, countdown=2 ** self.request.retries)
+        raise self.retry(exc=e, countdown=2 ** falhas, max_retries=self.max_retries + esperas_limite)
@@ -1,52 +1,151 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from app.core.database import get_db
+import base64
+import binascii
+import mimetypes
+import tempfile
+from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile, status
+from fastapi.concurrency import run_in_threadpool
+from pydantic import HttpUrl, TypeAdapter, ValidationError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.database import get_async_db
 from app.core.auth import verificar_api_key
+from app.config import settings
+from app.core.logging import logger
 from app.api.v1.plantas.schemas import ProcessarPlantaRequest, ProcessamentoPlantaV2Response
-from app.api.v1.plantas.tasks import processar_planta_task
-from app.models.processamento import Processamento, TipoProcessamento, StatusProcessamento
+from app.core.task_signatures import assinatura_processar_planta
+from app.models.processamento import Processamento, TipoProcessamento, StatusProcessamento, condicoes_por_id, novo_id
+from app.services.storage_service import StorageService
+from app.services.webhook_destinos import DestinoWebhookInvalido, validar_callback_url
+import hashlib
+from typing import BinaryIO, Optional
 import uuid
 
 router = APIRouter()
 
-@router.post(
-    "/processar",
-    status_code=status.HTTP_202_ACCEPTED,
-    summary="Cadastrar Mapeamento de Planta"
-)
-async def processar_planta(
-    request: ProcessarPlantaRequest,
-    db: Session = Depends(get_db),
-    api_key = Depends(verificar_api_key)
-):
+BUCKET_PLANTAS = "plantas"
+CHUNK_BASE64 = 4 * 256 * 1024  # Múltiplo de 4: cada fatia decodifica de forma independente
+SPOOL_MAX_MEMORIA = 1024 * 1024  # Acima disso o arquivo temporário vai para disco
+
+
+def _base64_para_arquivo(imagem_base64: str) -> tuple[BinaryIO, int, str]:
     """
-    Processa uma planta de loja para verificar share e rupturas.
-    O processamento é assíncrono. Use o processamento_id para consultar o resultado.
+    Decodifica o base64 em fatias para um arquivo temporário, calculando o SHA-256 no caminho.
+
+    Evita manter a string base64 e os bytes decodificados inteiros em memória ao mesmo tempo.
     """
-    processamento_id = uuid.uuid4()
-    
+    if "\n" in imagem_base64 or "\r" in imagem_base64 or " " in imagem_base64:
+        imagem_base64 = "".join(imagem_base64.split())
+
+    arquivo = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORIA)
+    tamanho = 0
+    digest = hashlib.sha256()
+    for inicio in range(0, len(imagem_base64), CHUNK_BASE64):
+        fatia = base64.b64decode(imagem_base64[inicio:inicio + CHUNK_BASE64], validate=True)
+        arquivo.write(fatia)
+        digest.update(fatia)
+        tamanho += len(fatia)
+    arquivo.seek(0)
+    return arquivo, tamanho, digest.hexdigest()
+
+
+def _validar_callback_url(callback_url: str | None) -> str | None:
+    """Form não passa pela validação de HttpUrl do schema JSON: mesma regra aplicada aqui."""
+    if not callback_url:
+        return None
+    try:
+        return str(TypeAdapter(HttpUrl).validate_python(callback_url))
+    except ValidationError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="callback_url inválida")
+
+
+def _content_type(nome_arquivo: str, informado: str | None = None) -> str:
+    if informado and informado.startswith("image/"):
+        return informado
+    return mimetypes.guess_type(nome_arquivo)[0] or "image/jpeg"
+
+
+async def _registrar_e_enfileirar(
+    db: AsyncSession,
+    loja_id: str,
+    nome_arquivo: str,
+    modelo_llm: str,
+    stream: BinaryIO,
+    tamanho: int,
+    content_type: str,
+    sha256: str | None = None,
+    callback_url: str | None = None
+) -> dict:
+    """
+    Claim-check: grava a imagem no storage, cria o registro e enfileira só a chave do objeto.
+    O broker carrega uma mensagem de poucos bytes, independente do tamanho da planta.
+
+    Com STORAGE_CONTENT_ADDRESSED a chave é o SHA-256 do arquivo e plantas reenviadas
+    reaproveitam o objeto já gravado.
+    """
+    if callback_url:
+        try:
+            validar_callback_url(callback_url)
+        except DestinoWebhookInvalido as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    processamento_id = novo_id()
+    storage = StorageService()
+
+    try:
+        if settings.STORAGE_CONTENT_ADDRESSED:
+            object_name, url_armazenada, sha256 = await run_in_threadpool(
+                storage.salvar_stream_por_conteudo, BUCKET_PLANTAS, stream, tamanho, content_type, sha256
+            )
+        else:
+            object_name = storage.gerar_object_name(loja_id, nome_arquivo)
+            url_armazenada = await run_in_threadpool(
+                storage.salvar_stream, BUCKET_PLANTAS, object_name, stream, tamanho, content_type
+            )
+    except Exception as e:
+        logger.error(f"Falha ao gravar planta {nome_arquivo} no storage: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Storage temporariamente indisponível. Tente novamente em instantes."
+        )
+
     meta = {
-        "loja_id": request.loja_id,
-        "modelo_llm": request.modelo_llm
+        "loja_id": loja_id,
+        "modelo_llm": modelo_llm,
+        "objeto_imagem": object_name,
     }
-    
+    if callback_url:
+        meta["callback_url"] = callback_url
+
     processamento = Processamento(
         id=processamento_id,
         tipo=TipoProcessamento.PLANTAS,
-        loja_id=request.loja_id,
-        nome_arquivo=request.nome_arquivo,
-        imagem_url="pendente", # Será preenchido assincronamente pelo celery
+        loja_id=loja_id,
+        nome_arquivo=nome_arquivo,
+        imagem_url=url_armazenada,
+        imagem_sha256=sha256,
         status=StatusProcessamento.PROCESSANDO,
         meta_dados=meta
     )
     db.add(processamento)
-    db.commit()
+    await db.commit()
 
-    # Enfileirar task
-    processar_planta_task.apply_async(
-        args=[str(processamento_id), request.imagem_base64, request.nome_arquivo, request.loja_id, request.modelo_llm],
-        queue='plantas'
-    )
+    # Enfileirar task (publish no broker é bloqueante — fora do event loop);
+    # se o broker estiver com conexão stale, captura aqui
+    try:
+        await run_in_threadpool(
+            assinatura_processar_planta(
+                str(processamento_id), object_name, nome_arquivo, loja_id, modelo_llm
+            ).apply_async
+        )
+    except Exception as e:
+        logger.error(f"Falha ao enfileirar task para processamento {processamento_id}: {e}")
+        processamento.status = StatusProcessamento.ERRO
+        processamento.erro_mensagem = f"Falha ao enfileirar task: {str(e)}"
+        await db.commit()
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Serviço de processamento temporariamente indisponível. Tente novamente em instantes."
+        )
 
     return {
         "sucesso": True,
@@ -56,20 +155,87 @@ async def processar_planta(
         "tempo_estimado_segundos": 20
     }
 
+
+@router.post(
+    "/processar",
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Cadastrar Mapeamento de Planta"
+)
+async def processar_planta(
+    request: ProcessarPlantaRequest,
+    db: AsyncSession = Depends(get_async_db),
+    api_key = Depends(verificar_api_key)
+):
+    """
+    Processa uma planta de loja para verificar share e rupturas.
+    O processamento é assíncrono. Use o processamento_id para consultar o resultado.
+
+    Para arquivos grandes prefira /processar-upload (multipart), que não passa por base64.
+    """
+    try:
+        arquivo, tamanho, sha256 = await run_in_threadpool(_base64_para_arquivo, request.imagem_base64)
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="imagem_base64 inválida")
+
+    with arquivo:
+        return await _registrar_e_enfileirar(
+            db,
+            loja_id=request.loja_id,
+            nome_arquivo=request.nome_arquivo,
+            modelo_llm=request.modelo_llm,
+            stream=arquivo,
+            tamanho=tamanho,
+            content_type=_content_type(request.nome_arquivo),
+            sha256=sha256,
+            callback_url=str(request.callback_url) if request.callback_url else None
+        )
+
+
+@router.post(
+    "/processar-upload",
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Cadastrar Mapeamento de Planta (upload multipart)"
+)
+async def processar_planta_upload(
+    arquivo: UploadFile = File(..., description="Imagem da planta baixa"),
+    loja_id: str = Form(..., description="ID da Loja para buscar a configuração da planta/share"),
+    modelo_llm: str = Form("gpt-4o-mini", description="Modelo de LLM a usar para a análise visual"),
+    callback_url: Optional[str] = Form(None, description="URL que recebe um POST assinado com o resultado ao concluir"),
+    db: AsyncSession = Depends(get_async_db),
+    api_key = Depends(verificar_api_key)
+):
+    """
+    Mesmo fluxo de /processar, recebendo o arquivo via multipart/form-data.
+    O corpo é repassado em stream para o storage, sem base64 e sem cópia inteira em memória.
+    """
+    nome_arquivo = arquivo.filename or f"planta_{uuid.uuid4().hex[:8]}.jpg"
+    return await _registrar_e_enfileirar(
+        db,
+        loja_id=loja_id,
+        nome_arquivo=nome_arquivo,
+        modelo_llm=modelo_llm,
+        stream=arquivo.file,
+        tamanho=arquivo.size if arquivo.size is not None else -1,
+        content_type=_content_type(nome_arquivo, arquivo.content_type),
+        callback_url=_validar_callback_url(callback_url)
+    )
+
 @router.get(
     "/processamentos/{processamento_id}",
     summary="Consultar Resultado do Mapeamento de Planta"
 )
 async def obter_processamento_planta(
-    processamento_id: str,
-    db: Session = Depends(get_db),
+    processamento_id: uuid.UUID,
+    db: AsyncSession = Depends(get_async_db),
     api_key = Depends(verificar_api_key)
 ):
     """Consulta o resultado de um processamento/mapeamento de planta."""
-    processamento = db.query(Processamento).filter(
-        Processamento.id == processamento_id,
-        Processamento.tipo == TipoProcessamento.PLANTAS
-    ).first()
+    processamento = (await db.execute(
+        select(Processamento).where(
+            *condicoes_por_id(processamento_id),
+            Processamento.tipo == TipoProcessamento.PLANTAS
+        )
+    )).scalar_one_or_none()
 
     if not processamento:
         raise HTTPException(status_code=404, detail="Processamento não encontrado")
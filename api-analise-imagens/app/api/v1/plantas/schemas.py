@@ -5,7 +5,7 @@ class ProcessarPlantaRequest(BaseModel):
     loja_id: str = Field(..., description="ID da Loja para buscar a configuração da planta/share")
     imagem_base64: str = Field(
         ...,
-        description="String em base64 da imagem da planta baixa"
+        description="String em base64 da imagem da planta baixa (para arquivos grandes use /processar-upload)"
     )
     nome_arquivo: str = Field(
         ...,
@@ -15,6 +15,10 @@ class ProcessarPlantaRequest(BaseModel):
         "gpt-4o-mini",
         description="Modelo de LLM a usar para a análise visual"
     )
+    callback_url: Optional[HttpUrl] = Field(
+        None,
+        description="URL que recebe um POST assinado (HMAC) com o resultado ao concluir, dispensando o polling"
+    )
 
     class Config:
         json_schema_extra = {
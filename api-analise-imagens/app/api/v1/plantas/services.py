@@ -3,33 +3,31 @@ import json
 import os
 from typing import Dict, Literal, List, Any
 from sqlalchemy.orm import Session
-from openai import OpenAI
-from anthropic import Anthropic
-import google.generativeai as genai
-from app.config import settings
 from app.core.logging import logger
 from app.models.plantas.configuracao import PlantaConfiguracao
-
-from app.services.base_ocr_service import BaseOCRService
+from app.services.llm_clients import criar_cliente_llm
+from app.services.image_normalizer import normalizar_imagem
+from app.services.llm_rate_limiter import chamada_llm, estimar_tokens
 
 class PlantasService:
     """
     Serviço para análise de planogramas, extração de endereços via OCR e inteligência LLM.
     """
 
+    MAX_TOKENS_SAIDA = 2000
+    DETAIL_OPENAI = "high"  # Plantas têm texto pequeno; o OCR roda sempre na imagem original
+
     def __init__(self, db: Session, modelo_llm: str = "gpt-4o-mini"):
         self.db = db
         self.modelo_llm = modelo_llm
+        self.metricas_imagem: Dict = {}
+
+        # Import tardio: easyocr/torch só entram no processo que de fato roda OCR
+        from app.services.base_ocr_service import BaseOCRService
         self.ocr_service = BaseOCRService()
 
-        # Inicializar clientes conforme modelo
-        if modelo_llm.startswith("gpt"):
-            self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
-        elif modelo_llm.startswith("claude"):
-            self.client = Anthropic(api_key=settings.ANTHROPIC_API_KEY)
-        elif modelo_llm.startswith("gemini"):
-            genai.configure(api_key=settings.GOOGLE_API_KEY)
-            self.client = genai.GenerativeModel(modelo_llm)
+        # Inicializar cliente conforme modelo
+        self.client = criar_cliente_llm(modelo_llm)
 
         # Carregar prompt
         prompt_path = os.path.join(
@@ -79,15 +77,24 @@ class PlantasService:
 
         # 2. Acionar LLM para Classificar, Associar e Limpar os Dados
         logger.info(f"Acionando LLM com {len(lista_deteccoes)} blocos de texto nativos...")
-        
-        if self.modelo_llm.startswith("gpt"):
-            resultado_llm = self._analisar_com_openai(imagem_bytes, prompt_personalizado=prompt_enriquecido)
-        elif self.modelo_llm.startswith("claude"):
-            resultado_llm = self._analisar_com_anthropic(imagem_bytes, prompt_personalizado=prompt_enriquecido)
-        elif self.modelo_llm.startswith("gemini"):
-            resultado_llm = self._analisar_com_gemini(imagem_bytes, prompt_personalizado=prompt_enriquecido)
-        else:
-            raise ValueError(f"Modelo não suportado: {self.modelo_llm}")
+
+        imagem = normalizar_imagem(imagem_bytes, self.modelo_llm, detail=self.DETAIL_OPENAI)
+        self.metricas_imagem = imagem["metricas"]
+
+        # Capacidade no bucket RPM/TPM compartilhado entre workers antes de chamar o provedor
+        tokens = estimar_tokens(
+            self.modelo_llm, prompt_enriquecido, imagem["metricas"]["largura"], imagem["metricas"]["altura"],
+            self.DETAIL_OPENAI, self.MAX_TOKENS_SAIDA
+        )
+        with chamada_llm(self.modelo_llm, tokens):
+            if self.modelo_llm.startswith("gpt"):
+                resultado_llm = self._analisar_com_openai(imagem["bytes"], prompt_personalizado=prompt_enriquecido, media_type=imagem["media_type"])
+            elif self.modelo_llm.startswith("claude"):
+                resultado_llm = self._analisar_com_anthropic(imagem["bytes"], prompt_personalizado=prompt_enriquecido, media_type=imagem["media_type"])
+            elif self.modelo_llm.startswith("gemini"):
+                resultado_llm = self._analisar_com_gemini(imagem["bytes"], prompt_personalizado=prompt_enriquecido)
+            else:
+                raise ValueError(f"Modelo não suportado: {self.modelo_llm}")
 
         # 3. Consolidar Resposta do Contrato V2
         return self._consolidar_relatorio(resultado_llm)
@@ -139,7 +146,7 @@ class PlantasService:
         }
 
 
-    def _analisar_com_openai(self, imagem_bytes: bytes, prompt_personalizado: str = None) -> Dict:
+    def _analisar_com_openai(self, imagem_bytes: bytes, prompt_personalizado: str = None, media_type: str = "image/jpeg") -> Dict:
         imagem_base64 = base64.b64encode(imagem_bytes).decode('utf-8')
         prompt = prompt_personalizado if prompt_personalizado else self.PROMPT_ANALISE
         response = self.client.chat.completions.create(
@@ -149,27 +156,27 @@ class PlantasService:
                     "role": "user",
                     "content": [
                         {"type": "text", "text": prompt},
-                        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{imagem_base64}", "detail": "high"}}
+                        {"type": "image_url", "image_url": {"url": f"data:{media_type};base64,{imagem_base64}", "detail": self.DETAIL_OPENAI}}
                     ]
                 }
             ],
-            max_tokens=2000,
+            max_tokens=self.MAX_TOKENS_SAIDA,
             temperature=0.1,
             response_format={"type": "json_object"}
         )
         return json.loads(response.choices[0].message.content)
 
-    def _analisar_com_anthropic(self, imagem_bytes: bytes, prompt_personalizado: str = None) -> Dict:
+    def _analisar_com_anthropic(self, imagem_bytes: bytes, prompt_personalizado: str = None, media_type: str = "image/jpeg") -> Dict:
         imagem_base64 = base64.b64encode(imagem_bytes).decode('utf-8')
         prompt = prompt_personalizado if prompt_personalizado else self.PROMPT_ANALISE
         response = self.client.messages.create(
             model=self.modelo_llm,
-            max_tokens=2000,
+            max_tokens=self.MAX_TOKENS_SAIDA,
             temperature=0.1,
             messages=[{
                 "role": "user",
                 "content": [
-                    {"type": "image", "source": {"type": "base64", "media_type": "image/jpeg", "data": imagem_base64}},
+                    {"type": "image", "source": {"type": "base64", "media_type": media_type, "data": imagem_base64}},
                     {"type": "text", "text": prompt}
                 ]
             }]
@@ -186,7 +193,7 @@ class PlantasService:
         imagem = Image.open(io.BytesIO(imagem_bytes))
         response = self.client.generate_content(
             [prompt, imagem],
-            generation_config={"temperature": 0.1, "max_output_tokens": 2000}
+            generation_config={"temperature": 0.1, "max_output_tokens": self.MAX_TOKENS_SAIDA}
         )
         res_text = response.text
         if "```json" in res_text:
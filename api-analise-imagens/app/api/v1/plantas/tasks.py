@@ -1,41 +1,65 @@
-import base64
 import time
 from app.core.celery_app import celery_app
 from app.core.database import get_db_session
 from app.services.storage_service import StorageService
+from app.services.image_derivatives import salvar_derivados
+from app.services.eventos import publicar_conclusao
+from app.services.heartbeats import marcar_etapa
+from app.services.webhooks import agendar_webhook
 from app.api.v1.plantas.services import PlantasService
-from app.models.processamento import Processamento, StatusProcessamento
+from app.models.processamento import Processamento, StatusProcessamento, condicoes_por_id
 from app.core.logging import logger
+from app.services.llm_clients import eh_erro_rate_limit
+from app.services.llm_rate_limiter import LimiteTaxaLLM, reagendar_por_limite, retry_after_segundos
+from app.config import settings
+
+
+def _marcar_erro(processamento_id: str, mensagem: str) -> None:
+    """Estado final de ERRO: grava, publica a conclusão e agenda o webhook."""
+    with get_db_session() as db:
+        processamento = db.query(Processamento).filter(*condicoes_por_id(processamento_id)).first()
+        if processamento:
+            processamento.status = StatusProcessamento.ERRO
+            processamento.erro_mensagem = mensagem
+            db.commit()
+            publicar_conclusao(processamento_id, StatusProcessamento.ERRO.value)
+            agendar_webhook(processamento)
 
 
 @celery_app.task(name='plantas.processar_imagem', bind=True, max_retries=3)
 def processar_planta_task(
     self,
     processamento_id: str,
-    imagem_base64: str,
+    objeto_imagem: str,
     nome_arquivo: str,
     loja_id: str,
-    modelo_llm: str = "gpt-4o-mini"
+    modelo_llm: str = "gpt-4o-mini",
+    esperas_limite: int = 0
 ):
-    """Task assíncrona para processar dados de planta a partir de imagem."""
+    """
+    Task assíncrona para processar dados de planta a partir de imagem.
+
+    Args:
+        objeto_imagem: Chave do objeto no bucket 'plantas', gravado pela API (claim-check)
+        esperas_limite: Reagendamentos por falta de saldo no limitador de LLM até aqui;
+            não contam contra max_retries, que fica para as falhas de fato
+    """
     inicio = time.time()
 
     try:
-        # 1. Decodificar imagem  (sem DB aberto)
-        logger.info(f"[{processamento_id}] Decodificando imagem base64: {nome_arquivo}")
-        imagem_bytes = base64.b64decode(imagem_base64)
-
-        # 2. Salvar imagem no storage  (sem DB aberto)
+        # 1. Buscar imagem já armazenada pela API  (sem DB aberto)
+        logger.info(f"[{processamento_id}] Baixando planta do storage: {objeto_imagem}")
+        marcar_etapa(processamento_id, "download")
         storage = StorageService()
-        url_armazenada = storage.salvar_imagem(
-            bucket="plantas",
-            loja_id=loja_id,
-            nome_arquivo=nome_arquivo,
-            imagem_bytes=imagem_bytes
-        )
+        imagem_bytes = storage.obter_bytes("plantas", objeto_imagem)
+
+        # Thumb e variante LLM ao lado do original (best effort; chaves determinísticas,
+        # um retry apenas sobrescreve os mesmos objetos)
+        derivados = salvar_derivados("plantas", objeto_imagem, imagem_bytes)
 
-        # 3. PlantasService precisa de DB para consultar configurações — sessão aberta
+        # 2. PlantasService precisa de DB para consultar configurações — sessão aberta
         #    apenas durante o processamento e fechada ao sair do bloco
+        marcar_etapa(processamento_id, "mapeamento")
         with get_db_session() as db:
             plantas_service = PlantasService(db, modelo_llm=modelo_llm)
             resultado_auditoria = plantas_service.mapear_enderecos_planta(
@@ -45,23 +69,41 @@ def processar_planta_task(
 
             tempo_ms = int((time.time() - inicio) * 1000)
 
-            processamento = db.query(Processamento).filter_by(id=processamento_id).first()
+            processamento = db.query(Processamento).filter(*condicoes_por_id(processamento_id)).first()
             if processamento:
-                processamento.imagem_url = url_armazenada
                 processamento.resultado = {"plantas": resultado_auditoria}
+                processamento.meta_dados = {
+                    **(processamento.meta_dados or {}),
+                    "imagem_llm": plantas_service.metricas_imagem,
+                    **({"derivados": derivados} if derivados else {})
+                }
                 processamento.status = StatusProcessamento.CONCLUIDO
                 processamento.tempo_processamento_ms = tempo_ms
                 db.commit()
+                publicar_conclusao(processamento_id, StatusProcessamento.CONCLUIDO.value)
+                agendar_webhook(processamento)
 
         return {"status": "success", "processamento_id": processamento_id}
 
+    except LimiteTaxaLLM as e:
+        # Esperar saldo do LLM não é falha: o registro segue PROCESSANDO e volta quando o
+        # bucket tiver capacidade, com orçamento próprio de reagendamentos
+        if esperas_limite >= settings.LLM_RATE_LIMIT_MAX_REAGENDAMENTOS:
+            _marcar_erro(processamento_id, str(e))
+            raise
+        raise reagendar_por_limite(self, e, esperas_limite, e.espera_segundos)
+
     except Exception as e:
         logger.error(f"[{processamento_id}] Erro no processamento de plantas: {str(e)}")
-        with get_db_session() as db:
-            processamento = db.query(Processamento).filter_by(id=processamento_id).first()
-            if processamento:
-                processamento.status = StatusProcessamento.ERRO
-                processamento.erro_mensagem = str(e)
-                db.commit()
+        if eh_erro_rate_limit(e) and esperas_limite < settings.LLM_RATE_LIMIT_MAX_REAGENDAMENTOS:
+            # 429 do provedor: o bucket já foi pausado para todos os workers
+            pausa = retry_after_segundos(e) or settings.LLM_RATE_LIMIT_PAUSA_429_SEGUNDOS
+            raise reagendar_por_limite(self, e, esperas_limite, pausa)
 
-        raise self.retry(exc=e, countdown=2 ** self.request.retries)
+        falhas = self.request.retries - esperas_limite
+        # Durante os retries o registro segue PROCESSANDO: quem aguarda (wait=/SSE/webhook)
+        # trata qualquer outro status como final. ERRO só quando as tentativas acabam
+        if falhas >= self.max_retries or eh_erro_rate_limit(e):
+            _marcar_erro(processamento_id, str(e))
+            raise
+        raise self.retry(exc=e, countdown=2 ** falhas, max_retries=self.max_retries + esperas_limite)
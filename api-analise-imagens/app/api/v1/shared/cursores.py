@@ -0,0 +1,17 @@
+import base64
+import uuid
+from datetime import datetime
+from fastapi import HTTPException
+
+
+def codificar_cursor(momento: datetime, id: uuid.UUID) -> str:
+    """Cursor keyset opaco: base64 de '{timestamp iso}|{id}'."""
+    return base64.urlsafe_b64encode(f"{momento.isoformat()}|{id}".encode()).decode()
+
+
+def decodificar_cursor(cursor: str) -> tuple[datetime, uuid.UUID]:
+    try:
+        momento, id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(momento), uuid.UUID(id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
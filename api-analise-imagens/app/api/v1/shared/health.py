@@ -1,4 +1,7 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
+from fastapi.concurrency import run_in_threadpool
+from app.core.auth import verificar_api_key
+from app.core.metrics import obter_metricas
 
 router = APIRouter()
 
@@ -14,3 +17,9 @@ async def health_check():
             "analise_fotos": "ok"
         }
     }
+
+
+@router.get("/metricas")
+async def metricas(api_key = Depends(verificar_api_key)):
+    """Contadores operacionais agregados (cache, downloads, etc.)."""
+    return await run_in_threadpool(obter_metricas)
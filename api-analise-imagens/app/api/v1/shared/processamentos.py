@@ -1,38 +1,321 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.core.database import get_db
+import asyncio
+import json
+import uuid
+from datetime import datetime, timezone
+from enum import Enum
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.database import get_async_db, AsyncSessionLocal
 from app.core.auth import verificar_api_key
-from app.models.processamento import Processamento
-from typing import Optional
+from app.api.v1.shared.cursores import codificar_cursor, decodificar_cursor
+from app.models.processamento import (
+    AUDITORIA_MARCA,
+    AUDITORIA_NOTA,
+    AUDITORIA_STATUS,
+    AUDITORIA_TIPO_ATIVO,
+    META_NOME_ATIVO,
+    Processamento,
+    StatusProcessamento,
+    TipoProcessamento,
+    condicoes_por_id,
+)
+from app.services.eventos import ouvinte_eventos
+from app.services.image_derivatives import url_derivado
+from app.services.storage_urls import url_publica
+from typing import Literal, Optional
 
 router = APIRouter()
 
+CAMPOS_DISPONIVEIS = (
+    "id", "tipo", "loja_id", "nome_arquivo", "imagem_url", "status", "resultado",
+    "erro_mensagem", "tempo_processamento_ms", "meta_dados", "created_at", "updated_at",
+)
+LIMITE_PADRAO = 50
+LIMITE_MAXIMO = 500
+TAMANHO_LOTE_STREAM = 500  # Linhas por query no modo NDJSON
+ESPERA_MAXIMA_SEGUNDOS = 30  # Teto do wait= (abaixo dos timeouts usuais de proxy)
+SSE_PING_SEGUNDOS = 15  # Comentário keep-alive para proxies não fecharem o stream
+SSE_VERIFICACAO_SEGUNDOS = 60  # Releitura do banco caso um evento tenha se perdido
+SSE_DURACAO_MAXIMA_SEGUNDOS = 600  # O EventSource reconecta sozinho após o fim
+
+
+def _utc_naive(valor: Optional[datetime]) -> Optional[datetime]:
+    """created_at é gravado como UTC sem timezone; normaliza filtros com offset."""
+    if valor is not None and valor.tzinfo is not None:
+        return valor.astimezone(timezone.utc).replace(tzinfo=None)
+    return valor
+
+
+def _resolver_campos(campos: Optional[str]) -> list[str]:
+    """Valida a projeção pedida; id e created_at sempre entram porque formam o cursor."""
+    if not campos:
+        return list(CAMPOS_DISPONIVEIS)
+    pedidos = [c.strip() for c in campos.split(",") if c.strip()]
+    invalidos = [c for c in pedidos if c not in CAMPOS_DISPONIVEIS]
+    if invalidos:
+        raise HTTPException(status_code=400, detail=f"Campos inválidos: {invalidos}")
+    return [c for c in CAMPOS_DISPONIVEIS if c in pedidos or c in ("id", "created_at")]
+
+
+def _objeto_json(valor: Optional[str], parametro: str) -> Optional[dict]:
+    if not valor:
+        return None
+    try:
+        objeto = json.loads(valor)
+    except ValueError:
+        objeto = None
+    if not isinstance(objeto, dict):
+        raise HTTPException(status_code=400, detail=f"{parametro} deve ser um objeto JSON")
+    return objeto
+
+
+def _condicoes_jsonb(
+    status_auditoria: Optional[str],
+    nota_min: Optional[float],
+    nota_max: Optional[float],
+    tipo_ativo: Optional[str],
+    marca: Optional[str],
+    nome_ativo: Optional[str],
+    resultado_contem: Optional[str],
+    meta_contem: Optional[str],
+) -> list:
+    """Filtros sobre resultado/meta_dados, cada um coberto por um índice de expressão ou GIN."""
+    condicoes = []
+    if status_auditoria:
+        condicoes.append(AUDITORIA_STATUS == status_auditoria)
+    if nota_min is not None:
+        condicoes.append(AUDITORIA_NOTA >= nota_min)
+    if nota_max is not None:
+        condicoes.append(AUDITORIA_NOTA <= nota_max)
+    if tipo_ativo:
+        condicoes.append(AUDITORIA_TIPO_ATIVO == tipo_ativo)
+    if marca:
+        condicoes.append(AUDITORIA_MARCA == marca.lower())
+    if nome_ativo:
+        condicoes.append(META_NOME_ATIVO == nome_ativo.lower())
+    if (contem := _objeto_json(resultado_contem, "resultado_contem")) is not None:
+        condicoes.append(Processamento.resultado.contains(contem))
+    if (contem := _objeto_json(meta_contem, "meta_contem")) is not None:
+        condicoes.append(Processamento.meta_dados.contains(contem))
+    return condicoes
+
+
+def _montar_query(
+    campos: list[str],
+    tipo: Optional[TipoProcessamento],
+    loja_id: Optional[str],
+    status: Optional[StatusProcessamento],
+    criado_de: Optional[datetime],
+    criado_ate: Optional[datetime],
+    condicoes: Optional[list] = None,
+):
+    query = select(*[getattr(Processamento, c) for c in campos])
+    if condicoes:
+        query = query.where(*condicoes)
+    if tipo:
+        query = query.where(Processamento.tipo == tipo)
+    if loja_id:
+        query = query.where(Processamento.loja_id == loja_id)
+    if status:
+        query = query.where(Processamento.status == status)
+    if criado_de:
+        query = query.where(Processamento.created_at >= criado_de)
+    if criado_ate:
+        query = query.where(Processamento.created_at < criado_ate)
+    return query.order_by(Processamento.created_at.desc(), Processamento.id.desc())
+
+
+def _apos_cursor(query, created_at: datetime, id: uuid.UUID):
+    """
+    Keyset: próxima página = linhas estritamente anteriores a (created_at, id). A condição
+    redundante em created_at sozinho é a que o planner usa para podar partições mais novas.
+    """
+    return query.where(
+        tuple_(Processamento.created_at, Processamento.id) < tuple_(created_at, id),
+        Processamento.created_at <= created_at
+    )
+
+
+def _serializar(linha) -> dict:
+    item = {}
+    for campo, valor in linha._mapping.items():
+        if isinstance(valor, uuid.UUID):
+            valor = str(valor)
+        elif isinstance(valor, Enum):
+            valor = valor.value
+        elif isinstance(valor, datetime):
+            valor = valor.isoformat()
+        item[campo] = valor
+    if "imagem_url" in item:
+        # Referência interna -> URL pública (assinada ou CDN); leitura da imagem não passa pela API
+        item["imagem_url"] = url_publica(item["imagem_url"])
+    if "meta_dados" in item:
+        item["thumb_url"] = url_derivado(item["meta_dados"])
+    return item
+
+
+async def _stream_ndjson(query, cursor: Optional[tuple[datetime, uuid.UUID]]):
+    """
+    Exporta todas as linhas do filtro em NDJSON, uma página keyset por vez.
+
+    Cada página usa uma sessão curta própria: a sessão da dependency já foi fechada
+    quando o corpo começa a ser enviado, e uma transação aberta durante um download
+    lento cairia no idle_in_transaction_session_timeout.
+    """
+    while True:
+        pagina = _apos_cursor(query, *cursor) if cursor else query
+        async with AsyncSessionLocal() as db:
+            linhas = (await db.execute(pagina.limit(TAMANHO_LOTE_STREAM))).all()
+        if not linhas:
+            return
+        yield "".join(json.dumps(_serializar(l), ensure_ascii=False) + "\n" for l in linhas)
+        if len(linhas) < TAMANHO_LOTE_STREAM:
+            return
+        cursor = (linhas[-1].created_at, linhas[-1].id)
+
+
 @router.get("/")
 async def listar_processamentos(
-    tipo: Optional[str] = None,
+    tipo: Optional[TipoProcessamento] = None,
     loja_id: Optional[str] = None,
-    status: Optional[str] = None,
-    db: Session = Depends(get_db),
+    status: Optional[StatusProcessamento] = None,
+    criado_de: Optional[datetime] = Query(None, description="Inclui registros criados a partir desta data (UTC)"),
+    criado_ate: Optional[datetime] = Query(None, description="Inclui registros criados antes desta data (UTC)"),
+    status_auditoria: Optional[Literal["aprovado", "aprovado_com_ressalvas", "reprovado"]] = None,
+    nota_min: Optional[float] = Query(None, ge=0, le=10),
+    nota_max: Optional[float] = Query(None, ge=0, le=10),
+    tipo_ativo: Optional[str] = Query(None, description="Tipo de ativo classificado na auditoria (ex: ilha)"),
+    marca: Optional[str] = Query(None, description="Marca identificada na auditoria (sem diferenciar maiúsculas)"),
+    nome_ativo: Optional[str] = Query(None, description="Nome do ativo informado na submissão (sem diferenciar maiúsculas)"),
+    resultado_contem: Optional[str] = Query(None, description='Objeto JSON contido em resultado, ex: {"auditoria": {"visualizacao_ok": false}}'),
+    meta_contem: Optional[str] = Query(None, description='Objeto JSON contido em meta_dados, ex: {"cache": "hit"}'),
+    campos: Optional[str] = Query(None, description="Projeção separada por vírgula (ex: id,status,created_at)"),
+    cursor: Optional[str] = Query(None, description="Valor de proximo_cursor da página anterior"),
+    limite: int = Query(LIMITE_PADRAO, ge=1, le=LIMITE_MAXIMO),
+    formato: Literal["json", "ndjson"] = "json",
+    db: AsyncSession = Depends(get_async_db),
     api_key = Depends(verificar_api_key)
 ):
-    query = db.query(Processamento)
-    if tipo:
-        query = query.filter(Processamento.tipo == tipo)
-    if loja_id:
-        query = query.filter(Processamento.loja_id == loja_id)
-    if status:
-        query = query.filter(Processamento.status == status)
-    
-    processamentos = query.all()
-    return processamentos
+    """
+    Lista processamentos do mais recente para o mais antigo com paginação keyset em
+    (created_at, id). Em formato=ndjson, transmite todo o resultado do filtro a partir
+    do cursor, sem carregar a tabela em memória.
+    """
+    query = _montar_query(
+        _resolver_campos(campos), tipo, loja_id, status, _utc_naive(criado_de), _utc_naive(criado_ate),
+        _condicoes_jsonb(
+            status_auditoria, nota_min, nota_max, tipo_ativo, marca, nome_ativo, resultado_contem, meta_contem
+        )
+    )
+    posicao = decodificar_cursor(cursor) if cursor else None
+
+    if formato == "ndjson":
+        return StreamingResponse(_stream_ndjson(query, posicao), media_type="application/x-ndjson")
+
+    if posicao:
+        query = _apos_cursor(query, *posicao)
+    linhas = (await db.execute(query.limit(limite + 1))).all()
+
+    proximo_cursor = None
+    if len(linhas) > limite:
+        linhas = linhas[:limite]
+        proximo_cursor = codificar_cursor(linhas[-1].created_at, linhas[-1].id)
+
+    return {
+        "itens": [_serializar(l) for l in linhas],
+        "proximo_cursor": proximo_cursor,
+    }
+
+
+async def carregar_aguardando(db: AsyncSession, query, processamento_id: uuid.UUID, wait: float) -> Optional[Processamento]:
+    """
+    Long-poll: executa a query do processamento e, se ainda estiver PROCESSANDO, aguarda
+    até `wait` segundos pelo evento de conclusão publicado pelo worker antes de relê-la.
+    Sem evento (timeout), devolve o estado atual como uma consulta comum.
+    """
+    async with ouvinte_eventos.inscrever(processamento_id) as concluido:
+        processamento = (await db.execute(query)).scalar_one_or_none()
+        if not wait or processamento is None or processamento.status != StatusProcessamento.PROCESSANDO:
+            return processamento
+        # Devolve a conexão ao pool durante a espera; a releitura abre outra transação
+        await db.rollback()
+        try:
+            await asyncio.wait_for(concluido.wait(), timeout=wait)
+        except asyncio.TimeoutError:
+            pass
+    return (await db.execute(query)).scalar_one_or_none()
+
+
+def _dados_processamento(processamento: Processamento) -> dict:
+    dados = {coluna.name: getattr(processamento, coluna.name) for coluna in Processamento.__table__.columns}
+    dados["imagem_url"] = url_publica(processamento.imagem_url)
+    dados["thumb_url"] = url_derivado(processamento.meta_dados)
+    return dados
+
+
+async def _stream_eventos(id: uuid.UUID):
+    """
+    SSE de um processamento: envia o estado atual e, se ainda em andamento, o estado
+    final assim que o worker publicar a conclusão. Sessões curtas por leitura, como no NDJSON.
+    """
+    query = select(Processamento).where(*condicoes_por_id(id))
+    yield "retry: 3000\n\n"
+    inicio = asyncio.get_running_loop().time()
+    async with ouvinte_eventos.inscrever(id) as concluido:
+        while True:
+            concluido.clear()
+            async with AsyncSessionLocal() as db:
+                processamento = (await db.execute(query)).scalar_one_or_none()
+                dados = jsonable_encoder(_dados_processamento(processamento)) if processamento else None
+            if dados is None:
+                yield "event: erro\ndata: {\"detail\": \"Processamento não encontrado\"}\n\n"
+                return
+            yield f"event: processamento\ndata: {json.dumps(dados, ensure_ascii=False)}\n\n"
+            if processamento.status != StatusProcessamento.PROCESSANDO:
+                return
+
+            proxima_verificacao = asyncio.get_running_loop().time() + SSE_VERIFICACAO_SEGUNDOS
+            while not concluido.is_set():
+                agora = asyncio.get_running_loop().time()
+                if agora - inicio > SSE_DURACAO_MAXIMA_SEGUNDOS:
+                    return
+                if agora >= proxima_verificacao:
+                    break
+                try:
+                    await asyncio.wait_for(concluido.wait(), timeout=SSE_PING_SEGUNDOS)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+
+
+@router.get("/{id}/eventos")
+async def eventos_processamento(
+    id: uuid.UUID,
+    api_key = Depends(verificar_api_key)
+):
+    """
+    Server-Sent Events: `event: processamento` com o estado atual e, em seguida, com o
+    estado final assim que o worker concluir. O stream termina após o estado final.
+    """
+    return StreamingResponse(
+        _stream_eventos(id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 
 @router.get("/{id}")
 async def obter_processamento(
-    id: str,
-    db: Session = Depends(get_db),
+    id: uuid.UUID,
+    wait: float = Query(0, ge=0, le=ESPERA_MAXIMA_SEGUNDOS, description="Segundos a aguardar a conclusão antes de responder (long-poll)"),
+    db: AsyncSession = Depends(get_async_db),
     api_key = Depends(verificar_api_key)
 ):
-    processamento = db.query(Processamento).filter(Processamento.id == id).first()
+    processamento = await carregar_aguardando(
+        db, select(Processamento).where(*condicoes_por_id(id)), id, wait
+    )
     if not processamento:
         raise HTTPException(status_code=404, detail="Processamento não encontrado")
-    return processamento
+    return _dados_processamento(processamento)
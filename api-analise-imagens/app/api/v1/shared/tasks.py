@@ -1,10 +1,46 @@
+import json
+import random
 from datetime import datetime, timedelta
+from sqlalchemy import select, tuple_, update
+from app.config import settings
 from app.core.celery_app import celery_app
 from app.core.database import get_db_session
 from app.core.logging import logger
-from app.models.processamento import Processamento, StatusProcessamento
+from app.core.metrics import incrementar
+from app.models.processamento import Processamento, StatusProcessamento, condicoes_por_id
+from app.services.eventos import publicar_conclusao
+from app.services.heartbeats import descartar, registrar_reenvio, retirar_orfaos
+from app.services.particoes import manter_particoes
+from app.services.webhooks import (
+    TASK_ENTREGAR_WEBHOOKS,
+    EntregaWebhookError,
+    agendar_webhook,
+    entregar,
+    retirar_lote,
+)
 
 ZOMBIE_TIMEOUT_HORAS = 2
+TAMANHO_LOTE_ZUMBIS = 500
+# O que montar_evento/agendar_webhook leem do processamento: o sweeper não carrega a entidade
+COLUNAS_EVENTO = (
+    Processamento.id,
+    Processamento.tipo,
+    Processamento.status,
+    Processamento.loja_id,
+    Processamento.lote_id,
+    Processamento.resultado,
+    Processamento.erro_mensagem,
+    Processamento.imagem_url,
+    Processamento.meta_dados,
+)
+
+
+def condicoes_zumbi(limite: datetime) -> list:
+    """Filtro do sweeper; coberto pelo índice parcial ix_processamentos_processando_created_at."""
+    return [
+        Processamento.status == StatusProcessamento.PROCESSANDO,
+        Processamento.created_at < limite,
+    ]
 
 
 @celery_app.task(name='shared.cleanup_zumbis')
@@ -13,35 +49,168 @@ def cleanup_processamentos_zumbis():
     Sweeper agendado: move para ERRO registros presos em PROCESSANDO há mais de
     ZOMBIE_TIMEOUT_HORAS. Previne poluição do banco e facilita auditorias.
 
+    Jobs que chegaram a rodar são detectados em minutos por verificar_heartbeats; este
+    sweeper é a rede de segurança para os que nunca começaram (mensagem perdida no broker).
+
+    Um UPDATE ... RETURNING por lote de TAMANHO_LOTE_ZUMBIS linhas, cada um em sua
+    transação; SKIP LOCKED deixa de fora linhas que outro sweeper (ou o próprio worker
+    concluindo o job) esteja alterando, sem esperar nem corrigir duas vezes.
+
     Rodado via Celery Beat (ver celery_app.beat_schedule).
     """
     limite = datetime.utcnow() - timedelta(hours=ZOMBIE_TIMEOUT_HORAS)
+    mensagem = (
+        f"Timeout de processamento excedido após {ZOMBIE_TIMEOUT_HORAS}h "
+        f"(Zumbi Cleanup — {datetime.utcnow().isoformat()})"
+    )
+    alvos = (
+        select(Processamento.id, Processamento.created_at)
+        .where(*condicoes_zumbi(limite))
+        .limit(TAMANHO_LOTE_ZUMBIS)
+        .with_for_update(skip_locked=True)
+    )
+    corrigir = (
+        update(Processamento)
+        .where(tuple_(Processamento.id, Processamento.created_at).in_(alvos))
+        .values(status=StatusProcessamento.ERRO, erro_mensagem=mensagem)
+        .returning(*COLUNAS_EVENTO)
+        .execution_options(synchronize_session=False)
+    )
+
+    corrigidos = 0
+    with get_db_session() as db:
+        while True:
+            lote = db.execute(corrigir).all()
+            db.commit()
+            if not lote:
+                break
+
+            corrigidos += len(lote)
+            incrementar("zumbis.corrigidos", len(lote))
+            for proc in lote:
+                publicar_conclusao(proc.id, StatusProcessamento.ERRO.value)
+                agendar_webhook(proc)
+            if len(lote) < TAMANHO_LOTE_ZUMBIS:
+                break
+
+    if corrigidos:
+        logger.warning(f"[SweepZumbi] {corrigidos} registro(s) movido(s) para ERRO.")
+    else:
+        logger.info("[SweepZumbi] Nenhum processamento zumbi encontrado.")
+    return {"corrigidos": corrigidos}
+
+
+@celery_app.task(name='shared.verificar_heartbeats')
+def verificar_heartbeats():
+    """
+    Sweeper de curta cadência (beat a cada 30s): trata os jobs cujo heartbeat venceu,
+    isto é, que o worker deixou de executar sem concluir.
+
+    Reenvia a task com os mesmos argumentos até HEARTBEAT_MAX_REENVIOS vezes; depois
+    disso, ou sem os dados da task, move o processamento para ERRO. Sem órfãos custa um
+    ZRANGEBYSCORE no Redis e nenhuma consulta ao banco. Jobs que nunca começaram (fila
+    parada) não têm heartbeat e continuam com o sweeper de zumbis.
+    """
+    orfaos = dict(retirar_orfaos())
+    if not orfaos:
+        return {"reenviados": 0, "falhos": 0}
 
+    reenviados, falhos = 0, 0
     with get_db_session() as db:
-        zumbis = (
-            db.query(Processamento)
-            .filter(
+        pendentes = {str(id) for id in db.execute(
+            select(Processamento.id).where(
+                Processamento.id.in_(list(orfaos)),
                 Processamento.status == StatusProcessamento.PROCESSANDO,
-                Processamento.created_at < limite,
+                # Mais antigos que isso ficam com o sweeper de zumbis; o limite poda as partições
+                Processamento.created_at >= datetime.utcnow() - timedelta(hours=ZOMBIE_TIMEOUT_HORAS),
             )
-            .all()
-        )
+        ).scalars()}
 
-        if not zumbis:
-            logger.info("[SweepZumbi] Nenhum processamento zumbi encontrado.")
-            return {"corrigidos": 0}
+        for processamento_id, dados in orfaos.items():
+            if processamento_id not in pendentes:
+                # Concluiu entre o último heartbeat e a verificação
+                descartar(processamento_id)
+                continue
 
-        ids = [str(z.id) for z in zumbis]
-        logger.warning(f"[SweepZumbi] {len(zumbis)} zumbi(s) encontrado(s): {ids}")
+            etapa = dados.get("etapa", "desconhecida")
+            if dados.get("task") and int(dados.get("reenvios", 0)) < settings.HEARTBEAT_MAX_REENVIOS:
+                registrar_reenvio(processamento_id)
+                celery_app.send_task(
+                    dados["task"],
+                    args=json.loads(dados["args"]),
+                    kwargs=json.loads(dados.get("kwargs") or "{}"),
+                    ignore_result=True
+                )
+                logger.warning(
+                    f"[Heartbeats] {processamento_id} sem heartbeat na etapa '{etapa}' "
+                    f"(task {dados.get('task_id')}, {dados.get('worker')}); reenviado"
+                )
+                reenviados += 1
+                continue
 
-        for proc in zumbis:
-            proc.status = StatusProcessamento.ERRO
-            proc.erro_mensagem = (
-                f"Timeout de processamento excedido após {ZOMBIE_TIMEOUT_HORAS}h "
-                f"(Zumbi Cleanup — {datetime.utcnow().isoformat()})"
-            )
+            proc = db.execute(
+                update(Processamento)
+                .where(*condicoes_por_id(processamento_id), Processamento.status == StatusProcessamento.PROCESSANDO)
+                .values(
+                    status=StatusProcessamento.ERRO,
+                    erro_mensagem=(
+                        f"Worker interrompido na etapa '{etapa}' (task {dados.get('task_id', '-')}, "
+                        f"sem heartbeat por mais de {settings.HEARTBEAT_TOLERANCIA_SEGUNDOS}s)"
+                    )
+                )
+                .returning(*COLUNAS_EVENTO)
+                .execution_options(synchronize_session=False)
+            ).first()
+            db.commit()
+            descartar(processamento_id)
+            if proc:
+                falhos += 1
+                publicar_conclusao(processamento_id, StatusProcessamento.ERRO.value)
+                agendar_webhook(proc)
+
+    incrementar("heartbeats.reenviados", reenviados)
+    incrementar("heartbeats.orfaos_erro", falhos)
+    if falhos:
+        logger.warning(f"[Heartbeats] {falhos} processamento(s) órfão(s) movido(s) para ERRO.")
+    return {"reenviados": reenviados, "falhos": falhos}
+
+
+@celery_app.task(name='shared.manter_particoes', time_limit=6 * 3600, soft_time_limit=6 * 3600 - 60)
+def manter_particoes_task():
+    """
+    Manutenção diária das partições de processamentos (fila 'manutencao'): cria as dos
+    próximos meses e arquiva no storage as anteriores à retenção.
+
+    O arquivamento de uma partição grande passa bem do task_time_limit padrão.
+    """
+    return manter_particoes()
+
+
+@celery_app.task(name=TASK_ENTREGAR_WEBHOOKS, bind=True, max_retries=settings.WEBHOOK_MAX_TENTATIVAS)
+def entregar_webhooks_task(self, callback_url: str, eventos: list[dict] | None = None):
+    """
+    Entrega os eventos acumulados para um callback_url (fila 'webhooks').
+
+    Sem `eventos`, retira o lote da fila Redis do destino; nas novas tentativas o lote
+    segue nos argumentos da task, e o backoff exponencial não segura os demais destinos.
+    """
+    if eventos is None:
+        eventos, restantes = retirar_lote(callback_url)
+        if restantes:
+            # Mais eventos que o tamanho máximo do lote: a próxima entrega sai já
+            celery_app.send_task(TASK_ENTREGAR_WEBHOOKS, args=[callback_url], queue="webhooks", ignore_result=True)
+        if not eventos:
+            return {"entregues": 0}
 
-        db.commit()
-        logger.info(f"[SweepZumbi] {len(zumbis)} registro(s) movido(s) para ERRO.")
+    try:
+        entregar(callback_url, eventos)
+    except EntregaWebhookError as e:
+        if self.request.retries >= self.max_retries:
+            logger.error(f"[Webhooks] {len(eventos)} evento(s) descartado(s) após {self.max_retries} tentativas: {e}")
+            incrementar("webhooks.esgotados", len(eventos))
+            return {"entregues": 0, "descartados": len(eventos)}
+        countdown = min(3600, 10 * 2 ** self.request.retries) + random.uniform(0, 5)
+        logger.warning(f"[Webhooks] Falha na entrega ({e}); nova tentativa em {countdown:.0f}s")
+        raise self.retry(args=[callback_url, eventos], countdown=countdown)
 
-    return {"corrigidos": len(ids), "ids": ids}
+    return {"entregues": len(eventos)}
@@ -8,8 +8,24 @@ class Settings(BaseSettings):
     MINIO_ACCESS_KEY: str = "admin"
     MINIO_SECRET_KEY: str = "admin123"
     MINIO_SECURE: bool = False
+    MINIO_REGION: str = "us-east-1"  # Fixo: evita a consulta de região ao assinar URLs
+    # URLs entregues aos clientes: pré-assinadas contra o host público, ou via CDN
+    MINIO_PUBLIC_ENDPOINT: str | None = None  # ex.: 'storage.exemplo.com'; None = MINIO_ENDPOINT
+    MINIO_PUBLIC_SECURE: bool = True
+    STORAGE_PUBLIC_BASE_URL: str | None = None  # ex.: 'https://cdn.exemplo.com' (sem assinatura)
+    STORAGE_URL_EXPIRACAO_SEGUNDOS: int = 3600
+    STORAGE_URL_JANELA_SEGUNDOS: int = 900  # Assinatura estável na janela (cacheável)
+    STORAGE_URL_CACHE_CONTROL: str = "private, max-age=3600"
+    # Chave do objeto derivada do SHA-256 do conteúdo: imagens repetidas não são regravadas
+    STORAGE_CONTENT_ADDRESSED: bool = False
     
-    API_KEY: str
+    API_KEY: str  # Chave mestre (sem limite de taxa); clientes usam a tabela api_keys
+    API_KEY_CACHE_TTL_SEGUNDOS: int = 60
+    API_KEY_CACHE_TTL_NEGATIVO_SEGUNDOS: int = 10
+    API_KEY_FLUSH_USO_SEGUNDOS: int = 30  # Intervalo de gravação em lote de last_used_at
+    # Itens de lote por minuto de cada chave = rate_limit × este fator, num limite à parte
+    # do de requisições; também é o maior lote aceito (60 req/min => 1200 itens)
+    API_KEY_ITENS_LOTE_POR_REQUISICAO: int = 20
 
     # LLM APIs
     OPENAI_API_KEY: str = ""
@@ -19,6 +35,62 @@ class Settings(BaseSettings):
     # Modelo padrão
     DEFAULT_LLM_MODEL: str = "gpt-4o-mini"
 
+    # Limitador de taxa distribuído (token bucket no Redis) por provedor/modelo.
+    # Chave exata do modelo ou prefixo do provedor; valores = limites da conta no provedor
+    LLM_RATE_LIMIT_ATIVO: bool = True
+    LLM_LIMITES: dict[str, dict[str, int]] = {
+        "gpt": {"rpm": 500, "tpm": 200000},
+        "claude": {"rpm": 50, "tpm": 40000},
+        "gemini": {"rpm": 60, "tpm": 1000000},
+    }
+    LLM_RATE_LIMIT_ESPERA_MAXIMA_SEGUNDOS: float = 60.0  # Acima disso a task é reagendada
+    LLM_RATE_LIMIT_PAUSA_429_SEGUNDOS: float = 20.0  # Pausa quando o 429 não traz Retry-After
+    LLM_RATE_LIMIT_MAX_REAGENDAMENTOS: int = 20  # Reagendamentos por falta de saldo, à parte dos retries de erro
+
+    # Webhooks de conclusão (callback_url): eventos agrupados por destino e assinados (HMAC-SHA256)
+    WEBHOOK_SECRET: str = ""  # Obrigatório para aceitar callback_url: vazio recusa na submissão e descarta na entrega
+    WEBHOOK_HOSTS_PERMITIDOS: list[str] = []  # Hosts liberados mesmo resolvendo para IP interno/privado
+    WEBHOOK_JANELA_SEGUNDOS: int = 2  # Acúmulo de eventos do mesmo destino antes do POST
+    WEBHOOK_MAX_EVENTOS_LOTE: int = 100
+    WEBHOOK_TIMEOUT_SEGUNDOS: float = 10.0
+    WEBHOOK_MAX_TENTATIVAS: int = 8  # Backoff exponencial: ~40min até descartar
+
+    # Heartbeats dos jobs em execução (shared.verificar_heartbeats detecta os órfãos)
+    HEARTBEAT_INTERVALO_SEGUNDOS: int = 10
+    HEARTBEAT_TOLERANCIA_SEGUNDOS: int = 60  # Sem heartbeat por mais que isso = worker morto
+    HEARTBEAT_MAX_REENVIOS: int = 1  # Reenvios do job órfão antes de marcá-lo como ERRO
+
+    # Partições mensais de processamentos (beat shared.manter_particoes)
+    PARTICOES_FUTURAS: int = 3  # Meses criados à frente do corrente
+    PARTICAO_RETENCAO_MESES: int = 12  # Meses completos mantidos no banco; 0 = nunca arquiva
+    PARTICAO_ARQUIVO_BUCKET: str = "arquivo-processamentos"  # Partições expiradas em JSONL gzip
+
+    # OCR (EasyOCR)
+    OCR_DEVICE: str = "cpu"  # 'cpu' | 'gpu' | 'auto' — a imagem Docker instala torch CPU-only
+    OCR_IDIOMAS: list[str] = ["pt", "en"]
+    OCR_PRELOAD: bool = False  # Carrega o reader no worker_process_init (habilitar no worker-plantas)
+
+    # Cache de resultados de auditoria PDV (L1 em memória + L2 Redis)
+    CACHE_AUDITORIA_ATIVO: bool = True
+    CACHE_AUDITORIA_TTL_SEGUNDOS: int = 7 * 24 * 3600
+    CACHE_AUDITORIA_MAX_ITENS: int = 50000
+    CACHE_AUDITORIA_MAX_ITENS_L1: int = 512
+    AUDITORIA_PENDENTE_TTL_SEGUNDOS: int = 6 * 3600  # Auditoria já paga aguardando o upload (cobre os retries)
+
+    # Quase-duplicatas (dHash): distância até 3 tem recall garantido pelo lookup em 4 bandas
+    DUPLICATAS_ATIVO: bool = True
+    DUPLICATA_DISTANCIA_MAXIMA: int = 3
+    DUPLICATA_ACAO: str = "sinalizar"  # 'sinalizar' (marca em meta_dados) | 'reutilizar' (copia a auditoria)
+
+    # Download de imagens (cliente HTTP compartilhado por worker)
+    DOWNLOAD_MAX_BYTES: int = 25 * 1024 * 1024
+    DOWNLOAD_TIMEOUT_SEGUNDOS: float = 30.0
+
+    # Normalização de imagem antes do LLM (EXIF, downscale, re-encode)
+    NORMALIZACAO_ATIVA: bool = True
+    NORMALIZACAO_FORMATO: str = "JPEG"  # 'JPEG' | 'WEBP'
+    NORMALIZACAO_QUALIDADE: int = 85
+
     class Config:
         env_file = ".env"
 
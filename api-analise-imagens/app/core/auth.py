@@ -1,13 +1,161 @@
-from fastapi import Security, HTTPException, status
+import asyncio
+import hmac
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from fastapi import Security, HTTPException, Response, status
 from fastapi.security.api_key import APIKeyHeader
+from sqlalchemy import select, update
 from app.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.logging import logger
+from app.core.rate_limit import consumir
+from app.models.api_key import APIKey
 
 api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
 
-def verificar_api_key(api_key: str = Security(api_key_header)):
-    if not api_key or api_key != settings.API_KEY:
+
+@dataclass(frozen=True)
+class ChaveAPI:
+    """Dados da chave autenticada, mantidos em cache no processo da API."""
+    id: uuid.UUID | None
+    nome: str
+    cliente_id: str | None
+    rate_limit: int | None  # Requisições por minuto; None = sem limite
+
+
+# Chave de settings.API_KEY: uso interno/administrativo, sem limite de taxa
+CHAVE_MESTRE = ChaveAPI(id=None, nome="master", cliente_id=None, rate_limit=None)
+
+# Cache TTL de registros de api_keys (inclusive negativos): auth sem ida ao banco por requisição.
+# Uma chave desativada deixa de valer em até API_KEY_CACHE_TTL_SEGUNDOS.
+MAX_CHAVES_CACHE = 10000
+_cache_chaves: OrderedDict[str, tuple[ChaveAPI | None, float]] = OrderedDict()
+
+# last_used_at pendente por chave, gravado em lote por gravar_uso_chaves()
+_uso_pendente: dict[uuid.UUID, datetime] = {}
+
+
+async def _buscar_chave(api_key: str) -> ChaveAPI | None:
+    agora = time.monotonic()
+    em_cache = _cache_chaves.get(api_key)
+    if em_cache and em_cache[1] > agora:
+        _cache_chaves.move_to_end(api_key)
+        return em_cache[0]
+
+    async with AsyncSessionLocal() as db:
+        registro = (await db.execute(select(APIKey).where(APIKey.key == api_key))).scalar_one_or_none()
+
+    chave = None
+    if registro and registro.ativo:
+        chave = ChaveAPI(
+            id=registro.id,
+            nome=registro.nome,
+            cliente_id=registro.cliente_id,
+            rate_limit=registro.rate_limit or None
+        )
+    ttl = settings.API_KEY_CACHE_TTL_SEGUNDOS if chave else settings.API_KEY_CACHE_TTL_NEGATIVO_SEGUNDOS
+    _cache_chaves[api_key] = (chave, agora + ttl)
+    _cache_chaves.move_to_end(api_key)
+    if len(_cache_chaves) > MAX_CHAVES_CACHE:
+        _cache_chaves.popitem(last=False)
+    return chave
+
+
+async def verificar_api_key(response: Response, api_key: str = Security(api_key_header)) -> ChaveAPI:
+    """
+    Autentica o header X-API-Key contra a chave mestre ou a tabela api_keys e aplica
+    o limite por minuto da chave (janela deslizante no Redis), isolando clientes
+    ruidosos dos demais.
+    """
+    if not api_key:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="API Key inválida ou ausente",
         )
-    return api_key
+
+    if hmac.compare_digest(api_key.encode(), settings.API_KEY.encode()):
+        return CHAVE_MESTRE
+
+    chave = await _buscar_chave(api_key)
+    if chave is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="API Key inválida ou ausente",
+        )
+
+    if chave.rate_limit:
+        restantes = await _consumir_limite(chave, 1)
+        response.headers["X-RateLimit-Limit"] = str(chave.rate_limit)
+        response.headers["X-RateLimit-Remaining"] = str(restantes)
+
+    _uso_pendente[chave.id] = datetime.utcnow()
+    return chave
+
+
+async def _consumir_limite(chave: ChaveAPI, custo: int) -> int:
+    """Consome `custo` unidades do limite por minuto da chave; 429 com Retry-After se não houver saldo."""
+    permitido, restantes, espera = await consumir(f"apikey:{chave.id}", chave.rate_limit, custo)
+    if not permitido:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Limite de requisições da API Key excedido",
+            headers={"Retry-After": str(int(espera)), "X-RateLimit-Limit": str(chave.rate_limit)},
+        )
+    return restantes
+
+
+def limite_itens_lote(chave: ChaveAPI) -> int:
+    """Itens de lote por minuto da chave; é também o maior lote que ela pode enviar."""
+    return chave.rate_limit * settings.API_KEY_ITENS_LOTE_POR_REQUISICAO
+
+
+async def cobrar_itens(chave: ChaveAPI, response: Response, itens: int) -> None:
+    """
+    Cobra os itens de uma submissão em lote no limite de itens da chave, à parte do
+    limite de requisições (que a própria chamada já consumiu em verificar_api_key).
+    """
+    if not chave.rate_limit:
+        return
+    limite = limite_itens_lote(chave)
+    if itens > limite:
+        # Nunca caberia na janela: esperar não adianta, o lote precisa ser dividido
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Lote de {itens} itens acima do máximo de {limite} da API Key; divida o lote",
+        )
+    permitido, restantes, espera = await consumir(f"apikey-itens:{chave.id}", limite, itens)
+    if not permitido:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Limite de itens de lote por minuto da API Key excedido",
+            headers={"Retry-After": str(int(espera)), "X-RateLimit-Items-Limit": str(limite)},
+        )
+    response.headers["X-RateLimit-Items-Limit"] = str(limite)
+    response.headers["X-RateLimit-Items-Remaining"] = str(restantes)
+
+
+async def gravar_uso_chaves() -> None:
+    """Grava last_used_at das chaves usadas desde a última chamada em um único UPDATE em lote."""
+    if not _uso_pendente:
+        return
+    pendentes = dict(_uso_pendente)
+    _uso_pendente.clear()
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(APIKey),
+            [{"id": id, "last_used_at": usado_em} for id, usado_em in pendentes.items()]
+        )
+        await db.commit()
+
+
+async def loop_gravacao_uso() -> None:
+    """Tarefa de fundo da API: descarrega last_used_at a cada API_KEY_FLUSH_USO_SEGUNDOS."""
+    while True:
+        await asyncio.sleep(settings.API_KEY_FLUSH_USO_SEGUNDOS)
+        try:
+            await gravar_uso_chaves()
+        except Exception as e:
+            logger.warning(f"[Auth] Falha ao gravar last_used_at das API Keys: {e}")
@@ -1,5 +1,6 @@
 import socket
 from celery import Celery
+from celery.signals import worker_process_init
 from app.config import settings
 
 celery_app = Celery(
@@ -13,6 +14,10 @@ celery_app.conf.update(
     task_routes={
         'plantas.*': {'queue': 'plantas'},
         'analise_fotos.*': {'queue': 'analise_fotos'},
+        'shared.entregar_webhooks': {'queue': 'webhooks'},
+        'shared.cleanup_zumbis': {'queue': 'manutencao'},
+        'shared.verificar_heartbeats': {'queue': 'manutencao'},
+        'shared.manter_particoes': {'queue': 'manutencao'},
     },
     task_serializer='json',
     accept_content=['json'],
@@ -59,10 +64,36 @@ celery_app.autodiscover_tasks([
     'app.api.v1.shared',
 ])
 
-# Agendamento do sweeper de zumbis (requer celery beat rodando)
+# Agendamento dos sweepers e da manutenção de partições (requer celery beat rodando)
 celery_app.conf.beat_schedule = {
     'cleanup-zumbis-a-cada-hora': {
         'task': 'shared.cleanup_zumbis',
         'schedule': 3600.0,  # a cada 1 hora
     },
+    'verificar-heartbeats': {
+        'task': 'shared.verificar_heartbeats',
+        'schedule': 30.0,
+        'options': {'expires': 30},  # Com o worker parado, não acumula execuções atrasadas
+    },
+    'manter-particoes-diariamente': {
+        'task': 'shared.manter_particoes',
+        'schedule': 24 * 3600.0,
+    },
 }
+
+
+@worker_process_init.connect
+def inicializar_processo_worker(**kwargs):
+    """
+    Executado em cada processo filho do worker (prefork) antes de receber tasks.
+
+    Pré-carrega o reader do EasyOCR quando OCR_PRELOAD está habilitado, para que a
+    primeira task de plantas não pague o custo de carregar os pesos do modelo, e
+    abre o cliente MinIO do processo já com os buckets verificados.
+    """
+    from app.services.storage_service import preparar_storage
+    preparar_storage()
+
+    if settings.OCR_PRELOAD:
+        from app.services.base_ocr_service import obter_reader
+        obter_reader()
@@ -1,6 +1,7 @@
 from contextlib import contextmanager
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from app.config import settings
 
 engine = create_engine(
@@ -18,8 +19,33 @@ engine = create_engine(
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
+def _url_asyncpg(url: str) -> str:
+    """Converte a DATABASE_URL do driver psycopg2 para o driver asyncpg."""
+    for prefixo in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefixo):
+            return "postgresql+asyncpg://" + url[len(prefixo):]
+    return url
+
+
+# Engine assíncrona para os endpoints FastAPI — mesmas políticas de pool da engine síncrona,
+# que continua servindo Celery tasks e scripts
+async_engine = create_async_engine(
+    _url_asyncpg(settings.DATABASE_URL),
+    pool_pre_ping=True,
+    pool_recycle=1800,
+    pool_size=5,
+    max_overflow=10,
+    pool_timeout=30,
+    connect_args={
+        "server_settings": {"idle_in_transaction_session_timeout": "30000"}
+    }
+)
+
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+
 def get_db():
-    """Dependency para uso via FastAPI Depends (endpoints)."""
+    """Dependency síncrona (legado) — bloqueia o event loop se usada em endpoints async."""
     db = SessionLocal()
     try:
         yield db
@@ -27,6 +53,12 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    """Dependency para uso via FastAPI Depends (endpoints async)."""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 @contextmanager
 def get_db_session():
     """Context manager para uso em Celery tasks e código imperativo."""
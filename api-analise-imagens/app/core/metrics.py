@@ -0,0 +1,22 @@
+"""
+Contadores operacionais agregados no Redis (hash 'metricas').
+
+Compartilhados por API e workers; consultáveis em GET /api/v1/metricas.
+Falhas de Redis nunca propagam — métricas são best-effort.
+"""
+from app.core.logging import logger
+from app.core.redis_client import obter_redis
+
+CHAVE_METRICAS = "metricas"
+
+
+def incrementar(nome: str, valor: int = 1) -> None:
+    try:
+        obter_redis().hincrby(CHAVE_METRICAS, nome, valor)
+    except Exception as e:
+        logger.warning(f"[Metricas] Falha ao incrementar {nome}: {e}")
+
+
+def obter_metricas() -> dict[str, int]:
+    bruto = obter_redis().hgetall(CHAVE_METRICAS)
+    return {k.decode(): int(v) for k, v in sorted(bruto.items())}
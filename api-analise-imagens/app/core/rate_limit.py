@@ -0,0 +1,59 @@
+import math
+from app.core.logging import logger
+from app.core.redis_client import obter_redis_async
+
+JANELA_MS = 60000
+
+# Janela deslizante aproximada por dois contadores fixos (minuto atual e anterior, este
+# ponderado pela fração ainda dentro da janela): O(1) em memória por chave, sem o zset
+# de timestamps por requisição. ARGV[3] é o custo (unidades consumidas de uma vez).
+# Retorna {1, restante} ou {0, ms até liberar}.
+_SCRIPT_JANELA = """
+local agora = redis.call('TIME')
+local t = tonumber(agora[1]) * 1000 + math.floor(tonumber(agora[2]) / 1000)
+local limite = tonumber(ARGV[1])
+local janela = tonumber(ARGV[2])
+local custo = tonumber(ARGV[3])
+local id_atual = math.floor(t / janela)
+local chave_atual = KEYS[1] .. ':' .. id_atual
+local anterior = tonumber(redis.call('GET', KEYS[1] .. ':' .. (id_atual - 1))) or 0
+local atual = tonumber(redis.call('GET', chave_atual)) or 0
+local decorrido = (t % janela) / janela
+local estimado = anterior * (1 - decorrido) + atual
+
+if estimado + custo > limite then
+    local espera
+    if anterior > 0 and atual + custo <= limite then
+        espera = math.ceil((1 - (limite - custo - atual) / anterior - decorrido) * janela)
+    else
+        espera = math.ceil(janela - (t % janela))
+    end
+    return {0, math.max(espera, 1)}
+end
+
+redis.call('INCRBY', chave_atual, custo)
+redis.call('PEXPIRE', chave_atual, janela * 2)
+return {1, math.max(0, math.floor(limite - estimado - custo))}
+"""
+
+
+async def consumir(identificador: str, limite_por_minuto: int, custo: int = 1) -> tuple[bool, int, float]:
+    """
+    Registra `custo` requisições na janela deslizante de 1 minuto do identificador.
+    Nada é consumido quando não há saldo para o custo inteiro.
+
+    Returns:
+        (permitido, restantes na janela, segundos até liberar quando bloqueado)
+    """
+    try:
+        permitido, valor = await obter_redis_async().eval(
+            _SCRIPT_JANELA, 1, f"ratelimit:{identificador}", limite_por_minuto, JANELA_MS, custo
+        )
+    except Exception as e:
+        # Redis indisponível não derruba a API: a requisição segue sem limitação
+        logger.warning(f"[RateLimit] Falha ao consultar janela de {identificador}: {e}")
+        return True, limite_por_minuto, 0.0
+
+    if permitido:
+        return True, int(valor), 0.0
+    return False, 0, math.ceil(int(valor) / 1000)
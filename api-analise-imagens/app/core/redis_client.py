@@ -0,0 +1,47 @@
+import os
+import redis
+import redis.asyncio as aioredis
+from app.config import settings
+
+_cliente: redis.Redis | None = None
+_cliente_pid: int | None = None
+
+
+def obter_redis() -> redis.Redis:
+    """
+    Cliente Redis compartilhado do processo (pool de conexões próprio).
+
+    Recriado quando o PID muda: processos filhos do prefork do Celery não podem
+    reaproveitar sockets herdados do processo pai.
+    """
+    global _cliente, _cliente_pid
+    if _cliente is None or _cliente_pid != os.getpid():
+        _cliente = redis.Redis.from_url(
+            settings.REDIS_URL,
+            socket_keepalive=True,
+            socket_connect_timeout=5,
+            socket_timeout=5,
+            health_check_interval=30,
+        )
+        _cliente_pid = os.getpid()
+    return _cliente
+
+
+_cliente_async: aioredis.Redis | None = None
+
+
+def obter_redis_async() -> aioredis.Redis:
+    """
+    Cliente Redis assíncrono da API, para uso dentro do event loop (auth, rate limit)
+    sem bloquear outras requisições.
+    """
+    global _cliente_async
+    if _cliente_async is None:
+        _cliente_async = aioredis.Redis.from_url(
+            settings.REDIS_URL,
+            socket_keepalive=True,
+            socket_connect_timeout=5,
+            socket_timeout=5,
+            health_check_interval=30,
+        )
+    return _cliente_async
@@ -0,0 +1,58 @@
+"""
+Assinaturas das tasks Celery, referenciadas apenas pelo nome.
+
+O processo da API só enfileira jobs. Importar os módulos de tasks traria junto os
+serviços de OCR/LLM (torch, easyocr, cv2, SDKs de LLM) para cada réplica do uvicorn,
+então os endpoints montam as assinaturas por nome e o Celery publica via send_task.
+
+O resultado de cada job é gravado em processamentos, nunca lido do backend do Celery:
+ignore_result evita que a API assine o canal de resultado (SUBSCRIBE no Redis) a cada
+publicação e que o worker grave o retorno no backend.
+"""
+from celery import Signature
+from app.core.celery_app import celery_app
+
+TASK_PROCESSAR_PLANTA = "plantas.processar_imagem"
+TASK_AUDITORIA_PDV = "analise_fotos.processar_auditoria_pdv"
+
+
+def assinatura_processar_planta(
+    processamento_id: str,
+    objeto_imagem: str,
+    nome_arquivo: str,
+    loja_id: str,
+    modelo_llm: str
+) -> Signature:
+    return celery_app.signature(
+        TASK_PROCESSAR_PLANTA,
+        args=[processamento_id, objeto_imagem, nome_arquivo, loja_id, modelo_llm],
+        queue="plantas",
+        ignore_result=True
+    )
+
+
+def assinatura_auditoria_pdv(
+    processamento_id: str,
+    imagem_url: str,
+    modelo_llm: str,
+    nome_ativo: str | None,
+    ignorar_cache: bool = False
+) -> Signature:
+    return celery_app.signature(
+        TASK_AUDITORIA_PDV,
+        args=[processamento_id, imagem_url, modelo_llm, nome_ativo, ignorar_cache],
+        queue="analise_fotos",
+        ignore_result=True
+    )
+
+
+def publicar_lote(assinaturas: list[Signature]) -> None:
+    """
+    Publica várias assinaturas reutilizando um único producer (uma conexão com o broker).
+
+    Equivale ao envio de um celery.group sem a barreira de resultados: o group registra
+    cada membro no backend de resultados (SUBSCRIBE por task), que este fluxo não usa.
+    """
+    with celery_app.producer_or_acquire() as producer:
+        for assinatura in assinaturas:
+            assinatura.apply_async(producer=producer)
@@ -1,9 +1,15 @@
 from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from app.api.v1.router import api_v1_router
 from app.core.logging import setup_logging, logger
 from app.core.exceptions import APIException
+from app.core.database import async_engine
+from app.core.auth import gravar_uso_chaves, loop_gravacao_uso
+from app.services.eventos import ouvinte_eventos
+from app.services.storage_service import preparar_storage
+import asyncio
 import time
 
 app = FastAPI(
@@ -66,5 +72,33 @@ async def root():
 async def health():
     return {"status": "healthy"}
 
+@app.on_event("startup")
+async def inicializar_storage():
+    await run_in_threadpool(preparar_storage)
+
+@app.on_event("startup")
+async def iniciar_gravacao_uso_chaves():
+    app.state.tarefa_uso_chaves = asyncio.create_task(loop_gravacao_uso())
+
+@app.on_event("shutdown")
+async def parar_gravacao_uso_chaves():
+    app.state.tarefa_uso_chaves.cancel()
+    try:
+        await gravar_uso_chaves()
+    except Exception as e:
+        logger.warning(f"Falha ao gravar last_used_at no shutdown: {e}")
+
+@app.on_event("startup")
+async def iniciar_ouvinte_eventos():
+    ouvinte_eventos.iniciar()
+
+@app.on_event("shutdown")
+async def parar_ouvinte_eventos():
+    await ouvinte_eventos.parar()
+
+@app.on_event("shutdown")
+async def fechar_pool_banco():
+    await async_engine.dispose()
+
 # Setup logging
 setup_logging()
@@ -0,0 +1,22 @@
+from sqlalchemy import Column, String, Integer, BigInteger, DateTime
+from sqlalchemy.dialects.postgresql import UUID
+import uuid
+from datetime import datetime
+from app.models.base import Base
+
+class ImagemHash(Base):
+    """Índice de hashes perceptuais (dHash) das imagens auditadas, para detectar quase-duplicatas."""
+    __tablename__ = "analise_fotos_hashes"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    processamento_id = Column(UUID(as_uuid=True), nullable=False, index=True)  # Sem FK: processamentos é particionada
+    loja_id = Column(String(100), nullable=True, index=True)
+    dhash = Column(BigInteger, nullable=False)
+    # Bandas de 16 bits do dHash — lookup por igualdade indexada (ver perceptual_hash.bandas)
+    banda_0 = Column(Integer, nullable=False, index=True)
+    banda_1 = Column(Integer, nullable=False, index=True)
+    banda_2 = Column(Integer, nullable=False, index=True)
+    banda_3 = Column(Integer, nullable=False, index=True)
+    duplicata_de = Column(UUID(as_uuid=True), nullable=True)  # Processamento mais próximo já auditado
+    distancia = Column(Integer, nullable=True)  # Distância de Hamming até duplicata_de
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, JSON, DateTime, Float, ForeignKey
+from sqlalchemy import Column, String, JSON, DateTime, Float
 from sqlalchemy.dialects.postgresql import UUID
 import uuid
 from datetime import datetime
@@ -8,7 +8,7 @@ class AnaliseFotoResultado(Base):
     __tablename__ = "analise_fotos_resultados"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    processamento_id = Column(UUID(as_uuid=True), ForeignKey('processamentos.id'), nullable=False)
+    processamento_id = Column(UUID(as_uuid=True), nullable=False)  # Sem FK: processamentos é particionada
     tipo_analise = Column(String(50), nullable=False)  # 'classificacao', 'ocr', 'objetos'
     resultado = Column(JSON, nullable=False)
     confidence = Column(Float, nullable=True)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Float, JSON, DateTime, ForeignKey
+from sqlalchemy import Column, String, Integer, Float, JSON, DateTime
 from sqlalchemy.dialects.postgresql import UUID
 import uuid
 from datetime import datetime
@@ -8,7 +8,7 @@ class PlantaEndereco(Base):
     __tablename__ = "plantas_enderecos"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    processamento_id = Column(UUID(as_uuid=True), ForeignKey('processamentos.id'), nullable=False)
+    processamento_id = Column(UUID(as_uuid=True), nullable=False)  # Sem FK: processamentos é particionada
     codigo = Column(String(50), nullable=False)
     tipo_endereco_id = Column(Integer, nullable=False)
     categoria_id = Column(Integer, nullable=True)
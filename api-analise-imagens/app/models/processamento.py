@@ -1,7 +1,9 @@
-from sqlalchemy import Column, String, Integer, JSON, DateTime, Text, Enum
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, String, Integer, DateTime, Text, Enum, Index, func, literal, text
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+import os
+import time
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 import enum
 from app.models.base import Base
 
@@ -14,18 +16,108 @@ class StatusProcessamento(str, enum.Enum):
     CONCLUIDO = "concluido"
     ERRO = "erro"
 
+# Tolerância entre o instante embutido no id e o created_at gravado (mesmo relógio, mas
+# o registro pode ser criado um pouco depois do id)
+JANELA_ID = timedelta(days=1)
+
+
+def novo_id() -> uuid.UUID:
+    """
+    UUIDv7 (RFC 9562): 48 bits de timestamp em ms seguidos de bits aleatórios.
+
+    Ids ordenados no tempo mantêm as inserções no fim dos índices e permitem localizar
+    a partição mensal de um processamento só pelo id (ver condicoes_por_id).
+    """
+    valor = (time.time_ns() // 1_000_000) << 80 | int.from_bytes(os.urandom(10), "big")
+    valor = valor & ~(0xF << 76) | 0x7 << 76  # versão 7
+    valor = valor & ~(0x3 << 62) | 0x2 << 62  # variante RFC 4122
+    return uuid.UUID(int=valor)
+
+
+def momento_do_id(id: uuid.UUID | str) -> datetime | None:
+    """Instante (UTC) embutido em um UUIDv7; None para ids v4 anteriores ao particionamento."""
+    id = id if isinstance(id, uuid.UUID) else uuid.UUID(str(id))
+    if id.version != 7:
+        return None
+    return datetime.utcfromtimestamp((id.int >> 80) / 1000)
+
+
 class Processamento(Base):
     __tablename__ = "processamentos"
+    # Particionada por mês em created_at (ver migration f3b8a6d1c047 e shared.manter_particoes):
+    # a chave de partição precisa fazer parte da PK, e FKs para esta tabela não são suportadas
+    __table_args__ = (
+        Index("ix_processamentos_created_at_id", "created_at", "id"),  # Paginação keyset
+        Index("ix_processamentos_lote_updated_at_id", "lote_id", "updated_at", "id"),  # Status do lote / mudanças desde o cursor
+        # Listagem filtrada por tipo/loja/status já na ordem do keyset
+        Index("ix_processamentos_tipo_loja_status_created_at", "tipo", "loja_id", "status", "created_at", "id"),
+        # Sweeper de zumbis: só as linhas em andamento, uma fração mínima da tabela
+        Index(
+            "ix_processamentos_processando_created_at", "created_at",
+            postgresql_where=text("status = 'PROCESSANDO'")
+        ),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    tipo = Column(Enum(TipoProcessamento), nullable=False, index=True)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=novo_id)
+    tipo = Column(Enum(TipoProcessamento), nullable=False)
     loja_id = Column(String(100), nullable=True, index=True)  # Apenas para plantas
     nome_arquivo = Column(String(255), nullable=False)
     imagem_url = Column(Text, nullable=False)
-    status = Column(Enum(StatusProcessamento), default=StatusProcessamento.PROCESSANDO, index=True)
-    resultado = Column(JSON, nullable=True)  # Resultado específico por tipo
+    imagem_sha256 = Column(String(64), nullable=True, index=True)  # Blob endereçado por conteúdo
+    status = Column(Enum(StatusProcessamento), default=StatusProcessamento.PROCESSANDO)
+    resultado = Column(JSONB, nullable=True)  # Resultado específico por tipo
     erro_mensagem = Column(Text, nullable=True)
     tempo_processamento_ms = Column(Integer, nullable=True)
-    meta_dados = Column(JSON, nullable=True)  # Dados adicionais flexíveis
-    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    meta_dados = Column(JSONB, nullable=True)  # Dados adicionais flexíveis
+    lote_id = Column(UUID(as_uuid=True), nullable=True)  # Submissão em lote (auditar-pdv/lote)
+    created_at = Column(DateTime, primary_key=True, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+def janela_do_id(id: uuid.UUID | str, coluna=None) -> list:
+    """
+    Restringe created_at ao redor do instante do UUIDv7 para o planner podar as partições
+    que não podem conter o registro. Vazio para ids v4 (todas as partições são consultadas).
+    """
+    momento = momento_do_id(id)
+    if momento is None:
+        return []
+    coluna = Processamento.created_at if coluna is None else coluna
+    return [coluna >= momento - JANELA_ID, coluna < momento + JANELA_ID]
+
+
+def condicoes_por_id(id: uuid.UUID | str) -> list:
+    """Busca por id tocando só a partição do mês em que o processamento foi criado."""
+    return [Processamento.id == id, *janela_do_id(id)]
+
+
+def _chave(nome: str):
+    """Chave JSON renderizada como literal no SQL: como parâmetro, o plano genérico do
+    prepared statement não casaria com a expressão do índice."""
+    return literal(nome, String, literal_execute=True)
+
+
+# Chaves JSONB consultadas nos filtros: a mesma expressão define o índice e a condição,
+# para que o planner reconheça o índice de expressão
+_AUDITORIA = Processamento.resultado[_chave("auditoria")]
+AUDITORIA_STATUS = _AUDITORIA[_chave("status")].astext
+AUDITORIA_NOTA = _AUDITORIA[_chave("nota")].as_float()
+AUDITORIA_TIPO_ATIVO = _AUDITORIA[_chave("tipo_ativo")].astext
+AUDITORIA_MARCA = func.lower(_AUDITORIA[_chave("marca")].astext)
+META_NOME_ATIVO = func.lower(Processamento.meta_dados[_chave("nome_ativo")].astext)
+
+Index("ix_processamentos_auditoria_status", AUDITORIA_STATUS)
+Index("ix_processamentos_auditoria_nota", AUDITORIA_NOTA)
+Index("ix_processamentos_auditoria_tipo_ativo", AUDITORIA_TIPO_ATIVO)
+Index("ix_processamentos_auditoria_marca", AUDITORIA_MARCA)
+Index("ix_processamentos_meta_nome_ativo", META_NOME_ATIVO)
+# Containment (@>) em qualquer chave; jsonb_path_ops: índice menor, só para @>
+Index(
+    "ix_processamentos_resultado_gin", Processamento.resultado,
+    postgresql_using="gin", postgresql_ops={"resultado": "jsonb_path_ops"}
+)
+Index(
+    "ix_processamentos_meta_dados_gin", Processamento.meta_dados,
+    postgresql_using="gin", postgresql_ops={"meta_dados": "jsonb_path_ops"}
+)
@@ -1,14 +1,93 @@
 import easyocr
 import cv2
 import numpy as np
+import os
+import threading
+import time
 from typing import List, Dict
 import base64
+from app.config import settings
+from app.core.logging import logger
+
+# Registro de readers por processo: chave = (idiomas, gpu)
+_readers: Dict[tuple, easyocr.Reader] = {}
+_readers_lock = threading.Lock()
+
+
+def _rss_mb() -> float:
+    """Memória residente atual do processo em MB (Linux: /proc/self/statm)."""
+    try:
+        with open("/proc/self/statm") as f:
+            paginas_residentes = int(f.read().split()[1])
+        return round(paginas_residentes * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+def _usar_gpu() -> bool:
+    """
+    Resolve o modo de execução do OCR.
+
+    OCR_DEVICE='cpu' força CPU (padrão — a imagem Docker instala torch CPU-only),
+    'gpu' força CUDA e 'auto' usa GPU apenas se torch enxergar um device CUDA.
+    """
+    modo = settings.OCR_DEVICE.lower()
+    if modo == "gpu":
+        return True
+    if modo == "auto":
+        import torch
+        return torch.cuda.is_available()
+    return False
+
+
+def obter_reader() -> easyocr.Reader:
+    """
+    Retorna o reader EasyOCR compartilhado do processo, carregando-o na primeira chamada.
+
+    O carregamento dos pesos (detector + reconhecedor) leva segundos e centenas de MB;
+    por isso o reader é criado uma única vez por processo e reutilizado por todas as tasks.
+    """
+    idiomas = tuple(settings.OCR_IDIOMAS)
+    gpu = _usar_gpu()
+    chave = (idiomas, gpu)
+
+    reader = _readers.get(chave)
+    if reader is not None:
+        return reader
+
+    with _readers_lock:
+        reader = _readers.get(chave)
+        if reader is None:
+            rss_antes = _rss_mb()
+            inicio = time.time()
+            reader = easyocr.Reader(list(idiomas), gpu=gpu)
+            _aquecer_reader(reader)
+            logger.info(
+                "ocr_reader_carregado",
+                extra={
+                    "idiomas": list(idiomas),
+                    "gpu": gpu,
+                    "tempo_carga_ms": int((time.time() - inicio) * 1000),
+                    "rss_antes_mb": rss_antes,
+                    "rss_depois_mb": _rss_mb(),
+                }
+            )
+            _readers[chave] = reader
+    return reader
+
+
+def _aquecer_reader(reader: easyocr.Reader) -> None:
+    """Executa uma inferência descartável para inicializar kernels e buffers do torch."""
+    imagem = np.full((64, 256), 255, dtype=np.uint8)
+    cv2.putText(imagem, "C01", (8, 48), cv2.FONT_HERSHEY_SIMPLEX, 1.5, 0, 3)
+    reader.readtext(imagem)
+
 
 class BaseOCRService:
     """Serviço base de OCR compartilhado entre módulos."""
 
     def __init__(self):
-        self.reader = easyocr.Reader(['pt', 'en'], gpu=True)
+        self.reader = obter_reader()
 
     def detectar_texto(self, imagem_base64: str) -> Dict:
         """
@@ -0,0 +1,115 @@
+"""
+Notificação de conclusão de processamentos via Redis pub/sub.
+
+Os workers publicam {"id", "status"} em um único canal logo após o commit do estado
+final. Cada processo da API mantém uma só assinatura desse canal e acorda as requisições
+que aguardam aquele id (long-poll com wait= e SSE), em vez de cada cliente consultar o
+Postgres em loop até o job terminar.
+
+O evento só avisa que o estado mudou; o resultado é sempre lido do banco. Se um evento se
+perder (Redis reiniciando, API reconectando), quem espera cai no timeout e relê o banco.
+"""
+import asyncio
+import json
+from contextlib import asynccontextmanager
+import redis.asyncio as aioredis
+from app.config import settings
+from app.core.logging import logger
+from app.core.metrics import incrementar
+from app.core.redis_client import obter_redis
+
+CANAL_PROCESSAMENTOS = "eventos:processamentos"
+
+
+def publicar_conclusao(processamento_id: str, status: str) -> None:
+    """Publica o estado final de um processamento. Chamar após o commit; best effort."""
+    try:
+        obter_redis().publish(CANAL_PROCESSAMENTOS, json.dumps({"id": str(processamento_id), "status": status}))
+    except Exception as e:
+        # Sem o evento, quem aguarda relê o banco no timeout: nada se perde além de latência
+        logger.warning(f"[Eventos] Falha ao publicar conclusão de {processamento_id}: {e}")
+        incrementar("eventos.falhas_publicacao")
+
+
+class OuvinteEventos:
+    """
+    Assinatura única do canal por processo da API, despachando cada evento para os
+    asyncio.Event registrados por id. Iniciado no startup; reconecta sozinho.
+    """
+
+    def __init__(self):
+        self._esperas: dict[str, set[asyncio.Event]] = {}
+        self._tarefa: asyncio.Task | None = None
+
+    def iniciar(self) -> None:
+        if self._tarefa is None or self._tarefa.done():
+            self._tarefa = asyncio.create_task(self._escutar())
+
+    async def parar(self) -> None:
+        if self._tarefa:
+            self._tarefa.cancel()
+            try:
+                await self._tarefa
+            except asyncio.CancelledError:
+                pass
+            self._tarefa = None
+
+    @asynccontextmanager
+    async def inscrever(self, processamento_id: str):
+        """
+        Registra a espera por um id e entrega o asyncio.Event sinalizado na conclusão.
+
+        Registrar ANTES de ler o banco: um evento publicado entre a leitura e a espera
+        ainda é entregue.
+        """
+        self.iniciar()
+        evento = asyncio.Event()
+        chave = str(processamento_id)
+        self._esperas.setdefault(chave, set()).add(evento)
+        try:
+            yield evento
+        finally:
+            esperas = self._esperas.get(chave)
+            if esperas is not None:
+                esperas.discard(evento)
+                if not esperas:
+                    del self._esperas[chave]
+
+    def _despachar(self, dados: bytes) -> None:
+        try:
+            processamento_id = json.loads(dados)["id"]
+        except (ValueError, KeyError, TypeError):
+            return
+        for evento in self._esperas.get(processamento_id, ()):
+            evento.set()
+
+    async def _escutar(self) -> None:
+        while True:
+            # Conexão dedicada sem socket_timeout: a assinatura passa longos períodos ociosa
+            cliente = aioredis.Redis.from_url(
+                settings.REDIS_URL,
+                socket_keepalive=True,
+                socket_connect_timeout=5,
+                health_check_interval=30,
+            )
+            pubsub = cliente.pubsub()
+            try:
+                await pubsub.subscribe(CANAL_PROCESSAMENTOS)
+                while True:
+                    mensagem = await pubsub.get_message(ignore_subscribe_messages=True, timeout=30)
+                    if mensagem and mensagem["type"] == "message":
+                        self._despachar(mensagem["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"[Eventos] Assinatura de {CANAL_PROCESSAMENTOS} interrompida: {e}")
+                await asyncio.sleep(1)
+            finally:
+                try:
+                    await pubsub.aclose()
+                    await cliente.aclose()
+                except Exception:
+                    pass
+
+
+ouvinte_eventos = OuvinteEventos()
@@ -0,0 +1,184 @@
+"""
+Heartbeats dos jobs em execução, para detectar em segundos um processamento órfão
+(worker morto por OOM, kill, deploy ou time limit) em vez de esperar o timeout de horas.
+
+Enquanto uma task monitorada roda, uma thread do processo do worker renova a cada
+HEARTBEAT_INTERVALO_SEGUNDOS o prazo do job no zset PRAZOS (score = instante limite).
+Os detalhes ficam no hash heartbeat:{processamento_id}: task id, nome e argumentos da
+task, etapa atual, worker e quantas vezes o job já foi reenviado. O prazo é removido
+quando a task termina e também quando ela agenda um retry: a nova tentativa pode começar
+bem depois do ETA sob backlog, e um prazo estimado faria o sweeper reenviar um job que
+ainda está na fila. O task_prerun do retry recria o prazo; um retry que nunca começa
+fica, como qualquer job enfileirado, com o sweeper de zumbis.
+
+O sweeper (shared.verificar_heartbeats) só consulta o zset: prazo vencido significa
+que ninguém mais está executando aquele job.
+"""
+import json
+import os
+import socket
+import threading
+import time
+from datetime import datetime
+from celery.signals import task_postrun, task_prerun, task_retry
+from app.config import settings
+from app.core.logging import logger
+from app.core.redis_client import obter_redis
+from app.core.task_signatures import TASK_AUDITORIA_PDV, TASK_PROCESSAR_PLANTA
+
+PRAZOS = "heartbeats:prazos"
+TTL_DADOS_SEGUNDOS = 24 * 3600
+# Tasks cujo primeiro argumento é o processamento_id e que podem ser reenviadas com os mesmos argumentos
+TASKS_MONITORADAS = {TASK_AUDITORIA_PDV, TASK_PROCESSAR_PLANTA}
+
+_ativos: set[str] = set()
+_ativos_lock = threading.Lock()
+_thread: threading.Thread | None = None
+_thread_pid: int | None = None
+
+
+def _chave(processamento_id: str) -> str:
+    return f"heartbeat:{processamento_id}"
+
+
+def _prazo() -> float:
+    return time.time() + settings.HEARTBEAT_TOLERANCIA_SEGUNDOS
+
+
+def _bater() -> None:
+    """Loop da thread do processo: renova numa única ida ao Redis o prazo de todos os jobs ativos."""
+    while True:
+        time.sleep(settings.HEARTBEAT_INTERVALO_SEGUNDOS)
+        with _ativos_lock:
+            ativos = list(_ativos)
+        if not ativos:
+            continue
+        try:
+            prazo = _prazo()
+            # xx: não recria o prazo de um job que terminou entre a cópia do set e o ZADD
+            obter_redis().zadd(PRAZOS, {processamento_id: prazo for processamento_id in ativos}, xx=True)
+        except Exception as e:
+            logger.warning(f"[Heartbeats] Falha ao renovar {len(ativos)} heartbeat(s): {e}")
+
+
+def _garantir_thread() -> None:
+    """Uma thread por processo; recriada quando o PID muda (filhos do prefork)."""
+    global _thread, _thread_pid
+    if _thread is None or _thread_pid != os.getpid() or not _thread.is_alive():
+        _thread = threading.Thread(target=_bater, name="heartbeats", daemon=True)
+        _thread.start()
+        _thread_pid = os.getpid()
+
+
+def iniciar(processamento_id: str, task_id: str, task: str, args: list, kwargs: dict, tentativa: int) -> None:
+    """Registra o job no início de cada execução; preserva o contador de reenvios do sweeper."""
+    processamento_id = str(processamento_id)
+    try:
+        pipe = obter_redis().pipeline()
+        pipe.hset(_chave(processamento_id), mapping={
+            "task_id": task_id,
+            "task": task,
+            "args": json.dumps(args),
+            "kwargs": json.dumps(kwargs),
+            "etapa": "inicio",
+            "worker": f"{socket.gethostname()}:{os.getpid()}",
+            "tentativa": tentativa,
+            "iniciado_em": datetime.utcnow().isoformat(),
+        })
+        pipe.expire(_chave(processamento_id), TTL_DADOS_SEGUNDOS)
+        pipe.zadd(PRAZOS, {processamento_id: _prazo()})
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"[Heartbeats] Falha ao registrar {processamento_id}: {e}")
+    with _ativos_lock:
+        _ativos.add(processamento_id)
+    _garantir_thread()
+
+
+def marcar_etapa(processamento_id: str, etapa: str) -> None:
+    """Atualiza a etapa do job (aparece na mensagem de erro se o worker morrer nela)."""
+    processamento_id = str(processamento_id)
+    try:
+        pipe = obter_redis().pipeline()
+        pipe.hset(_chave(processamento_id), "etapa", etapa)
+        pipe.zadd(PRAZOS, {processamento_id: _prazo()})
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"[Heartbeats] Falha ao marcar etapa '{etapa}' de {processamento_id}: {e}")
+
+
+def aguardar_retry(processamento_id: str) -> None:
+    """Entre tentativas o job está na fila, não num worker: sai do zset até o próximo prerun."""
+    processamento_id = str(processamento_id)
+    with _ativos_lock:
+        _ativos.discard(processamento_id)
+    try:
+        pipe = obter_redis().pipeline()
+        pipe.zrem(PRAZOS, processamento_id)
+        pipe.hset(_chave(processamento_id), "etapa", "aguardando_retry")
+        pipe.expire(_chave(processamento_id), TTL_DADOS_SEGUNDOS)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"[Heartbeats] Falha ao suspender heartbeat de {processamento_id}: {e}")
+
+
+def finalizar(processamento_id: str) -> None:
+    processamento_id = str(processamento_id)
+    with _ativos_lock:
+        _ativos.discard(processamento_id)
+    try:
+        pipe = obter_redis().pipeline()
+        pipe.zrem(PRAZOS, processamento_id)
+        pipe.delete(_chave(processamento_id))
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"[Heartbeats] Falha ao remover heartbeat de {processamento_id}: {e}")
+
+
+def retirar_orfaos(limite: int = 500) -> list[tuple[str, dict]]:
+    """
+    Retira do zset os jobs com prazo vencido e devolve (processamento_id, dados).
+
+    O ZREM decide a posse: com mais de um sweeper rodando, cada órfão é tratado por um só.
+    """
+    redis_client = obter_redis()
+    vencidos = redis_client.zrangebyscore(PRAZOS, "-inf", time.time(), start=0, num=limite)
+    orfaos = []
+    for bruto in vencidos:
+        processamento_id = bruto.decode()
+        if not redis_client.zrem(PRAZOS, processamento_id):
+            continue
+        dados = {k.decode(): v.decode() for k, v in redis_client.hgetall(_chave(processamento_id)).items()}
+        orfaos.append((processamento_id, dados))
+    return orfaos
+
+
+def registrar_reenvio(processamento_id: str) -> None:
+    pipe = obter_redis().pipeline()
+    pipe.hincrby(_chave(processamento_id), "reenvios", 1)
+    pipe.hset(_chave(processamento_id), "etapa", "reenviado")
+    pipe.expire(_chave(processamento_id), TTL_DADOS_SEGUNDOS)
+    pipe.execute()
+
+
+def descartar(processamento_id: str) -> None:
+    obter_redis().delete(_chave(processamento_id))
+
+
+@task_prerun.connect
+def _ao_iniciar_task(task_id=None, task=None, args=None, kwargs=None, **_):
+    if task.name in TASKS_MONITORADAS and args:
+        iniciar(args[0], task_id, task.name, list(args), kwargs or {}, task.request.retries)
+
+
+@task_retry.connect
+def _ao_agendar_retry(sender=None, request=None, **_):
+    if sender.name in TASKS_MONITORADAS and request.args:
+        aguardar_retry(request.args[0])
+
+
+@task_postrun.connect
+def _ao_terminar_task(task=None, args=None, state=None, **_):
+    # RETRY já foi tratado em task_retry (que dispara antes do postrun)
+    if task.name in TASKS_MONITORADAS and args and state != "RETRY":
+        finalizar(args[0])
@@ -0,0 +1,93 @@
+import io
+import time
+from app.config import settings
+from app.core.logging import logger
+from app.core.metrics import incrementar
+from app.services.storage_service import StorageService
+from app.services.storage_urls import referencia_objeto, url_publica
+
+# Derivados gerados na primeira gravação da imagem: nome -> (maior lado em px, qualidade JPEG)
+DERIVADOS = {
+    "llm": (1568, 85),   # Cabe no limite útil de todos os provedores (ver image_normalizer)
+    "thumb": (320, 75),  # Relatórios, listagens e dashboards
+}
+
+
+def chave_derivado(object_name: str, nome: str) -> str:
+    """Chave determinística do derivado, ao lado do original: {object_name}__{nome}.jpg."""
+    return f"{object_name}__{nome}.jpg"
+
+
+def gerar_derivados(imagem_bytes: bytes) -> dict[str, bytes]:
+    """
+    Decodifica a imagem uma vez e gera os derivados do maior para o menor,
+    cada um reduzido a partir do anterior.
+    """
+    # Import tardio: Pillow só é carregado nos workers que gravam imagens
+    from PIL import Image, ImageOps
+
+    maior_lado = max(lado for lado, _ in DERIVADOS.values())
+    imagem = Image.open(io.BytesIO(imagem_bytes))
+    imagem.draft("RGB", (maior_lado, maior_lado))  # JPEG: decodifica já em escala reduzida
+    imagem = ImageOps.exif_transpose(imagem)
+    if imagem.mode not in ("RGB", "L"):
+        imagem = imagem.convert("RGB")
+
+    derivados = {}
+    for nome, (lado, qualidade) in sorted(DERIVADOS.items(), key=lambda item: -item[1][0]):
+        imagem.thumbnail((lado, lado), Image.LANCZOS)
+        saida = io.BytesIO()
+        imagem.save(saida, format="JPEG", quality=qualidade, optimize=True)
+        derivados[nome] = saida.getvalue()
+    return derivados
+
+
+def salvar_derivados(bucket: str, object_name: str, imagem_bytes: bytes) -> dict | None:
+    """
+    Gera e grava os derivados ao lado do original.
+
+    Best effort: uma falha aqui não deve derrubar o processamento — o original já está
+    salvo e os derivados podem ser regerados depois.
+
+    Returns:
+        {"bucket": ..., "<nome>": <chave>} ou None em caso de falha
+    """
+    inicio = time.time()
+    storage = StorageService()
+    chaves = {nome: chave_derivado(object_name, nome) for nome in DERIVADOS}
+
+    try:
+        # Por conteúdo a chave do original se repete: derivados já gerados são reaproveitados
+        if settings.STORAGE_CONTENT_ADDRESSED and all(storage.objeto_existe(bucket, c) for c in chaves.values()):
+            incrementar("derivados.reutilizados")
+            return {"bucket": bucket, **chaves}
+
+        bytes_gerados = 0
+        for nome, dados in gerar_derivados(imagem_bytes).items():
+            storage.salvar_bytes(bucket, chaves[nome], dados, content_type="image/jpeg")
+            bytes_gerados += len(dados)
+    except Exception as e:
+        logger.warning(f"[Derivados] Falha ao gerar derivados de {bucket}/{object_name}: {e}")
+        incrementar("derivados.erros")
+        return None
+
+    incrementar("derivados.gerados")
+    logger.info(
+        "derivados_gerados",
+        extra={
+            "bucket": bucket,
+            "objeto": object_name,
+            "bytes_original": len(imagem_bytes),
+            "bytes_derivados": bytes_gerados,
+            "tempo_ms": int((time.time() - inicio) * 1000),
+        }
+    )
+    return {"bucket": bucket, **chaves}
+
+
+def url_derivado(meta_dados: dict | None, nome: str = "thumb") -> str | None:
+    """URL pública (assinada ou CDN) de um derivado registrado em meta_dados['derivados'], se houver."""
+    derivados = (meta_dados or {}).get("derivados")
+    if not derivados or nome not in derivados:
+        return None
+    return url_publica(referencia_objeto(derivados["bucket"], derivados[nome]))
@@ -0,0 +1,109 @@
+import os
+import time
+from urllib.parse import urlparse
+import httpx
+from app.config import settings
+from app.core.logging import logger
+from app.core.metrics import incrementar
+from app.services.image_formats import detectar_formato
+
+BYTES_MINIMOS_ASSINATURA = 12
+CONTENT_TYPES_GENERICOS = ("application/octet-stream", "binary/octet-stream")
+
+_cliente: httpx.Client | None = None
+_cliente_pid: int | None = None
+
+
+class DownloadImagemError(Exception):
+    """Falha no download: rede, status HTTP, tamanho ou tipo de conteúdo inválido."""
+
+
+def _http2_disponivel() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def obter_cliente_http() -> httpx.Client:
+    """
+    Cliente HTTP compartilhado do processo, com keep-alive e HTTP/2 quando disponível.
+
+    Rajadas de fotos do mesmo CDN reaproveitam conexões TLS já abertas. Recriado
+    quando o PID muda (processos filhos do prefork não herdam sockets do pai).
+    """
+    global _cliente, _cliente_pid
+    if _cliente is None or _cliente_pid != os.getpid():
+        _cliente = httpx.Client(
+            http2=_http2_disponivel(),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=90),
+            timeout=httpx.Timeout(settings.DOWNLOAD_TIMEOUT_SEGUNDOS, connect=5.0),
+            follow_redirects=True,
+            headers={"User-Agent": "api-analise-imagens/1.0"},
+        )
+        _cliente_pid = os.getpid()
+    return _cliente
+
+
+def baixar_imagem(url: str, max_bytes: int | None = None) -> bytes:
+    """
+    Baixa uma imagem em stream, validando cedo o que for possível.
+
+    - Content-Length acima do limite é recusado antes de ler o corpo
+    - Content-Type que não seja imagem é recusado
+    - Os primeiros bytes precisam ter assinatura de imagem conhecida
+    - A leitura é interrompida assim que o corpo passa do limite
+
+    Raises:
+        DownloadImagemError: falha de rede, status HTTP de erro ou conteúdo recusado
+    """
+    max_bytes = max_bytes or settings.DOWNLOAD_MAX_BYTES
+    host = urlparse(url).hostname or "desconhecido"
+    inicio = time.time()
+
+    try:
+        with obter_cliente_http().stream("GET", url) as response:
+            response.raise_for_status()
+
+            content_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+            if content_type and not content_type.startswith("image/") and content_type not in CONTENT_TYPES_GENERICOS:
+                raise DownloadImagemError(f"Content-Type não é imagem: {content_type}")
+
+            tamanho_declarado = int(response.headers.get("content-length") or 0)
+            if tamanho_declarado > max_bytes:
+                raise DownloadImagemError(f"Imagem excede {max_bytes} bytes (Content-Length {tamanho_declarado})")
+
+            partes = []
+            recebidos = 0
+            assinatura_ok = False
+            for chunk in response.iter_bytes():
+                partes.append(chunk)
+                recebidos += len(chunk)
+                if recebidos > max_bytes:
+                    raise DownloadImagemError(f"Imagem excede {max_bytes} bytes")
+                if not assinatura_ok and recebidos >= BYTES_MINIMOS_ASSINATURA:
+                    if detectar_formato(b"".join(partes)[:BYTES_MINIMOS_ASSINATURA]) is None:
+                        raise DownloadImagemError("Conteúdo não tem assinatura de imagem conhecida")
+                    assinatura_ok = True
+
+            imagem_bytes = b"".join(partes)
+            if not assinatura_ok and detectar_formato(imagem_bytes) is None:
+                raise DownloadImagemError("Conteúdo não tem assinatura de imagem conhecida")
+            versao_http = response.http_version
+    except DownloadImagemError:
+        incrementar(f"download.{host}.erros")
+        raise
+    except httpx.HTTPError as e:
+        incrementar(f"download.{host}.erros")
+        raise DownloadImagemError(str(e)) from e
+
+    tempo_ms = int((time.time() - inicio) * 1000)
+    incrementar(f"download.{host}.requisicoes")
+    incrementar(f"download.{host}.tempo_ms_total", tempo_ms)
+    incrementar(f"download.{host}.bytes_total", len(imagem_bytes))
+    logger.info(
+        "imagem_baixada",
+        extra={"host": host, "bytes": len(imagem_bytes), "tempo_ms": tempo_ms, "http_version": versao_http}
+    )
+    return imagem_bytes
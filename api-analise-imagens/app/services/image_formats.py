@@ -0,0 +1,20 @@
+# Assinaturas (magic bytes) dos formatos aceitos
+ASSINATURAS = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+]
+
+
+def detectar_formato(imagem_bytes: bytes) -> str | None:
+    """Identifica o MIME type pelos magic bytes, ignorando extensão e Content-Type."""
+    for assinatura, media_type in ASSINATURAS:
+        if imagem_bytes.startswith(assinatura):
+            return media_type
+    if imagem_bytes[:4] == b"RIFF" and imagem_bytes[8:12] == b"WEBP":
+        return "image/webp"
+    if imagem_bytes[4:12] in (b"ftypheic", b"ftypheix", b"ftypmif1"):
+        return "image/heic"
+    return None
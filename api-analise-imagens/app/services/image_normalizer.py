@@ -0,0 +1,107 @@
+import io
+import time
+from PIL import Image, ImageOps
+from app.config import settings
+from app.core.logging import logger
+from app.services.image_formats import detectar_formato
+
+# Maior lado útil por provedor/detail — acima disso o provedor redimensiona e o upload é desperdício.
+# OpenAI 'high' encaixa em 2048x2048 e depois reduz o lado menor a 768; 'low' usa 512x512.
+# Claude recomenda até 1568 px no maior lado; Gemini trabalha bem com 1536.
+MAX_LADO_POR_MODELO = {
+    ("gpt", "low"): 512,
+    ("gpt", "auto"): 2048,
+    ("gpt", "high"): 2048,
+    ("claude", None): 1568,
+    ("gemini", None): 1536,
+}
+MAX_LADO_PADRAO = 2048
+
+
+def max_lado_para(modelo_llm: str, detail: str | None, tamanho: tuple[int, int]) -> int:
+    """Maior lado útil para o modelo, considerando a proporção da imagem."""
+    max_lado = MAX_LADO_PADRAO
+    for (prefixo, nivel), limite in MAX_LADO_POR_MODELO.items():
+        if modelo_llm.startswith(prefixo) and (nivel is None or nivel == detail):
+            max_lado = limite
+            break
+
+    # OpenAI high/auto reduz o lado menor a 768 px: o maior lado útil é 768 * proporção
+    if modelo_llm.startswith("gpt") and detail in ("high", "auto") and min(tamanho) > 0:
+        proporcional = int(768 * max(tamanho) / min(tamanho) + 0.5)
+        max_lado = min(max_lado, max(proporcional, 768))
+    return max_lado
+
+
+def normalizar_imagem(imagem_bytes: bytes, modelo_llm: str, detail: str | None = None) -> dict:
+    """
+    Prepara a imagem para envio ao LLM: aplica a rotação EXIF, reduz o maior lado ao
+    limite útil do modelo e re-codifica em JPEG/WebP com a qualidade configurada.
+
+    Se a versão re-codificada não for menor que a original (e a original já estiver
+    em formato e dimensões aceitos), a original é mantida.
+
+    Returns:
+        {
+            "bytes": b"...",
+            "media_type": "image/jpeg",
+            "metricas": {"bytes_originais", "bytes_finais", "economia_pct", "largura", "altura",
+                         "formato_original", "redimensionada", "tempo_ms"}
+        }
+    """
+    inicio = time.time()
+    formato_original = detectar_formato(imagem_bytes)
+
+    if not settings.NORMALIZACAO_ATIVA:
+        return _resultado(imagem_bytes, formato_original or "image/jpeg", imagem_bytes, formato_original, None, False, inicio)
+
+    try:
+        imagem = Image.open(io.BytesIO(imagem_bytes))
+        imagem = ImageOps.exif_transpose(imagem)
+    except Exception as e:
+        # Formato que o Pillow não decodifica: segue com a original, como antes da normalização
+        logger.warning(f"Normalização ignorada, imagem não decodificável: {e}")
+        return _resultado(imagem_bytes, formato_original or "image/jpeg", imagem_bytes, formato_original, None, False, inicio)
+
+    max_lado = max_lado_para(modelo_llm, detail, imagem.size)
+    redimensionada = max(imagem.size) > max_lado
+    if redimensionada:
+        imagem.thumbnail((max_lado, max_lado), Image.LANCZOS)
+
+    formato = settings.NORMALIZACAO_FORMATO.upper()
+    if imagem.mode not in ("RGB", "L"):
+        imagem = imagem.convert("RGB")
+    saida = io.BytesIO()
+    imagem.save(saida, format=formato, quality=settings.NORMALIZACAO_QUALIDADE, optimize=True)
+    normalizada = saida.getvalue()
+    media_type = f"image/{formato.lower()}"
+
+    # Mantém a original quando ela já serve e re-codificar não economiza nada
+    original_aceita = formato_original in ("image/jpeg", "image/png", "image/webp") and not redimensionada
+    if original_aceita and len(normalizada) >= len(imagem_bytes) and not _tem_rotacao_exif(imagem_bytes):
+        return _resultado(imagem_bytes, formato_original, imagem_bytes, formato_original, imagem.size, False, inicio)
+
+    return _resultado(normalizada, media_type, imagem_bytes, formato_original, imagem.size, redimensionada, inicio)
+
+
+def _tem_rotacao_exif(imagem_bytes: bytes) -> bool:
+    try:
+        orientacao = Image.open(io.BytesIO(imagem_bytes)).getexif().get(0x0112, 1)
+    except Exception:
+        return False
+    return orientacao not in (None, 1)
+
+
+def _resultado(final: bytes, media_type: str, original: bytes, formato_original: str | None, tamanho, redimensionada: bool, inicio: float) -> dict:
+    metricas = {
+        "bytes_originais": len(original),
+        "bytes_finais": len(final),
+        "economia_pct": round(100 * (1 - len(final) / len(original)), 1) if original else 0.0,
+        "largura": tamanho[0] if tamanho else None,
+        "altura": tamanho[1] if tamanho else None,
+        "formato_original": formato_original,
+        "redimensionada": redimensionada,
+        "tempo_ms": int((time.time() - inicio) * 1000),
+    }
+    logger.info("imagem_normalizada", extra=metricas)
+    return {"bytes": final, "media_type": media_type, "metricas": metricas}
@@ -0,0 +1,44 @@
+"""
+Fábrica de clientes de LLM com imports tardios.
+
+Os SDKs (openai, anthropic, google.generativeai) só são importados quando um cliente
+do provedor é efetivamente criado, dentro do worker que vai usá-lo.
+"""
+import sys
+from app.config import settings
+
+
+def criar_cliente_llm(modelo_llm: str):
+    """
+    Cria o cliente do provedor correspondente ao modelo.
+
+    Returns:
+        Cliente do SDK, ou None se o prefixo do modelo não for reconhecido
+    """
+    if modelo_llm.startswith("gpt"):
+        from openai import OpenAI
+        return OpenAI(api_key=settings.OPENAI_API_KEY)
+    elif modelo_llm.startswith("claude"):
+        from anthropic import Anthropic
+        return Anthropic(api_key=settings.ANTHROPIC_API_KEY)
+    elif modelo_llm.startswith("gemini"):
+        import google.generativeai as genai
+        genai.configure(api_key=settings.GOOGLE_API_KEY)
+        return genai.GenerativeModel(modelo_llm)
+    return None
+
+
+def eh_erro_rate_limit(exc: Exception) -> bool:
+    """
+    Indica se a exceção é um 429 de algum provedor.
+
+    Consulta apenas SDKs já carregados em sys.modules — se o SDK nunca foi importado,
+    a exceção não pode ter vindo dele.
+    """
+    openai = sys.modules.get("openai")
+    if openai is not None and isinstance(exc, openai.RateLimitError):
+        return True
+    anthropic = sys.modules.get("anthropic")
+    if anthropic is not None and isinstance(exc, anthropic.RateLimitError):
+        return True
+    return False
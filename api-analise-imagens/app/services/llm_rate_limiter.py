@@ -0,0 +1,220 @@
+"""
+Limitador de taxa distribuído (token bucket RPM + TPM) para chamadas de LLM.
+
+Todos os workers (worker-analise e worker-plantas) consomem do mesmo bucket no Redis,
+chaveado por provedor e modelo. A chamada só sai quando há saldo de requisições e de
+tokens; assim a vazão se acomoda no limite da conta em vez de alternar entre rajadas
+de 429 e longos períodos de backoff.
+"""
+import math
+import random
+import time
+from contextlib import contextmanager
+from app.config import settings
+from app.core.logging import logger
+from app.core.metrics import incrementar
+from app.core.redis_client import obter_redis
+from app.services.llm_clients import eh_erro_rate_limit
+
+# Reabastece os dois buckets pelo tempo decorrido e debita a chamada se houver saldo.
+# Retorna 0 quando a chamada foi liberada, ou quantos ms esperar antes de tentar de novo.
+# O relógio é o do Redis (TIME), comum a todos os workers.
+_SCRIPT_ADQUIRIR = """
+local agora = redis.call('TIME')
+local t = tonumber(agora[1]) * 1000 + math.floor(tonumber(agora[2]) / 1000)
+local rpm = tonumber(ARGV[1])
+local tpm = tonumber(ARGV[2])
+local custo = math.min(tonumber(ARGV[3]), tpm)
+
+local d = redis.call('HMGET', KEYS[1], 'req', 'tok', 'ts', 'bloqueado_ate')
+local req = tonumber(d[1]) or rpm
+local tok = tonumber(d[2]) or tpm
+local ts = tonumber(d[3]) or t
+local bloqueado_ate = tonumber(d[4]) or 0
+
+local dt = math.max(0, t - ts)
+req = math.min(rpm, req + dt * rpm / 60000)
+tok = math.min(tpm, tok + dt * tpm / 60000)
+
+local espera = 0
+if bloqueado_ate > t then espera = bloqueado_ate - t end
+if req < 1 then espera = math.max(espera, math.ceil((1 - req) * 60000 / rpm)) end
+if tok < custo then espera = math.max(espera, math.ceil((custo - tok) * 60000 / tpm)) end
+if espera == 0 then
+    req = req - 1
+    tok = tok - custo
+end
+
+redis.call('HSET', KEYS[1], 'req', tostring(req), 'tok', tostring(tok), 'ts', t)
+-- Não encurta o TTL de um bucket bloqueado além do fim do bloqueio
+redis.call('PEXPIRE', KEYS[1], math.max(120000, bloqueado_ate - t + 60000))
+return espera
+"""
+
+# 429 do provedor: zera o saldo de tokens e bloqueia o bucket até o Retry-After,
+# pausando todos os workers de uma vez em vez de cada um descobrir o limite sozinho.
+_SCRIPT_BLOQUEAR = """
+local agora = redis.call('TIME')
+local t = tonumber(agora[1]) * 1000 + math.floor(tonumber(agora[2]) / 1000)
+local ate = t + tonumber(ARGV[1])
+local atual = tonumber(redis.call('HGET', KEYS[1], 'bloqueado_ate')) or 0
+if ate > atual then
+    redis.call('HSET', KEYS[1], 'bloqueado_ate', ate, 'tok', 0, 'ts', t)
+end
+-- bloqueado_ate vive na mesma chave: o TTL precisa cobrir um Retry-After maior que 2 min
+redis.call('PEXPIRE', KEYS[1], math.max(120000, math.max(ate, atual) - t + 60000))
+return ate
+"""
+
+PROVEDORES = {"gpt": "openai", "claude": "anthropic", "gemini": "google"}
+
+# Tokens de uma imagem por provedor, aproximando a contabilidade de cada um
+TOKENS_IMAGEM_GEMINI = 258
+CARACTERES_POR_TOKEN = 4
+
+
+class LimiteTaxaLLM(Exception):
+    """Sem capacidade no bucket dentro da espera máxima; a task deve reagendar."""
+
+    def __init__(self, modelo_llm: str, espera_segundos: float):
+        super().__init__(f"Limite de taxa local atingido para {modelo_llm}; nova tentativa em {espera_segundos:.0f}s")
+        self.modelo_llm = modelo_llm
+        self.espera_segundos = espera_segundos
+
+
+def provedor_do_modelo(modelo_llm: str) -> str:
+    for prefixo, provedor in PROVEDORES.items():
+        if modelo_llm.startswith(prefixo):
+            return provedor
+    return "desconhecido"
+
+
+def limites_do_modelo(modelo_llm: str) -> dict | None:
+    """Limites {'rpm', 'tpm'} do modelo: chave exata em LLM_LIMITES, senão o prefixo do provedor."""
+    if modelo_llm in settings.LLM_LIMITES:
+        return settings.LLM_LIMITES[modelo_llm]
+    for prefixo, limites in settings.LLM_LIMITES.items():
+        if modelo_llm.startswith(prefixo):
+            return limites
+    return None
+
+
+def estimar_tokens(modelo_llm: str, prompt: str, largura: int | None, altura: int | None, detail: str | None, max_tokens_saida: int) -> int:
+    """
+    Estimativa de tokens debitada do TPM antes da chamada.
+
+    Segue a contabilidade dos provedores, que reservam max_tokens da saída no momento
+    da requisição — por isso não há acerto posterior com o uso real.
+    """
+    tokens = math.ceil(len(prompt) / CARACTERES_POR_TOKEN) + max_tokens_saida
+    if not largura or not altura:
+        return tokens + 1000
+
+    if modelo_llm.startswith("gpt"):
+        if detail == "low":
+            return tokens + 85
+        # high/auto: encaixa em 2048x2048, reduz o lado menor a 768 e conta blocos de 512
+        escala = min(1.0, 2048 / max(largura, altura))
+        if min(largura, altura) * escala > 768:
+            escala = 768 / min(largura, altura)
+        blocos = math.ceil(largura * escala / 512) * math.ceil(altura * escala / 512)
+        return tokens + 85 + 170 * blocos
+    if modelo_llm.startswith("claude"):
+        return tokens + math.ceil(largura * altura / 750)
+    return tokens + TOKENS_IMAGEM_GEMINI
+
+
+def _chave(modelo_llm: str) -> str:
+    return f"llm:limite:{provedor_do_modelo(modelo_llm)}:{modelo_llm}"
+
+
+def adquirir(modelo_llm: str, tokens: int) -> float:
+    """
+    Bloqueia até o bucket do modelo liberar 1 requisição e `tokens` tokens.
+
+    Returns:
+        Tempo esperado, em segundos
+
+    Raises:
+        LimiteTaxaLLM: se a espera passar de LLM_RATE_LIMIT_ESPERA_MAXIMA_SEGUNDOS
+    """
+    limites = limites_do_modelo(modelo_llm)
+    if not settings.LLM_RATE_LIMIT_ATIVO or not limites:
+        return 0.0
+
+    redis_client = obter_redis()
+    inicio = time.time()
+    limite_espera = settings.LLM_RATE_LIMIT_ESPERA_MAXIMA_SEGUNDOS
+    while True:
+        try:
+            espera_ms = redis_client.eval(_SCRIPT_ADQUIRIR, 1, _chave(modelo_llm), limites["rpm"], limites["tpm"], tokens)
+        except Exception as e:
+            # Redis fora do ar não pode parar as auditorias: segue sem limitação (o 429 ainda protege)
+            logger.warning(f"[RateLimit] Falha ao consultar bucket de {modelo_llm}: {e}")
+            return time.time() - inicio
+
+        esperado = time.time() - inicio
+        if not espera_ms:
+            if esperado > 0.05:
+                incrementar(f"llm.{modelo_llm}.esperas")
+                incrementar(f"llm.{modelo_llm}.espera_ms_total", int(esperado * 1000))
+            return esperado
+
+        if esperado + espera_ms / 1000 > limite_espera:
+            incrementar(f"llm.{modelo_llm}.reagendadas")
+            raise LimiteTaxaLLM(modelo_llm, espera_ms / 1000)
+
+        # Jitter evita que os workers acordem juntos e disputem o mesmo saldo
+        time.sleep(espera_ms / 1000 + random.uniform(0, 0.05))
+
+
+def registrar_limite_provedor(modelo_llm: str, exc: Exception) -> float:
+    """Bloqueia o bucket compartilhado após um 429. Retorna a pausa aplicada, em segundos."""
+    pausa = retry_after_segundos(exc) or settings.LLM_RATE_LIMIT_PAUSA_429_SEGUNDOS
+    incrementar(f"llm.{modelo_llm}.erros_429")
+    try:
+        obter_redis().eval(_SCRIPT_BLOQUEAR, 1, _chave(modelo_llm), int(pausa * 1000))
+    except Exception as e:
+        logger.warning(f"[RateLimit] Falha ao bloquear bucket de {modelo_llm}: {e}")
+    logger.warning(f"[RateLimit] 429 de {modelo_llm}: bucket pausado por {pausa:.0f}s")
+    return pausa
+
+
+def retry_after_segundos(exc: Exception) -> float | None:
+    """Lê o Retry-After da resposta HTTP anexada à exceção do SDK, se houver."""
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def reagendar_por_limite(task, exc: Exception, esperas_limite: int, countdown: float):
+    """
+    Retry de uma task que esperava capacidade de LLM (bucket local sem saldo ou 429 do
+    provedor). Conta no kwarg esperas_limite da task, não nas tentativas de max_retries,
+    que ficam para falhas de fato. Uso: raise reagendar_por_limite(self, e, ...).
+    """
+    return task.retry(
+        exc=exc,
+        countdown=countdown,
+        kwargs={**task.request.kwargs, "esperas_limite": esperas_limite + 1},
+        max_retries=task.max_retries + esperas_limite + 1
+    )
+
+
+@contextmanager
+def chamada_llm(modelo_llm: str, tokens: int):
+    """
+    Envolve uma chamada ao provedor: adquire capacidade antes e, em caso de 429,
+    pausa o bucket para todos os workers antes de propagar a exceção.
+    """
+    adquirir(modelo_llm, tokens)
+    try:
+        yield
+    except Exception as e:
+        if eh_erro_rate_limit(e):
+            registrar_limite_provedor(modelo_llm, e)
+        raise
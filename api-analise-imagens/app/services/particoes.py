@@ -0,0 +1,239 @@
+"""
+Manutenção das partições mensais de processamentos (RANGE em created_at).
+
+Rodada diariamente pelo beat (shared.manter_particoes):
+- cria as partições do mês corrente até PARTICOES_FUTURAS meses à frente, movendo para
+  elas linhas que tenham caído na partição DEFAULT;
+- arquiva as partições inteiramente anteriores à retenção: exporta as linhas em JSONL
+  gzip para o bucket PARTICAO_ARQUIVO_BUCKET, junto com as linhas das tabelas filhas
+  (hashes, resultados, endereços) desses processamentos, confere os objetos gravados e
+  só então apaga as filhas e faz DETACH e DROP da partição — sem FK, nada mais removeria
+  as filhas, e um hash órfão continuaria sendo achado como quase-duplicata.
+
+Partições seguem o nome processamentos_pAAAA_MM; a tabela anterior ao particionamento
+é a partição processamentos_legado (MINVALUE até o mês da migration).
+"""
+import gzip
+import json
+import os
+import re
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from sqlalchemy import text
+from app.config import settings
+from app.core.database import engine
+from app.core.logging import logger
+from app.core.metrics import incrementar
+from app.services.storage_service import StorageService
+
+TABELA = "processamentos"
+PARTICAO_PADRAO = "processamentos_padrao"
+LINHAS_POR_LEITURA = 5000
+# Chave do pg_try_advisory_lock: uma manutenção por vez, mesmo com beat duplicado
+CHAVE_LOCK_MANUTENCAO = 0x70726F63
+# Tabelas com processamento_id (sem FK: processamentos é particionada), arquivadas com a partição
+TABELAS_FILHAS = ("analise_fotos_hashes", "analise_fotos_resultados", "plantas_enderecos")
+
+SQL_PARTICOES = """
+SELECT c.relname AS nome, pg_get_expr(c.relpartbound, c.oid) AS limites
+FROM pg_inherits i
+JOIN pg_class c ON c.oid = i.inhrelid
+WHERE i.inhparent = 'processamentos'::regclass
+"""
+_RE_LIMITES = re.compile(r"FROM \((.+?)\) TO \((.+?)\)")
+
+
+@dataclass
+class Particao:
+    nome: str
+    inicio: datetime | None  # None = MINVALUE
+    fim: datetime | None  # None = MAXVALUE
+    padrao: bool = False
+
+
+def _inicio_mes(momento: datetime) -> datetime:
+    return datetime(momento.year, momento.month, 1)
+
+
+def somar_meses(momento: datetime, meses: int) -> datetime:
+    indice = momento.year * 12 + momento.month - 1 + meses
+    return datetime(indice // 12, indice % 12 + 1, 1)
+
+
+def nome_particao(inicio: datetime) -> str:
+    return f"{TABELA}_p{inicio:%Y_%m}"
+
+
+def _limite(valor: str) -> datetime | None:
+    if valor in ("MINVALUE", "MAXVALUE"):
+        return None
+    return datetime.fromisoformat(valor.strip("'"))
+
+
+def listar_particoes(conexao) -> list[Particao]:
+    particoes = []
+    for nome, limites in conexao.execute(text(SQL_PARTICOES)).all():
+        if limites == "DEFAULT":
+            particoes.append(Particao(nome, None, None, padrao=True))
+            continue
+        encontrado = _RE_LIMITES.search(limites)
+        if encontrado:
+            particoes.append(Particao(nome, _limite(encontrado.group(1)), _limite(encontrado.group(2))))
+    return sorted(particoes, key=lambda p: (p.padrao, p.inicio or datetime.min))
+
+
+def _sobrepoe(particao: Particao, inicio: datetime, fim: datetime) -> bool:
+    if particao.padrao:
+        return False
+    return (particao.inicio is None or particao.inicio < fim) and (particao.fim is None or particao.fim > inicio)
+
+
+def criar_particao(conexao, inicio: datetime, fim: datetime, padrao_existe: bool) -> str:
+    """
+    Cria a partição [inicio, fim). Com partição DEFAULT, a tabela nasce avulsa, recebe as
+    linhas da faixa que estavam na DEFAULT e só então é anexada — o ATTACH recusaria
+    uma faixa que ainda tivesse linhas na DEFAULT.
+    """
+    nome = nome_particao(inicio)
+    faixa = {"inicio": inicio, "fim": fim}
+    if not padrao_existe:
+        conexao.execute(text(
+            f"CREATE TABLE {nome} PARTITION OF {TABELA} "
+            f"FOR VALUES FROM ('{inicio.isoformat()}') TO ('{fim.isoformat()}')"
+        ))
+        return nome
+
+    conexao.execute(text(f"CREATE TABLE {nome} (LIKE {TABELA} INCLUDING DEFAULTS)"))
+    movidas = conexao.execute(text(
+        f"WITH movidas AS (DELETE FROM {PARTICAO_PADRAO} WHERE created_at >= :inicio AND created_at < :fim RETURNING *) "
+        f"INSERT INTO {nome} SELECT * FROM movidas"
+    ), faixa).rowcount
+    conexao.execute(text(
+        f"ALTER TABLE {TABELA} ATTACH PARTITION {nome} "
+        f"FOR VALUES FROM ('{inicio.isoformat()}') TO ('{fim.isoformat()}')"
+    ))
+    if movidas:
+        logger.warning(f"[Particoes] {movidas} linha(s) movida(s) de {PARTICAO_PADRAO} para {nome}")
+    return nome
+
+
+def criar_particoes_futuras(conexao, agora: datetime) -> list[str]:
+    """Garante as partições do mês corrente até PARTICOES_FUTURAS meses à frente."""
+    particoes = listar_particoes(conexao)
+    padrao_existe = any(p.padrao for p in particoes)
+    criadas = []
+    inicio = _inicio_mes(agora)
+    for _ in range(settings.PARTICOES_FUTURAS + 1):
+        fim = somar_meses(inicio, 1)
+        if not any(_sobrepoe(p, inicio, fim) for p in particoes):
+            criadas.append(criar_particao(conexao, inicio, fim, padrao_existe))
+            conexao.commit()
+        inicio = fim
+    return criadas
+
+
+def exportar_consulta(conexao, consulta: str, destino) -> int:
+    """Grava as linhas da consulta em JSONL gzip no arquivo `destino`, em leituras de LINHAS_POR_LEITURA."""
+    linhas = 0
+    resultado = conexao.execution_options(stream_results=True, yield_per=LINHAS_POR_LEITURA).execute(text(consulta))
+    with gzip.open(destino, "wt", encoding="utf-8") as saida:
+        for linha in resultado:
+            saida.write(json.dumps(dict(linha._mapping), ensure_ascii=False, default=str) + "\n")
+            linhas += 1
+    return linhas
+
+
+def _consulta_filhas(tabela: str, particao: str) -> str:
+    return (
+        f"SELECT f.* FROM {tabela} f JOIN {particao} p ON p.id = f.processamento_id "
+        f"ORDER BY f.created_at, f.id"
+    )
+
+
+def _arquivar_consulta(conexao, storage: StorageService, consulta: str, object_name: str) -> tuple[int, int]:
+    """Exporta a consulta para o storage e confere o tamanho do objeto gravado. Returns: (linhas, bytes)."""
+    with tempfile.NamedTemporaryFile(suffix=".jsonl.gz") as arquivo:
+        linhas = exportar_consulta(conexao, consulta, arquivo.name)
+        conexao.commit()
+        tamanho = os.path.getsize(arquivo.name)
+        with open(arquivo.name, "rb") as stream:
+            storage.salvar_stream(
+                settings.PARTICAO_ARQUIVO_BUCKET, object_name, stream, tamanho, content_type="application/gzip"
+            )
+
+    gravado = storage.client.stat_object(settings.PARTICAO_ARQUIVO_BUCKET, object_name)
+    if gravado.size != tamanho:
+        raise RuntimeError(f"{object_name} com {gravado.size} bytes no storage, esperado {tamanho}; partição mantida")
+    return linhas, tamanho
+
+
+def arquivar_particao(conexao, particao: Particao) -> dict:
+    """
+    Exporta a partição e as linhas filhas dos seus processamentos para o storage e as
+    remove do banco. Nada é apagado antes de conferir o tamanho de todos os objetos
+    gravados; qualquer falha antes disso mantém partição e filhas.
+    """
+    inicio = time.time()
+    storage = StorageService()
+    object_name = f"{TABELA}/{particao.nome}.jsonl.gz"
+    linhas, tamanho = _arquivar_consulta(
+        conexao, storage, f"SELECT * FROM {particao.nome} ORDER BY created_at, id", object_name
+    )
+    filhas = {}
+    for tabela in TABELAS_FILHAS:
+        filhas[tabela], _ = _arquivar_consulta(
+            conexao, storage, _consulta_filhas(tabela, particao.nome), f"{tabela}/{particao.nome}.jsonl.gz"
+        )
+
+    # Filhas apagadas na mesma transação do DROP: ou somem junto com a partição, ou nada muda
+    for tabela in TABELAS_FILHAS:
+        conexao.execute(text(f"DELETE FROM {tabela} f USING {particao.nome} p WHERE p.id = f.processamento_id"))
+    conexao.execute(text(f"ALTER TABLE {TABELA} DETACH PARTITION {particao.nome}"))
+    conexao.execute(text(f"DROP TABLE {particao.nome}"))
+    conexao.commit()
+
+    incrementar("particoes.arquivadas")
+    incrementar("particoes.linhas_arquivadas", linhas)
+    incrementar("particoes.linhas_filhas_arquivadas", sum(filhas.values()))
+    logger.info(
+        "particao_arquivada",
+        extra={
+            "particao": particao.nome,
+            "linhas": linhas,
+            "linhas_filhas": filhas,
+            "bytes": tamanho,
+            "objeto": f"{settings.PARTICAO_ARQUIVO_BUCKET}/{object_name}",
+            "tempo_ms": int((time.time() - inicio) * 1000),
+        }
+    )
+    return {"particao": particao.nome, "linhas": linhas, "filhas": filhas, "objeto": object_name}
+
+
+def particoes_expiradas(conexao, agora: datetime) -> list[Particao]:
+    """Partições que terminam até o início do mês que abre a janela de retenção."""
+    if settings.PARTICAO_RETENCAO_MESES <= 0:
+        return []
+    corte = somar_meses(_inicio_mes(agora), -settings.PARTICAO_RETENCAO_MESES)
+    return [p for p in listar_particoes(conexao) if not p.padrao and p.fim is not None and p.fim <= corte]
+
+
+def manter_particoes(agora: datetime | None = None) -> dict:
+    """Cria partições futuras e arquiva as expiradas. Não faz nada se outra manutenção estiver rodando."""
+    agora = agora or datetime.utcnow()
+    with engine.connect() as conexao:
+        if not conexao.execute(text("SELECT pg_try_advisory_lock(:chave)"), {"chave": CHAVE_LOCK_MANUTENCAO}).scalar():
+            logger.info("[Particoes] Manutenção já em andamento em outro worker; ignorando.")
+            return {"ignorado": True}
+        conexao.commit()
+        try:
+            criadas = criar_particoes_futuras(conexao, agora)
+            if criadas:
+                logger.info(f"[Particoes] Partições criadas: {criadas}")
+            arquivadas = [arquivar_particao(conexao, p) for p in particoes_expiradas(conexao, agora)]
+        finally:
+            conexao.rollback()
+            conexao.execute(text("SELECT pg_advisory_unlock(:chave)"), {"chave": CHAVE_LOCK_MANUTENCAO})
+            conexao.commit()
+    return {"criadas": criadas, "arquivadas": arquivadas}
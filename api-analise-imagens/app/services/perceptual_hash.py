@@ -0,0 +1,43 @@
+import io
+from PIL import Image, ImageOps
+
+BITS_HASH = 64
+NUM_BANDAS = 4
+BITS_BANDA = BITS_HASH // NUM_BANDAS
+
+
+def calcular_dhash(imagem_bytes: bytes) -> int:
+    """
+    dHash de 64 bits: compara pixels vizinhos de uma miniatura 9x8 em escala de cinza.
+
+    Resistente a re-encode, redimensionamento e pequenos recortes — imagens quase
+    idênticas ficam a poucos bits de distância.
+    """
+    imagem = Image.open(io.BytesIO(imagem_bytes))
+    imagem = ImageOps.exif_transpose(imagem)
+    pixels = list(imagem.convert("L").resize((9, 8), Image.LANCZOS).getdata())
+
+    valor = 0
+    for linha in range(8):
+        for coluna in range(8):
+            esquerda = pixels[linha * 9 + coluna]
+            direita = pixels[linha * 9 + coluna + 1]
+            valor = (valor << 1) | (1 if esquerda > direita else 0)
+    return valor
+
+
+def bandas(valor: int) -> list[int]:
+    """
+    Divide o hash em NUM_BANDAS fatias de BITS_BANDA bits.
+
+    Pelo princípio da casa dos pombos, dois hashes a distância <= NUM_BANDAS - 1
+    compartilham ao menos uma banda idêntica — buscar por igualdade de banda
+    (indexada) encontra todos esses candidatos sem varrer a tabela.
+    """
+    mascara = (1 << BITS_BANDA) - 1
+    return [(valor >> (i * BITS_BANDA)) & mascara for i in range(NUM_BANDAS)]
+
+
+def para_bigint(valor: int) -> int:
+    """Converte o hash sem sinal de 64 bits para o intervalo do BIGINT do Postgres."""
+    return valor - (1 << 64) if valor >= (1 << 63) else valor
@@ -0,0 +1,92 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+from app.core.logging import logger
+from app.core.metrics import incrementar
+from app.core.redis_client import obter_redis
+
+
+class CacheResultados:
+    """
+    Cache de dois níveis para resultados caros (ex: chamadas de LLM).
+
+    L1: LRU em memória do processo, limitado em itens e TTL.
+    L2: Redis compartilhado entre workers, com TTL e limite de itens — um sorted set
+    indexa as chaves por horário de gravação e as mais antigas são removidas quando
+    o limite é excedido.
+
+    Falhas de Redis são tratadas como miss: o cache nunca derruba a task.
+    """
+
+    def __init__(self, namespace: str, ttl_segundos: int, max_itens: int, max_itens_l1: int = 512, ttl_l1_segundos: int = 600):
+        self.namespace = namespace
+        self.ttl_segundos = ttl_segundos
+        self.max_itens = max_itens
+        self.max_itens_l1 = max_itens_l1
+        self.ttl_l1_segundos = min(ttl_l1_segundos, ttl_segundos)
+        self._l1: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _chave_redis(self, chave: str) -> str:
+        return f"cache:{self.namespace}:{chave}"
+
+    @property
+    def _chave_indice(self) -> str:
+        return f"cache:{self.namespace}:__indice__"
+
+    def obter(self, chave: str) -> Optional[Any]:
+        agora = time.time()
+        with self._lock:
+            item = self._l1.get(chave)
+            if item is not None:
+                expira_em, valor = item
+                if expira_em > agora:
+                    self._l1.move_to_end(chave)
+                    incrementar(f"cache.{self.namespace}.hit_l1")
+                    return valor
+                del self._l1[chave]
+
+        try:
+            bruto = obter_redis().get(self._chave_redis(chave))
+        except Exception as e:
+            logger.warning(f"[Cache:{self.namespace}] Falha ao ler Redis: {e}")
+            bruto = None
+
+        if bruto is None:
+            incrementar(f"cache.{self.namespace}.miss")
+            return None
+
+        valor = json.loads(bruto)
+        self._gravar_l1(chave, valor)
+        incrementar(f"cache.{self.namespace}.hit_l2")
+        return valor
+
+    def gravar(self, chave: str, valor: Any) -> None:
+        self._gravar_l1(chave, valor)
+        try:
+            redis = obter_redis()
+            agora = time.time()
+            pipe = redis.pipeline(transaction=False)
+            pipe.zremrangebyscore(self._chave_indice, "-inf", agora - self.ttl_segundos)
+            pipe.set(self._chave_redis(chave), json.dumps(valor, ensure_ascii=False), ex=self.ttl_segundos)
+            pipe.zadd(self._chave_indice, {chave: agora})
+            pipe.zcard(self._chave_indice)
+            total = pipe.execute()[-1]
+
+            excedente = total - self.max_itens
+            if excedente > 0:
+                removidas = [m.decode() for m, _ in redis.zpopmin(self._chave_indice, excedente)]
+                if removidas:
+                    redis.delete(*[self._chave_redis(c) for c in removidas])
+                    incrementar(f"cache.{self.namespace}.evictions", len(removidas))
+        except Exception as e:
+            logger.warning(f"[Cache:{self.namespace}] Falha ao gravar Redis: {e}")
+
+    def _gravar_l1(self, chave: str, valor: Any) -> None:
+        with self._lock:
+            self._l1[chave] = (time.time() + self.ttl_l1_segundos, valor)
+            self._l1.move_to_end(chave)
+            while len(self._l1) > self.max_itens_l1:
+                self._l1.popitem(last=False)
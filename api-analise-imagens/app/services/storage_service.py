@@ -1,24 +1,135 @@
 from minio import Minio
 from minio.error import S3Error
+from collections import OrderedDict
 import base64
+import hashlib
+import os
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
+from typing import BinaryIO
 from app.config import settings
+from app.core.logging import logger
+from app.core.metrics import incrementar
+from app.services.image_formats import detectar_formato
+from app.services.storage_urls import referencia_objeto, url_assinada
 import io
 
-class StorageService:
-    """Serviço de armazenamento de imagens (MinIO/S3)."""
+# Tamanho das partes do multipart upload quando o tamanho do stream é desconhecido
+PART_SIZE_STREAM = 10 * 1024 * 1024
 
-    def __init__(self):
-        self.client = Minio(
+# Buckets usados pela aplicação — verificados/criados na inicialização do processo
+BUCKETS_APLICACAO = ("plantas", "auditorias-pdv")
+
+_cliente: Minio | None = None
+_cliente_pid: int | None = None
+_buckets_conhecidos: set[str] = set()
+_buckets_lock = threading.Lock()
+
+# Objetos endereçados por conteúdo já vistos no processo — são imutáveis, então o cache não expira
+MAX_OBJETOS_CONHECIDOS = 10000
+CHUNK_HASH = 1024 * 1024
+_objetos_conhecidos: OrderedDict[tuple[str, str], None] = OrderedDict()
+_objetos_lock = threading.Lock()
+
+
+def obter_cliente_minio() -> Minio:
+    """
+    Cliente MinIO compartilhado do processo.
+
+    O cliente mantém um pool urllib3 com keep-alive; reutilizá-lo entre tasks evita
+    handshake TCP a cada imagem. Recriado quando o PID muda (filhos do prefork).
+    """
+    global _cliente, _cliente_pid
+    if _cliente is None or _cliente_pid != os.getpid():
+        _cliente = Minio(
             settings.MINIO_ENDPOINT,
             access_key=settings.MINIO_ACCESS_KEY,
             secret_key=settings.MINIO_SECRET_KEY,
-            secure=settings.MINIO_SECURE
+            secure=settings.MINIO_SECURE,
+            region=settings.MINIO_REGION
         )
+        _cliente_pid = os.getpid()
+        _buckets_conhecidos.clear()
+        _objetos_conhecidos.clear()
+    return _cliente
+
+
+def preparar_storage() -> None:
+    """Verifica/cria os buckets da aplicação na inicialização do processo (API ou worker)."""
+    storage = StorageService()
+    for bucket in BUCKETS_APLICACAO:
+        try:
+            storage.garantir_bucket(bucket)
+        except Exception as e:
+            # Storage fora do ar no boot não impede o processo de subir; a checagem
+            # é refeita sob demanda na primeira gravação
+            logger.warning(f"[Storage] Não foi possível verificar o bucket '{bucket}': {e}")
+
+
+def calcular_sha256_stream(stream: BinaryIO) -> str:
+    """SHA-256 de um stream lido em blocos; o stream volta para o início."""
+    digest = hashlib.sha256()
+    for bloco in iter(lambda: stream.read(CHUNK_HASH), b""):
+        digest.update(bloco)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+def _lembrar_objeto(bucket: str, object_name: str) -> None:
+    with _objetos_lock:
+        _objetos_conhecidos[(bucket, object_name)] = None
+        _objetos_conhecidos.move_to_end((bucket, object_name))
+        if len(_objetos_conhecidos) > MAX_OBJETOS_CONHECIDOS:
+            _objetos_conhecidos.popitem(last=False)
+
+
+@contextmanager
+def _cronometrar(operacao: str, bucket: str, tamanho: int | None = None):
+    inicio = time.time()
+    yield
+    tempo_ms = int((time.time() - inicio) * 1000)
+    incrementar(f"storage.{operacao}.chamadas")
+    incrementar(f"storage.{operacao}.tempo_ms_total", tempo_ms)
+    logger.info(
+        "storage_operacao",
+        extra={"operacao": operacao, "bucket": bucket, "bytes": tamanho, "tempo_ms": tempo_ms}
+    )
 
-    def salvar_imagem(self, bucket: str, loja_id: str | None, nome_arquivo: str, imagem_base64: str = None, imagem_bytes: bytes = None) -> str:
+
+class StorageService:
+    """Serviço de armazenamento de imagens (MinIO/S3)."""
+
+    def __init__(self):
+        self.client = obter_cliente_minio()
+
+    def garantir_bucket(self, bucket: str) -> None:
         """
-        Salva imagem no storage e retorna URL.
+        Garante que o bucket existe, consultando o MinIO apenas na primeira vez
+        por processo — depois disso a existência fica em cache.
+        """
+        if bucket in _buckets_conhecidos:
+            return
+        with _buckets_lock:
+            if bucket in _buckets_conhecidos:
+                return
+            with _cronometrar("bucket_check", bucket):
+                if not self.client.bucket_exists(bucket):
+                    try:
+                        self.client.make_bucket(bucket)
+                    except S3Error as e:
+                        # Outro processo criou o bucket entre o exists e o make
+                        if e.code not in ("BucketAlreadyOwnedByYou", "BucketAlreadyExists"):
+                            raise
+            _buckets_conhecidos.add(bucket)
+
+    def salvar_imagem(self, bucket: str, loja_id: str | None, nome_arquivo: str, imagem_base64: str = None, imagem_bytes: bytes = None, sha256: str | None = None) -> str:
+        """
+        Salva imagem no storage e retorna sua referência.
+
+        Com STORAGE_CONTENT_ADDRESSED a chave vem do SHA-256 do conteúdo e o upload é
+        pulado quando o objeto já existe.
 
         Args:
             bucket: Nome do bucket ('plantas' ou 'analise_fotos')
@@ -26,33 +137,157 @@ class StorageService:
             nome_arquivo: Nome original do arquivo
             imagem_base64: Imagem em base64 (opcional se imagem_bytes for passado)
             imagem_bytes: Bytes da imagem (opcional se imagem_base64 for passado)
+            sha256: Hash já calculado pelo chamador (evita recalcular no modo por conteúdo)
 
         Returns:
-            URL da imagem armazenada
+            Referência s3:// da imagem armazenada
         """
-        # Criar bucket se não existir
-        if not self.client.bucket_exists(bucket):
-            self.client.make_bucket(bucket)
-
-        # Gerar nome único
-        timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-        prefixo = f"{loja_id}/" if loja_id else ""
-        object_name = f"{prefixo}{timestamp}_{nome_arquivo}"
-
         # Decodificar base64 ou usar bytes diretamente
         if imagem_base64:
             imagem_bytes = base64.b64decode(imagem_base64)
         elif not imagem_bytes:
             raise ValueError("Pelo menos um formato de imagem deve ser fornecido (base64 ou bytes)")
 
+        object_name = self.salvar_objeto(bucket, loja_id, nome_arquivo, imagem_bytes, sha256)
+        return self.referencia_objeto(bucket, object_name)
+
+    def salvar_objeto(self, bucket: str, loja_id: str | None, nome_arquivo: str, imagem_bytes: bytes, sha256: str | None = None, object_name: str | None = None) -> str:
+        """
+        Mesmo que salvar_imagem, retornando a chave do objeto (usada para gerar derivados).
+
+        Fora do modo por conteúdo, `object_name` fixa a chave em vez do timestamp — uma task
+        que regrava a mesma imagem a cada retry sobrescreve o objeto em vez de criar outro.
+        """
+        # Criar bucket se não existir (checagem em cache por processo)
+        self.garantir_bucket(bucket)
+
+        if settings.STORAGE_CONTENT_ADDRESSED:
+            object_name = self.gerar_object_name_conteudo(sha256 or hashlib.sha256(imagem_bytes).hexdigest())
+            if self.objeto_existe(bucket, object_name):
+                incrementar("storage.dedup.reutilizados")
+                incrementar("storage.dedup.bytes_evitados", len(imagem_bytes))
+                return object_name
+        else:
+            object_name = object_name or self.gerar_object_name(loja_id, nome_arquivo)
+
         # Upload
-        self.client.put_object(
-            bucket,
-            object_name,
-            data=io.BytesIO(imagem_bytes),
-            length=len(imagem_bytes),
-            content_type="image/jpeg"
-        )
+        with _cronometrar("put_object", bucket, len(imagem_bytes)):
+            self.client.put_object(
+                bucket,
+                object_name,
+                data=io.BytesIO(imagem_bytes),
+                length=len(imagem_bytes),
+                content_type=detectar_formato(imagem_bytes) or "image/jpeg"
+            )
+        if settings.STORAGE_CONTENT_ADDRESSED:
+            _lembrar_objeto(bucket, object_name)
+        return object_name
+
+    def salvar_bytes(self, bucket: str, object_name: str, dados: bytes, content_type: str = "image/jpeg") -> None:
+        """Grava bytes sob uma chave já definida pelo chamador (ex.: derivados)."""
+        self.garantir_bucket(bucket)
+        with _cronometrar("put_object", bucket, len(dados)):
+            self.client.put_object(
+                bucket,
+                object_name,
+                data=io.BytesIO(dados),
+                length=len(dados),
+                content_type=content_type
+            )
+
+    def salvar_stream(self, bucket: str, object_name: str, stream: BinaryIO, tamanho: int = -1, content_type: str = "image/jpeg") -> str:
+        """
+        Envia um stream para o storage sem carregá-lo inteiro em memória.
+
+        Args:
+            bucket: Nome do bucket
+            object_name: Chave do objeto (ver gerar_object_name)
+            stream: Arquivo/stream binário posicionado no início
+            tamanho: Tamanho em bytes, ou -1 se desconhecido (multipart em partes de 10 MB)
+            content_type: MIME type gravado no objeto
+
+        Returns:
+            Referência s3:// da imagem armazenada
+        """
+        self.garantir_bucket(bucket)
+
+        with _cronometrar("put_stream", bucket, tamanho if tamanho >= 0 else None):
+            self.client.put_object(
+                bucket,
+                object_name,
+                data=stream,
+                length=tamanho,
+                part_size=PART_SIZE_STREAM if tamanho < 0 else 0,
+                content_type=content_type
+            )
+        return self.referencia_objeto(bucket, object_name)
+
+    def salvar_stream_por_conteudo(self, bucket: str, stream: BinaryIO, tamanho: int = -1, content_type: str = "image/jpeg", sha256: str | None = None) -> tuple[str, str, str]:
+        """
+        Grava um stream sob a chave do seu SHA-256, pulando o upload se o objeto já existe.
+
+        O stream precisa ser seekable (arquivo temporário/UploadFile): é lido uma vez para
+        o hash e de novo para o upload.
+
+        Returns:
+            (object_name, referência s3://, sha256)
+        """
+        self.garantir_bucket(bucket)
+        sha256 = sha256 or calcular_sha256_stream(stream)
+        object_name = self.gerar_object_name_conteudo(sha256)
+
+        if self.objeto_existe(bucket, object_name):
+            incrementar("storage.dedup.reutilizados")
+            if tamanho > 0:
+                incrementar("storage.dedup.bytes_evitados", tamanho)
+            return object_name, self.referencia_objeto(bucket, object_name), sha256
+
+        referencia = self.salvar_stream(bucket, object_name, stream, tamanho, content_type)
+        _lembrar_objeto(bucket, object_name)
+        return object_name, referencia, sha256
+
+    def objeto_existe(self, bucket: str, object_name: str) -> bool:
+        """Verifica (stat) se o objeto existe; positivos ficam em cache no processo."""
+        if (bucket, object_name) in _objetos_conhecidos:
+            return True
+        try:
+            with _cronometrar("stat_object", bucket):
+                self.client.stat_object(bucket, object_name)
+        except S3Error as e:
+            if e.code in ("NoSuchKey", "NoSuchObject", "ResourceNotFound"):
+                return False
+            raise
+        _lembrar_objeto(bucket, object_name)
+        return True
+
+    def obter_bytes(self, bucket: str, object_name: str) -> bytes:
+        """Baixa o conteúdo de um objeto do storage."""
+        with _cronometrar("get_object", bucket):
+            response = self.client.get_object(bucket, object_name)
+            try:
+                return response.read()
+            finally:
+                response.close()
+                response.release_conn()
+
+    @staticmethod
+    def gerar_object_name(loja_id: str | None, nome_arquivo: str) -> str:
+        """Gera a chave do objeto: {loja_id}/{timestamp}_{nome_arquivo}."""
+        timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+        prefixo = f"{loja_id}/" if loja_id else ""
+        return f"{prefixo}{timestamp}_{nome_arquivo}"
+
+    @staticmethod
+    def gerar_object_name_conteudo(sha256: str) -> str:
+        """Chave endereçada por conteúdo: sha256/{h[:2]}/{h[2:4]}/{h} (prefixos espalham a listagem)."""
+        return f"sha256/{sha256[:2]}/{sha256[2:4]}/{sha256}"
+
+    @staticmethod
+    def url_assinada(bucket: str, object_name: str, expiracao_segundos: int | None = None) -> str:
+        """URL GET pré-assinada para o host público (ver storage_urls)."""
+        return url_assinada(bucket, object_name, expiracao_segundos)
 
-        # Retornar URL
-        return f"http://{settings.MINIO_ENDPOINT}/{bucket}/{object_name}"
+    @staticmethod
+    def referencia_objeto(bucket: str, object_name: str) -> str:
+        """Referência s3://bucket/chave gravada no banco; convertida com storage_urls.url_publica."""
+        return referencia_objeto(bucket, object_name)
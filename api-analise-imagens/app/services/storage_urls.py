@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta, timezone
+from urllib.parse import quote
+from minio import Minio
+from app.config import settings
+
+# Referência estável gravada no banco/cache; a URL entregue ao cliente é gerada na leitura
+PREFIXO_REFERENCIA = "s3://"
+
+_cliente_assinatura: Minio | None = None
+
+
+def referencia_objeto(bucket: str, object_name: str) -> str:
+    """Referência interna do objeto: s3://{bucket}/{object_name}."""
+    return f"{PREFIXO_REFERENCIA}{bucket}/{object_name}"
+
+
+def separar_referencia(valor: str | None) -> tuple[str, str] | None:
+    """
+    Extrai (bucket, object_name) de uma referência s3:// ou de uma URL legada
+    http://{MINIO_ENDPOINT}/... gravada antes das URLs assinadas.
+
+    Retorna None para URLs externas (ex.: imagem de origem de uma auditoria ainda em processamento).
+    """
+    if not valor:
+        return None
+    for prefixo in (PREFIXO_REFERENCIA, f"http://{settings.MINIO_ENDPOINT}/", f"https://{settings.MINIO_ENDPOINT}/"):
+        if valor.startswith(prefixo):
+            bucket, _, object_name = valor[len(prefixo):].partition("/")
+            return (bucket, object_name) if object_name else None
+    return None
+
+
+def _obter_cliente_assinatura() -> Minio:
+    """
+    Cliente usado só para assinar URLs com o host público do storage.
+
+    A assinatura SigV4 inclui o host: assinar com o endpoint interno (minio:9000) gera
+    URLs que o cliente não alcança. Com a região fixa, nenhuma chamada de rede é feita,
+    então um único cliente por processo basta (sem pool a proteger no fork).
+    """
+    global _cliente_assinatura
+    if _cliente_assinatura is None:
+        _cliente_assinatura = Minio(
+            settings.MINIO_PUBLIC_ENDPOINT or settings.MINIO_ENDPOINT,
+            access_key=settings.MINIO_ACCESS_KEY,
+            secret_key=settings.MINIO_SECRET_KEY,
+            secure=settings.MINIO_PUBLIC_SECURE if settings.MINIO_PUBLIC_ENDPOINT else settings.MINIO_SECURE,
+            region=settings.MINIO_REGION
+        )
+    return _cliente_assinatura
+
+
+def url_assinada(bucket: str, object_name: str, expiracao_segundos: int | None = None) -> str:
+    """
+    URL GET pré-assinada com Cache-Control na resposta.
+
+    A data de assinatura é arredondada para a janela STORAGE_URL_JANELA_SEGUNDOS: dentro
+    dela a URL é idêntica entre requisições e o cache do navegador/CDN é aproveitado.
+    A validade é estendida pela janela para que a URL nunca seja entregue já perto de expirar.
+    """
+    janela = settings.STORAGE_URL_JANELA_SEGUNDOS
+    agora = datetime.now(timezone.utc)
+    inicio_janela = datetime.fromtimestamp(int(agora.timestamp()) // janela * janela, timezone.utc)
+    expiracao = (expiracao_segundos or settings.STORAGE_URL_EXPIRACAO_SEGUNDOS) + janela
+    return _obter_cliente_assinatura().presigned_get_object(
+        bucket,
+        object_name,
+        expires=timedelta(seconds=min(expiracao, 7 * 24 * 3600)),  # Limite do SigV4
+        response_headers={"response-cache-control": settings.STORAGE_URL_CACHE_CONTROL},
+        request_date=inicio_janela
+    )
+
+
+def url_publica(valor: str | None) -> str | None:
+    """
+    Converte uma referência armazenada na URL que o cliente deve usar.
+
+    - Com STORAGE_PUBLIC_BASE_URL (CDN na frente do bucket): {base}/{bucket}/{chave}
+    - Sem CDN: URL pré-assinada contra MINIO_PUBLIC_ENDPOINT
+    - URLs externas são devolvidas como estão
+    """
+    partes = separar_referencia(valor)
+    if partes is None:
+        return valor
+    bucket, object_name = partes
+    if settings.STORAGE_PUBLIC_BASE_URL:
+        return f"{settings.STORAGE_PUBLIC_BASE_URL.rstrip('/')}/{bucket}/{quote(object_name)}"
+    return url_assinada(bucket, object_name)
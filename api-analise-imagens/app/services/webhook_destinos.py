@@ -0,0 +1,75 @@
+"""
+Política de destinos de webhook (callback_url).
+
+O worker de webhooks está na mesma rede que Redis, MinIO e Flower: sem esta checagem,
+qualquer API Key poderia fazê-lo enviar POSTs a serviços internos ou ao endpoint de
+metadados da nuvem (SSRF cego). Na submissão, sem rede, a URL é recusada quando não há
+WEBHOOK_SECRET para assinar as entregas ou quando o host é localhost/IP interno literal.
+Na entrega o host é resolvido e todos os endereços precisam ser públicos. Hosts em
+WEBHOOK_HOSTS_PERMITIDOS dispensam a checagem de endereço (receptor na rede interna).
+
+Módulo sem dependências pesadas: é importado também pelo processo da API.
+"""
+import ipaddress
+import socket
+from urllib.parse import urlsplit
+from app.config import settings
+
+
+class DestinoWebhookInvalido(ValueError):
+    """callback_url que nunca deve receber entregas (sem assinatura ou endereço interno)."""
+
+
+def _endereco_publico(endereco: str) -> bool:
+    ip = ipaddress.ip_address(endereco)
+    if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+def _host(callback_url: str) -> str:
+    host = urlsplit(callback_url).hostname
+    if not host:
+        raise DestinoWebhookInvalido("callback_url sem host")
+    return host.rstrip(".")
+
+
+def _permitido(host: str) -> bool:
+    return host in settings.WEBHOOK_HOSTS_PERMITIDOS
+
+
+def validar_callback_url(callback_url: str) -> None:
+    """Checagens sem rede, feitas na submissão (e repetidas na entrega)."""
+    if not settings.WEBHOOK_SECRET:
+        raise DestinoWebhookInvalido(
+            "callback_url indisponível: WEBHOOK_SECRET não configurado para assinar os webhooks"
+        )
+    host = _host(callback_url)
+    if _permitido(host):
+        return
+    if host == "localhost" or host.endswith(".localhost"):
+        raise DestinoWebhookInvalido(f"callback_url aponta para endereço interno ({host})")
+    try:
+        publico = _endereco_publico(host)
+    except ValueError:
+        return  # Nome DNS: resolvido na entrega
+    if not publico:
+        raise DestinoWebhookInvalido(f"callback_url aponta para endereço interno ({host})")
+
+
+def validar_destino(callback_url: str) -> None:
+    """
+    Checagem na entrega: resolve o host e exige que todos os endereços sejam públicos.
+
+    Raises:
+        DestinoWebhookInvalido: destino proibido — descartar, repetir não muda nada.
+        socket.gaierror: falha de DNS, possivelmente transitória.
+    """
+    validar_callback_url(callback_url)
+    host = _host(callback_url)
+    if _permitido(host):
+        return
+    enderecos = {info[4][0] for info in socket.getaddrinfo(host, None, proto=socket.IPPROTO_TCP)}
+    internos = sorted(e for e in enderecos if not _endereco_publico(e))
+    if internos:
+        raise DestinoWebhookInvalido(f"{host} resolve para endereço interno ({', '.join(internos)})")
@@ -0,0 +1,197 @@
+"""
+Webhooks de conclusão de processamentos (callback_url informado na submissão).
+
+Os workers de análise não fazem HTTP para o cliente: ao concluir, empilham o evento
+na fila Redis do destino e agendam uma entrega na fila Celery 'webhooks'. A entrega
+espera WEBHOOK_JANELA_SEGUNDOS e envia de uma vez todos os eventos acumulados para
+aquele destino — um lote de 1000 fotos vira algumas dezenas de POSTs, não 1000.
+
+Cada POST leva {"eventos": [...]} assinado com HMAC-SHA256 de "{timestamp}.{corpo}"
+(headers X-Webhook-Timestamp e X-Webhook-Signature: sha256=<hex>). Destinos sem
+assinatura possível ou em endereço interno são descartados (ver webhook_destinos).
+"""
+import hashlib
+import hmac
+import json
+import os
+import socket
+import time
+from datetime import datetime
+import httpx
+from app.config import settings
+from app.core.celery_app import celery_app
+from app.core.logging import logger
+from app.core.metrics import incrementar
+from app.core.redis_client import obter_redis
+from app.services.image_derivatives import url_derivado
+from app.services.webhook_destinos import DestinoWebhookInvalido, validar_destino
+from app.services.storage_urls import url_publica
+
+TASK_ENTREGAR_WEBHOOKS = "shared.entregar_webhooks"
+TTL_FILA_SEGUNDOS = 24 * 3600
+
+_cliente: httpx.Client | None = None
+_cliente_pid: int | None = None
+
+
+class EntregaWebhookError(Exception):
+    """Destino fora do ar, timeout ou resposta que justifica nova tentativa (5xx, 408, 429)."""
+
+
+def _obter_cliente() -> httpx.Client:
+    """Cliente HTTP do processo, com keep-alive por destino. Recriado quando o PID muda."""
+    global _cliente, _cliente_pid
+    if _cliente is None or _cliente_pid != os.getpid():
+        _cliente = httpx.Client(
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=60),
+            timeout=httpx.Timeout(settings.WEBHOOK_TIMEOUT_SEGUNDOS, connect=5.0),
+            follow_redirects=False,
+            headers={"User-Agent": "api-analise-imagens-webhooks/1.0"},
+        )
+        _cliente_pid = os.getpid()
+    return _cliente
+
+
+def _id_destino(callback_url: str) -> str:
+    return hashlib.sha256(callback_url.encode()).hexdigest()[:16]
+
+
+def _chave_fila(callback_url: str) -> str:
+    return f"webhooks:fila:{_id_destino(callback_url)}"
+
+
+def _chave_agendado(callback_url: str) -> str:
+    return f"webhooks:agendado:{_id_destino(callback_url)}"
+
+
+def montar_evento(processamento) -> dict:
+    """Payload de um processamento em estado final."""
+    resultado = processamento.resultado or {}
+    return {
+        "processamento_id": str(processamento.id),
+        "tipo": processamento.tipo.value,
+        "status": processamento.status.value,
+        "loja_id": processamento.loja_id,
+        "lote_id": str(processamento.lote_id) if processamento.lote_id else None,
+        "resultado": resultado.get("auditoria") or resultado.get("plantas"),
+        "erro_mensagem": processamento.erro_mensagem,
+        "imagem_url": url_publica(processamento.imagem_url),
+        "thumb_url": url_derivado(processamento.meta_dados),
+        "concluido_em": datetime.utcnow().isoformat(),
+    }
+
+
+def agendar_webhook(processamento) -> None:
+    """
+    Enfileira o evento de conclusão se o processamento tiver callback_url.
+
+    Chamar após o commit do estado final. Só a primeira chamada dentro da janela agenda
+    uma task de entrega; as seguintes apenas acumulam no lote do destino.
+    """
+    callback_url = (processamento.meta_dados or {}).get("callback_url")
+    if not callback_url:
+        return
+
+    evento = montar_evento(processamento)
+    try:
+        try:
+            pipe = obter_redis().pipeline()
+            pipe.rpush(_chave_fila(callback_url), json.dumps(evento, ensure_ascii=False))
+            pipe.expire(_chave_fila(callback_url), TTL_FILA_SEGUNDOS)
+            # A marca expira sozinha caso a task agendada se perca
+            pipe.set(_chave_agendado(callback_url), 1, nx=True, ex=settings.WEBHOOK_JANELA_SEGUNDOS * 10)
+            _, _, agendar = pipe.execute()
+        except Exception as e:
+            # Sem a fila do destino não há lote: o evento segue sozinho, com os mesmos retries
+            logger.warning(f"[Webhooks] Falha ao acumular evento de {evento['processamento_id']}: {e}")
+            celery_app.send_task(TASK_ENTREGAR_WEBHOOKS, args=[callback_url, [evento]], queue="webhooks", ignore_result=True)
+            return
+
+        if agendar:
+            celery_app.send_task(
+                TASK_ENTREGAR_WEBHOOKS,
+                args=[callback_url],
+                queue="webhooks",
+                countdown=settings.WEBHOOK_JANELA_SEGUNDOS,
+                ignore_result=True
+            )
+    except Exception as e:
+        # O processamento já está gravado: falha no webhook não pode reprocessá-lo
+        logger.error(f"[Webhooks] Falha ao agendar entrega de {evento['processamento_id']}: {e}")
+        incrementar("webhooks.falhas_agendamento")
+
+
+def retirar_lote(callback_url: str) -> tuple[list[dict], bool]:
+    """
+    Retira até WEBHOOK_MAX_EVENTOS_LOTE eventos da fila do destino.
+
+    A marca de agendamento é liberada antes da leitura: eventos que chegarem depois
+    agendam a próxima entrega. Returns: (eventos, ainda há eventos na fila)
+    """
+    redis_client = obter_redis()
+    redis_client.delete(_chave_agendado(callback_url))
+    pipe = redis_client.pipeline()
+    pipe.lpop(_chave_fila(callback_url), settings.WEBHOOK_MAX_EVENTOS_LOTE)
+    pipe.llen(_chave_fila(callback_url))
+    brutos, restantes = pipe.execute()
+    return [json.loads(b) for b in brutos or []], restantes > 0
+
+
+def assinar(corpo: bytes, timestamp: int) -> str:
+    return hmac.new(settings.WEBHOOK_SECRET.encode(), f"{timestamp}.".encode() + corpo, hashlib.sha256).hexdigest()
+
+
+def entregar(callback_url: str, eventos: list[dict]) -> None:
+    """
+    POST de um lote de eventos no destino.
+
+    Raises:
+        EntregaWebhookError: falha que deve ser tentada de novo (rede, 5xx, 408, 429).
+        Outras respostas 4xx e destinos proibidos (sem WEBHOOK_SECRET, endereço interno)
+        são descartados: repetir o mesmo corpo não vai mudar o resultado.
+    """
+    try:
+        validar_destino(callback_url)
+    except DestinoWebhookInvalido as e:
+        incrementar("webhooks.bloqueados", len(eventos))
+        logger.warning(f"[Webhooks] Destino {_id_destino(callback_url)} recusado ({e}); {len(eventos)} evento(s) descartado(s)")
+        return
+    except socket.gaierror as e:
+        incrementar("webhooks.falhas")
+        raise EntregaWebhookError(f"DNS: {e}") from e
+
+    corpo = json.dumps({"eventos": eventos}, ensure_ascii=False).encode()
+    timestamp = int(time.time())
+    headers = {
+        "Content-Type": "application/json",
+        "X-Webhook-Timestamp": str(timestamp),
+        "X-Webhook-Signature": f"sha256={assinar(corpo, timestamp)}",
+    }
+
+    inicio = time.time()
+    try:
+        resposta = _obter_cliente().post(callback_url, content=corpo, headers=headers)
+    except httpx.HTTPError as e:
+        incrementar("webhooks.falhas")
+        raise EntregaWebhookError(f"{type(e).__name__}: {e}") from e
+
+    if resposta.status_code >= 500 or resposta.status_code in (408, 429):
+        incrementar("webhooks.falhas")
+        raise EntregaWebhookError(f"HTTP {resposta.status_code}")
+    if resposta.status_code >= 400:
+        incrementar("webhooks.descartados")
+        logger.warning(
+            f"[Webhooks] {callback_url} recusou {len(eventos)} evento(s) com HTTP {resposta.status_code}; descartados"
+        )
+        return
+
+    incrementar("webhooks.entregues", len(eventos))
+    logger.info(
+        "webhook_entregue",
+        extra={
+            "destino": _id_destino(callback_url),
+            "eventos": len(eventos),
+            "status_code": resposta.status_code,
+            "tempo_ms": int((time.time() - inicio) * 1000),
+        }
+    )
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Verifica o orçamento de imports do processo da API.
+
+Importa `app.main` em um interpretador limpo e falha (exit 1) se algum pacote
+pesado de OCR/LLM tiver sido carregado — esses pacotes pertencem apenas aos
+workers Celery. Também reporta o tempo de import e o RSS do processo.
+
+Uso:
+    python3 scripts/check_import_budget.py
+    python3 scripts/check_import_budget.py --max-segundos 3
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+PACOTES_PROIBIDOS = [
+    "torch",
+    "easyocr",
+    "cv2",
+    "openai",
+    "anthropic",
+    "google.generativeai",
+]
+
+SONDA = """
+import json, sys, time
+inicio = time.perf_counter()
+import app.main
+duracao = time.perf_counter() - inicio
+try:
+    with open("/proc/self/status") as f:
+        rss_kb = next(int(l.split()[1]) for l in f if l.startswith("VmRSS:"))
+except (OSError, StopIteration):
+    rss_kb = 0
+print(json.dumps({"segundos": duracao, "rss_kb": rss_kb, "modulos": sorted(sys.modules)}))
+"""
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Orçamento de imports do processo da API")
+    parser.add_argument("--max-segundos", type=float, default=None, help="Falha se o import passar deste tempo")
+    args = parser.parse_args()
+
+    raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {**os.environ, "API_KEY": os.environ.get("API_KEY", "import-budget")}
+    proc = subprocess.run(
+        [sys.executable, "-c", SONDA],
+        cwd=raiz, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        print(proc.stderr, file=sys.stderr)
+        sys.exit(proc.returncode)
+
+    dados = json.loads(proc.stdout.strip().splitlines()[-1])
+    modulos = set(dados["modulos"])
+    violacoes = [
+        p for p in PACOTES_PROIBIDOS
+        if p in modulos or any(m.startswith(p + ".") for m in modulos)
+    ]
+
+    print(f"  import app.main : {dados['segundos']:.2f}s")
+    print(f"  RSS             : {dados['rss_kb'] / 1024:.0f} MB")
+    print(f"  módulos         : {len(modulos)}")
+
+    falhou = False
+    if violacoes:
+        print(f"  FALHA: pacotes pesados carregados pela API: {', '.join(violacoes)}")
+        falhou = True
+    if args.max_segundos is not None and dados["segundos"] > args.max_segundos:
+        print(f"  FALHA: import levou mais que {args.max_segundos:.2f}s")
+        falhou = True
+
+    if falhou:
+        sys.exit(1)
+    print("  OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,22 +7,24 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 from app.core.database import SessionLocal
 from app.models.api_key import APIKey
 
-def generate_key(nome: str, cliente_id: str = None):
+def generate_key(nome: str, cliente_id: str = None, rate_limit: int = 60):
     db = SessionLocal()
     nova_key = secrets.token_hex(32)
     api_key_record = APIKey(
         key=nova_key,
         nome=nome,
-        cliente_id=cliente_id
+        cliente_id=cliente_id,
+        rate_limit=rate_limit
     )
     db.add(api_key_record)
     db.commit()
-    print(f"Nova API Key gerada para {nome}: {nova_key}")
+    print(f"Nova API Key gerada para {nome} ({rate_limit} req/min): {nova_key}")
     db.close()
 
 if __name__ == "__main__":
     if len(sys.argv) > 1:
         nome = sys.argv[1]
-        generate_key(nome)
+        rate_limit = int(sys.argv[2]) if len(sys.argv) > 2 else 60
+        generate_key(nome, rate_limit=rate_limit)
     else:
-        print("Uso: python generate_api_key.py <nome_do_cliente>")
+        print("Uso: python generate_api_key.py <nome_do_cliente> [requisicoes_por_minuto]")
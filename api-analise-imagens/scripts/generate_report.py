@@ -44,6 +44,8 @@ def nota_color(nota):
 def build_card(i: int, entry: dict) -> str:
     url = entry["url"]
     nome = url.split("/")[-1]
+    # Thumbnail pré-assinado quando disponível; o original fica no link da imagem
+    img_src = entry.get("thumb_url") or url
     res = entry.get("resultado", {})
 
     if "_erro" in res:
@@ -63,7 +65,7 @@ def build_card(i: int, entry: dict) -> str:
   </div>
   <div class="card-body erro-body">
     <div class="thumb-col">
-      <img src="{url}" alt="{nome}" loading="lazy" onerror="this.style.display='none'">
+      <a href="{url}" target="_blank"><img src="{img_src}" alt="{nome}" loading="lazy" onerror="this.style.display='none'"></a>
     </div>
     <div class="info-col">
       <p class="erro-msg">{detalhe}</p>
@@ -104,7 +106,7 @@ def build_card(i: int, entry: dict) -> str:
   </div>
   <div class="card-body">
     <div class="thumb-col">
-      <img src="{url}" alt="{nome}" loading="lazy" onerror="this.style.display='none'">
+      <a href="{url}" target="_blank"><img src="{img_src}" alt="{nome}" loading="lazy" onerror="this.style.display='none'"></a>
     </div>
     <div class="info-col">
       <div class="nota-row">
@@ -189,6 +191,7 @@ def build_html(dados: list, gerado_em: str) -> str:
 
   .card-body {{ display: flex; gap: 0; }}
   .thumb-col {{ width: 220px; min-width: 220px; background: #0f172a; display: flex; align-items: center; justify-content: center; overflow: hidden; }}
+  .thumb-col a {{ display: block; width: 100%; }}
   .thumb-col img {{ width: 100%; height: 180px; object-fit: cover; display: block; }}
   .info-col {{ flex: 1; padding: 16px 20px; display: flex; flex-direction: column; gap: 10px; }}
 
@@ -13,6 +13,7 @@ import argparse
 import json
 import sys
 import time
+import urllib.parse
 import urllib.request
 import urllib.error
 from datetime import datetime
@@ -79,10 +80,24 @@ def submeter(base_url: str, api_key: str, imagem_url: str) -> str | None:
     return None
 
 
-def consultar(base_url: str, api_key: str, proc_id: str) -> dict | None:
+def submeter_lote(base_url: str, api_key: str, urls: list[str]) -> tuple[str | None, list[str | None]]:
+    """Submete todas as URLs em uma única requisição. Retorna (lote_id, ids na ordem das URLs)."""
+    status, resp = _request(
+        "POST",
+        f"{base_url}/api/v1/analise-fotos/auditar-pdv/lote",
+        {"X-API-Key": api_key, "Content-Type": "application/json"},
+        json.dumps({"itens": [{"imagem_url": u} for u in urls]}).encode(),
+    )
+    if status == 202:
+        return resp.get("lote_id"), [item.get("processamento_id") for item in resp.get("itens", [])]
+    print(f"    Erro ao submeter lote ({status}): {resp}")
+    return None, [None] * len(urls)
+
+
+def consultar(base_url: str, api_key: str, proc_id: str, wait: int = 0) -> dict | None:
     status, resp = _request(
         "GET",
-        f"{base_url}/api/v1/analise-fotos/auditorias/{proc_id}",
+        f"{base_url}/api/v1/analise-fotos/auditorias/{proc_id}?wait={wait}",
         {"X-API-Key": api_key},
     )
     if status == 200:
@@ -96,7 +111,9 @@ def aguardar_resultado(
 ) -> dict | None:
     inicio = time.time()
     while time.time() - inicio < timeout:
-        resp = consultar(base_url, api_key, proc_id)
+        # Long-poll: a API segura a requisição até a auditoria concluir (ou 25s)
+        espera = max(1, min(25, int(timeout - (time.time() - inicio))))
+        resp = consultar(base_url, api_key, proc_id, wait=espera)
         if resp is None:
             time.sleep(intervalo)
             continue
@@ -113,12 +130,54 @@ def aguardar_resultado(
                 return resultado.get("auditoria") if resultado else None
             if status_proc in ("erro", "falhou"):
                 return {"_erro": resp.get("erro_mensagem", "Erro desconhecido")}
-            # ainda processando — aguarda
-        time.sleep(intervalo)
+            # ainda processando após o wait — consulta de novo
 
     return {"_erro": f"Timeout após {timeout}s"}
 
 
+def aguardar_lote(
+    base_url: str, api_key: str, lote_id: str,
+    timeout: int = 600, intervalo: int = 3,
+) -> dict[str, dict]:
+    """
+    Acompanha o lote inteiro por /lotes/{lote_id}: cada consulta traz só os itens
+    alterados desde o cursor anterior. Retorna {processamento_id: resultado}.
+    """
+    resultados: dict[str, dict] = {}
+    cursor = None
+    inicio = time.time()
+    while time.time() - inicio < timeout:
+        url = f"{base_url}/api/v1/analise-fotos/lotes/{lote_id}?incluir_resultado=true"
+        if cursor:
+            url += f"&cursor={urllib.parse.quote(cursor)}"
+        status, resp = _request("GET", url, {"X-API-Key": api_key})
+        if status != 200:
+            time.sleep(intervalo)
+            continue
+
+        cursor = resp.get("proximo_cursor") or cursor
+        for item in resp.get("itens", []):
+            # Itens podem se repetir entre consultas: o último estado vence
+            if item["status"] == "concluido":
+                resultados[item["processamento_id"]] = {**(item.get("resultado") or {}), "thumb_url": item.get("thumb_url")}
+            elif item["status"] == "erro":
+                resultados[item["processamento_id"]] = {"_erro": item.get("erro_mensagem") or "Erro desconhecido"}
+
+        contagem = resp.get("contagem", {})
+        sys.stdout.write(
+            f"\r    {contagem.get('concluido', 0)} concluídas, {contagem.get('erro', 0)} com erro, "
+            f"{contagem.get('processando', 0)} processando   "
+        )
+        sys.stdout.flush()
+        if resp.get("finalizado") and len(resultados) >= resp.get("total", 0):
+            print()
+            return resultados
+        time.sleep(intervalo)
+
+    print()
+    return resultados
+
+
 # ---------------------------------------------------------------------------
 # Formatação do resultado
 # ---------------------------------------------------------------------------
@@ -237,6 +296,7 @@ def main() -> None:
     parser.add_argument("--base-url", default="http://localhost:8000")
     parser.add_argument("--timeout", type=int, default=120, help="Timeout por imagem em segundos")
     parser.add_argument("--output", default=None, help="Salvar resultados em JSON")
+    parser.add_argument("--individual", action="store_true", help="Submeter uma foto por requisição (sem lote)")
     args = parser.parse_args()
 
     print(f"\n{'=' * 70}")
@@ -245,24 +305,39 @@ def main() -> None:
     print(f"  Fotos: {len(URLS)}")
     print(f"{'=' * 70}")
 
-    # Fase 1 — submeter todas as URLs
+    # Fase 1 — submeter todas as URLs (uma requisição de lote, ou uma por foto)
     print("\n  Submetendo imagens...")
     jobs: list[tuple[str, str | None]] = []
-    for url in URLS:
-        nome = url.split("/")[-1]
-        sys.stdout.write(f"    → {nome:<45} ")
-        sys.stdout.flush()
-        proc_id = submeter(args.base_url, args.api_key, url)
-        if proc_id:
-            print(f"OK  ({proc_id[:8]}...)")
-            jobs.append((url, proc_id))
-        else:
-            print("FALHOU")
-            jobs.append((url, None))
+    if not args.individual:
+        lote_id, ids = submeter_lote(args.base_url, args.api_key, URLS)
+        print(f"    Lote {lote_id or 'FALHOU'}: {sum(1 for i in ids if i)}/{len(URLS)} aceitas")
+        jobs = list(zip(URLS, ids))
+    else:
+        for url in URLS:
+            nome = url.split("/")[-1]
+            sys.stdout.write(f"    → {nome:<45} ")
+            sys.stdout.flush()
+            proc_id = submeter(args.base_url, args.api_key, url)
+            if proc_id:
+                print(f"OK  ({proc_id[:8]}...)")
+                jobs.append((url, proc_id))
+            else:
+                print("FALHOU")
+                jobs.append((url, None))
 
     # Fase 2 — aguardar e coletar resultados
-    print(f"\n  Aguardando processamento (timeout={args.timeout}s por foto)...")
     resultados_por_url: dict[str, dict] = {}
+    if not args.individual and lote_id:
+        print(f"\n  Aguardando lote (timeout={args.timeout}s)...")
+        por_id = aguardar_lote(args.base_url, args.api_key, lote_id, args.timeout)
+        for url, proc_id in jobs:
+            if proc_id is None:
+                resultados_por_url[url] = {"_erro": "Falha ao submeter"}
+            else:
+                resultados_por_url[url] = por_id.get(proc_id) or {"_erro": f"Timeout após {args.timeout}s"}
+        jobs = []
+    else:
+        print(f"\n  Aguardando processamento (timeout={args.timeout}s por foto)...")
 
     for url, proc_id in jobs:
         nome = url.split("/")[-1]
@@ -297,8 +372,13 @@ def main() -> None:
 
     # Salvar JSON
     if args.output:
+        # thumb_url (pré-assinada) vai para o nível da entrada: o relatório usa o thumbnail
         saida = [
-            {"url": url, "resultado": resultados_por_url.get(url)}
+            {
+                "url": url,
+                "thumb_url": (resultados_por_url.get(url) or {}).pop("thumb_url", None),
+                "resultado": resultados_por_url.get(url),
+            }
             for url in URLS
         ]
         with open(args.output, "w", encoding="utf-8") as f:
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Receptor local de webhooks para testar o callback_url.
+
+Sobe um servidor HTTP que valida a assinatura HMAC (X-Webhook-Signature) e imprime
+cada lote de eventos recebido.
+
+Uso:
+    python scripts/webhook_receiver.py --porta 9009 --secret $WEBHOOK_SECRET
+    python scripts/webhook_receiver.py --falhar 2   # responde 503 às 2 primeiras entregas (testa retry)
+
+Submeta com "callback_url": "http://<host alcançável pelo worker>:9009/webhook". Em rede
+local/privada, inclua o host em WEBHOOK_HOSTS_PERMITIDOS (API e worker-webhooks).
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TOLERANCIA_TIMESTAMP_SEGUNDOS = 300
+
+
+def assinatura_valida(secret: str, corpo: bytes, timestamp: str, assinatura: str) -> bool:
+    esperado = hmac.new(secret.encode(), f"{timestamp}.".encode() + corpo, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(f"sha256={esperado}", assinatura)
+
+
+def criar_handler(secret: str | None, falhar: int):
+    estado = {"requisicoes": 0, "eventos": 0, "ids": set()}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def _responder(self, status: int, corpo: dict) -> None:
+            dados = json.dumps(corpo).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(dados)))
+            self.end_headers()
+            self.wfile.write(dados)
+
+        def do_POST(self):
+            corpo = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            timestamp = self.headers.get("X-Webhook-Timestamp", "")
+
+            if secret:
+                assinatura = self.headers.get("X-Webhook-Signature", "")
+                if not assinatura_valida(secret, corpo, timestamp, assinatura):
+                    print("  ✗ assinatura inválida — recusado (401)")
+                    return self._responder(401, {"erro": "assinatura inválida"})
+                if abs(time.time() - int(timestamp or 0)) > TOLERANCIA_TIMESTAMP_SEGUNDOS:
+                    print("  ✗ timestamp fora da tolerância — recusado (401)")
+                    return self._responder(401, {"erro": "timestamp expirado"})
+
+            with lock:
+                estado["requisicoes"] += 1
+                numero = estado["requisicoes"]
+            if numero <= falhar:
+                print(f"  ~ entrega #{numero}: simulando falha (503)")
+                return self._responder(503, {"erro": "falha simulada"})
+
+            eventos = json.loads(corpo).get("eventos", [])
+            with lock:
+                novos = [e for e in eventos if e["processamento_id"] not in estado["ids"]]
+                estado["ids"].update(e["processamento_id"] for e in eventos)
+                estado["eventos"] += len(eventos)
+            print(f"  ✓ entrega #{numero}: {len(eventos)} evento(s), {len(novos)} novo(s) — total único {len(estado['ids'])}")
+            for evento in eventos:
+                resultado = evento.get("resultado") or {}
+                print(
+                    f"      {evento['processamento_id'][:8]}  {evento['status']:<10} "
+                    f"nota={resultado.get('nota', '-')}  {evento.get('erro_mensagem') or ''}"
+                )
+            self._responder(200, {"recebidos": len(eventos)})
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Receptor local de webhooks")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--porta", type=int, default=9009)
+    parser.add_argument("--secret", default=None, help="WEBHOOK_SECRET; sem ele a assinatura não é validada")
+    parser.add_argument("--falhar", type=int, default=0, help="Responde 503 às N primeiras entregas")
+    args = parser.parse_args()
+
+    servidor = ThreadingHTTPServer((args.host, args.porta), criar_handler(args.secret, args.falhar))
+    print(f"Recebendo webhooks em http://{args.host}:{args.porta}/ (Ctrl+C para sair)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()